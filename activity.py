@@ -0,0 +1,315 @@
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import event, insert
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.util import identity_key
+
+from models import ActivityEvent, Conversation, Ticket
+from app import db
+from event_bus import ALL_CHANNEL, conversation_channel, event_bus, project_channel
+
+logger = logging.getLogger(__name__)
+
+# Events older than this are deleted by the periodic prune job
+ACTIVITY_RETENTION_DAYS = int(os.environ.get("ACTIVITY_RETENTION_DAYS", "90"))
+# Rows deleted per transaction while pruning, so pruning never holds long locks
+ACTIVITY_PRUNE_BATCH = 1000
+
+SUMMARY_LENGTH = 200
+DETAIL_LENGTH = 255
+
+
+def record_activity(kind: str, summary: str, subject_type: str,
+                    subject_id: Optional[int] = None,
+                    project_id: Optional[int] = None,
+                    detail: Optional[str] = None,
+                    actor: Optional[str] = None) -> ActivityEvent:
+    """
+    Append an event to the activity log.
+
+    The event is added to the current session and committed with the
+    change it describes, so the log never records a write that rolled back.
+
+    Args:
+        kind (str): Dotted event name, e.g. "ticket.created"
+        summary (str): One-line description shown in feeds
+        subject_type (str): Kind of object the event is about, e.g. "ticket"
+        subject_id (Optional[int]): ID of that object
+        project_id (Optional[int]): The project the event belongs to, if any
+        detail (Optional[str]): Secondary text shown under the summary
+        actor (Optional[str]): Who made the change: a username, an agent name, or None for the system
+
+    Returns:
+        ActivityEvent: The pending event
+    """
+    event = ActivityEvent(
+        kind=kind,
+        summary=_clip(summary, SUMMARY_LENGTH),
+        subject_type=subject_type,
+        subject_id=subject_id,
+        project_id=project_id,
+        detail=_clip(detail, DETAIL_LENGTH) if detail else None,
+        actor=_clip(actor, 100) if actor else None
+    )
+    db.session.add(event)
+    return event
+
+
+def record_ticket_activity(ticket: Ticket, kind: str, summary: str,
+                           detail: Optional[str] = None,
+                           actor: Optional[str] = None) -> ActivityEvent:
+    """
+    Append an event about a ticket. The ticket must already have an ID.
+
+    Args:
+        ticket (Ticket): The ticket
+        kind (str): Dotted event name, e.g. "ticket.assigned"
+        summary (str): One-line description shown in feeds
+        detail (Optional[str]): Secondary text
+        actor (Optional[str]): Who made the change
+
+    Returns:
+        ActivityEvent: The pending event
+    """
+    return record_activity(kind, summary, "ticket", ticket.id, ticket.project_id, detail, actor)
+
+
+def record_bulk_activity(kind: str, subject_type: str,
+                         subjects: List[Tuple[int, str, Optional[str]]],
+                         project_id: Optional[int],
+                         summary: str,
+                         actor: Optional[str] = None) -> ActivityEvent:
+    """
+    Append one event per subject with a single multi-row insert, plus a summary event.
+
+    The per-subject events stay in each subject's history but are not
+    published one by one. Live subscribers receive only the summary event,
+    about the project, whose kind is the given kind with a "bulk_" prefix,
+    e.g. "ticket.bulk_created", and refetch what they show.
+
+    Args:
+        kind (str): Dotted event name of each subject's event, e.g. "ticket.created"
+        subject_type (str): Kind of object the events are about, e.g. "ticket"
+        subjects (List[Tuple[int, str, Optional[str]]]): (subject ID, summary, detail) per subject
+        project_id (Optional[int]): The project the events belong to
+        summary (str): One-line description of the whole batch
+        actor (Optional[str]): Who made the change
+
+    Returns:
+        ActivityEvent: The pending summary event
+    """
+    if subjects:
+        now = datetime.utcnow()
+        db.session.execute(insert(ActivityEvent), [
+            {
+                'created_at': now,
+                'kind': kind,
+                'summary': _clip(subject_summary, SUMMARY_LENGTH),
+                'subject_type': subject_type,
+                'subject_id': subject_id,
+                'project_id': project_id,
+                'detail': _clip(detail, DETAIL_LENGTH) if detail else None,
+                'actor': _clip(actor, 100) if actor else None
+            }
+            for subject_id, subject_summary, detail in subjects
+        ])
+    bulk_kind = kind.replace(".", ".bulk_", 1)
+    return record_activity(bulk_kind, summary, "project", project_id, project_id,
+                           f"{len(subjects)} {subject_type}s", actor)
+
+
+def get_activity(project_id: Optional[int] = None,
+                 subject_type: Optional[str] = None,
+                 subject_id: Optional[int] = None,
+                 before_id: Optional[int] = None,
+                 after_id: Optional[int] = None,
+                 limit: int = 50) -> List[ActivityEvent]:
+    """
+    Get events newest first, optionally scoped to a project or a subject.
+
+    With after_id the events newer than that one are returned oldest
+    first instead, for replaying what a live subscriber missed.
+
+    Every combination of filters is a single range scan on one of the
+    activity indexes, whatever the size of the log.
+
+    Args:
+        project_id (Optional[int]): Only events for this project
+        subject_type (Optional[str]): Only events about this kind of object
+        subject_id (Optional[int]): Only events about this object (requires subject_type)
+        before_id (Optional[int]): Only events older than this one, for paging
+        after_id (Optional[int]): Only events newer than this one, oldest first
+        limit (int): Maximum number of events
+
+    Returns:
+        List[ActivityEvent]: The events
+    """
+    query = ActivityEvent.query
+    if project_id is not None:
+        query = query.filter(ActivityEvent.project_id == project_id)
+    if subject_type:
+        query = query.filter(ActivityEvent.subject_type == subject_type)
+        if subject_id is not None:
+            query = query.filter(ActivityEvent.subject_id == subject_id)
+    if before_id is not None:
+        query = query.filter(ActivityEvent.id < before_id)
+    if after_id is not None:
+        return query.filter(ActivityEvent.id > after_id).order_by(ActivityEvent.id).limit(limit).all()
+    return query.order_by(ActivityEvent.id.desc()).limit(limit).all()
+
+
+def activity_to_dict(event: ActivityEvent) -> Dict[str, Any]:
+    """
+    Serialize an activity event.
+
+    Args:
+        event (ActivityEvent): The event
+
+    Returns:
+        Dict[str, Any]: The event data
+    """
+    return {
+        'id': event.id,
+        'kind': event.kind,
+        'created_at': event.created_at,
+        'project_id': event.project_id,
+        'subject_type': event.subject_type,
+        'subject_id': event.subject_id,
+        'actor': event.actor,
+        'summary': event.summary,
+        'detail': event.detail
+    }
+
+
+def activity_channels(project_id: Optional[int], subject_type: str,
+                      subject_id: Optional[int]) -> List[str]:
+    """
+    Get the event bus channels an activity event is published to.
+
+    Args:
+        project_id (Optional[int]): The event's project
+        subject_type (str): The event's subject type
+        subject_id (Optional[int]): The event's subject ID
+
+    Returns:
+        List[str]: Channel names
+    """
+    channels = [ALL_CHANNEL]
+    if project_id is not None:
+        channels.append(project_channel(project_id))
+    if subject_type == "conversation" and subject_id is not None:
+        channels.append(conversation_channel(subject_id))
+    return channels
+
+
+def prune_activity(retention_days: int = ACTIVITY_RETENTION_DAYS) -> int:
+    """
+    Delete events older than the retention period, a batch per transaction.
+
+    Args:
+        retention_days (int): Days of history to keep
+
+    Returns:
+        int: Number of events deleted
+    """
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    deleted = 0
+
+    while True:
+        # Events are appended in time order, so old events are a prefix of the id range
+        batch_end = (db.session.query(ActivityEvent.id)
+                     .filter(ActivityEvent.created_at < cutoff)
+                     .order_by(ActivityEvent.id)
+                     .offset(ACTIVITY_PRUNE_BATCH - 1)
+                     .limit(1)
+                     .scalar())
+        if batch_end is None:
+            batch_end = (db.session.query(db.func.max(ActivityEvent.id))
+                         .filter(ActivityEvent.created_at < cutoff)
+                         .scalar())
+        if batch_end is None:
+            break
+
+        count = (ActivityEvent.query
+                 .filter(ActivityEvent.id <= batch_end, ActivityEvent.created_at < cutoff)
+                 .delete(synchronize_session=False))
+        db.session.commit()
+        deleted += count
+        if count < ACTIVITY_PRUNE_BATCH:
+            break
+
+    if deleted:
+        logger.info(f"Pruned {deleted} activity events older than {retention_days} days")
+    return deleted
+
+
+def _clip(text: str, length: int) -> str:
+    return text if len(text) <= length else text[:length - 3] + "..."
+
+
+# Current state of the subject sent along with each live event, so clients
+# can apply the change without refetching. Read from loaded attributes only.
+_SUBJECT_MODELS = {"ticket": Ticket, "conversation": Conversation}
+_SUBJECT_FIELDS = {
+    "ticket": ("id", "title", "status", "priority", "assigned_agent_id", "parent_ticket_id", "updated_at"),
+    "conversation": ("id", "title", "project_id", "updated_at"),
+}
+
+
+def _subject_snapshot(session, subject_type: str, subject_id: Optional[int]) -> Optional[Dict[str, Any]]:
+    """Snapshot a subject from the session's identity map, without emitting SQL."""
+    model = _SUBJECT_MODELS.get(subject_type)
+    if model is None or subject_id is None:
+        return None
+    obj = session.identity_map.get(identity_key(model, subject_id))
+    if obj is None:
+        return None
+    # vars() holds only loaded attributes; reading expired ones would query
+    loaded = vars(obj)
+    snapshot = {}
+    for field in _SUBJECT_FIELDS[subject_type]:
+        if field in loaded:
+            value = loaded[field]
+            snapshot[field] = value.value if hasattr(value, "value") else value
+    return snapshot
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_activity(session, flush_context):
+    """Queue newly flushed events for publishing once the transaction commits."""
+    pending = session.info.setdefault('pending_activity', {})
+    for obj in session.new:
+        if isinstance(obj, ActivityEvent):
+            pending[obj.id] = activity_to_dict(obj)
+    # Later flushes in the same transaction may change the subjects again
+    for payload in pending.values():
+        snapshot = _subject_snapshot(session, payload['subject_type'], payload['subject_id'])
+        if snapshot:
+            payload[payload['subject_type']] = snapshot
+    if not pending:
+        session.info.pop('pending_activity', None)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_activity(session):
+    """Publish committed events to live subscribers."""
+    pending = session.info.pop('pending_activity', None)
+    if not pending:
+        return
+    for event_id in sorted(pending):
+        payload = pending[event_id]
+        try:
+            event_bus.publish(
+                activity_channels(payload['project_id'], payload['subject_type'], payload['subject_id']),
+                payload
+            )
+        except Exception as e:
+            logger.exception(f"Error publishing activity event {event_id}: {str(e)}")
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_activity(session):
+    session.info.pop('pending_activity', None)
@@ -1,23 +1,51 @@
-from agent_system.agents import (
-    CoordinatorAgent,
-    PlannerAgent,
-    ResearcherAgent,
-    DeveloperAgent,
-    TesterAgent,
-    ReviewerAgent
-)
-from agent_system.coordinator import AgentCoordinator
-from agent_system.ollama_client import OllamaClient
-from agent_system.ticket_system import TicketManager
+import importlib
 
-__all__ = [
-    'CoordinatorAgent',
-    'PlannerAgent',
-    'ResearcherAgent',
-    'DeveloperAgent',
-    'TesterAgent',
-    'ReviewerAgent',
-    'AgentCoordinator',
-    'OllamaClient',
-    'TicketManager'
-]
+# Submodules are imported on first access rather than here, so a module such as
+# agent_system.ollama_stub can run without pulling in the app and its models.
+_EXPORTS = {
+    'CoordinatorAgent': 'agent_system.agents',
+    'PlannerAgent': 'agent_system.agents',
+    'ResearcherAgent': 'agent_system.agents',
+    'DeveloperAgent': 'agent_system.agents',
+    'TesterAgent': 'agent_system.agents',
+    'ReviewerAgent': 'agent_system.agents',
+    'AgentCoordinator': 'agent_system.coordinator',
+    'analysis_queue': 'agent_system.coordinator',
+    'OllamaClient': 'agent_system.ollama_client',
+    'BackendPool': 'agent_system.ollama_client',
+    'backend_pool': 'agent_system.ollama_client',
+    'AgentRegistry': 'agent_system.registry',
+    'agent_registry': 'agent_system.registry',
+    'ConversationContextStore': 'agent_system.conversation_store',
+    'conversation_context_store': 'agent_system.conversation_store',
+    'TicketManager': 'agent_system.ticket_system',
+    'JobQueue': 'agent_system.jobs',
+    'job_queue': 'agent_system.jobs',
+    'job_handler': 'agent_system.jobs',
+    'GenerationScheduler': 'agent_system.scheduler',
+    'generation_scheduler': 'agent_system.scheduler',
+    'generation_priority': 'agent_system.scheduler',
+    'schedule_activity_prune': 'agent_system.maintenance',
+    'ImagePayloadCache': 'agent_system.images',
+    'vision_image_cache': 'agent_system.images',
+    'encode_image_for_vision': 'agent_system.images',
+    'ResponseCache': 'agent_system.response_cache',
+    'response_cache': 'agent_system.response_cache',
+    'ModelWarmer': 'agent_system.warmup',
+    'model_warmer': 'agent_system.warmup',
+    'TicketExecutor': 'agent_system.executor',
+    'ticket_queue': 'agent_system.executor',
+    'EmbeddingIndex': 'agent_system.embeddings',
+    'embedding_index': 'agent_system.embeddings',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module), name)
+    globals()[name] = value
+    return value
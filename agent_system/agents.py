@@ -1,16 +1,37 @@
 import logging
 from abc import ABC, abstractmethod
-from typing import Dict, List, Optional, Any, Tuple
+from typing import Dict, List, Optional, Any, Tuple, Iterator
 
 from agent_system.ollama_client import OllamaClient
+from agent_system.context import ContextWindow, get_token_budget
+from agent_system.embeddings import embedding_index
 from models import AgentRole
 
 logger = logging.getLogger(__name__)
 
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a conversation between a user and an AI agent. "
+    "Merge the previous summary with the new turns into a single concise summary of at most "
+    "150 words. Keep decisions, requirements, open questions and names; drop pleasantries. "
+    "Reply with the summary only."
+)
+
+# Summaries are bookkeeping, not conversation; greedy decoding keeps them
+# stable and lets identical summarization requests hit the response cache
+SUMMARY_OPTIONS = {"temperature": 0}
+
+RETRIEVAL_HEADER = (
+    "Project records that may be relevant to the latest message, retrieved by similarity. "
+    "They can be outdated; prefer the conversation where they disagree."
+)
+
 
 class BaseAgent(ABC):
     """Base class for all agents in the system."""
     
+    # Ollama generation options for this agent's replies; None uses the model defaults
+    generation_options: Optional[Dict[str, Any]] = None
+    
     def __init__(self, agent_id: int, name: str, role: AgentRole, model: str = "llama3:8b-vision"):
         """
         Initialize a base agent.
@@ -27,7 +48,7 @@ class BaseAgent(ABC):
         self.model = model
         self.ollama_client = OllamaClient(model)
         self.system_prompt = self._get_system_prompt()
-        self.context = []
+        self.context = self.new_context()
         logger.debug(f"Initialized {self.role.value} agent: {self.name}")
         
     def _get_system_prompt(self) -> str:
@@ -44,41 +65,149 @@ class BaseAgent(ABC):
         """Get the role-specific part of the system prompt."""
         pass
         
-    def process_message(self, message: str, image_path: Optional[str] = None) -> str:
+    def new_context(self) -> ContextWindow:
+        """
+        Create an empty context window sized for this agent's model.
+        
+        Returns:
+            ContextWindow: A context window that summarizes evicted turns with this agent's model
+        """
+        return ContextWindow(get_token_budget(self.model), summarizer=self.summarize_turns)
+    
+    def summarize_turns(self, summary: str, turns: List[Dict[str, str]]) -> str:
+        """
+        Fold evicted conversation turns into the running summary.
+        
+        Args:
+            summary (str): The current summary, possibly empty
+            turns (List[Dict[str, str]]): The turns being evicted, oldest first
+        
+        Returns:
+            str: The updated summary
+        """
+        transcript = "\n".join(f"{turn['role']}: {turn['content']}" for turn in turns)
+        prompt = f"Previous summary:\n{summary or '(none)'}\n\nNew turns:\n{transcript}"
+        return self.ollama_client.generate(
+            system_prompt=SUMMARY_PROMPT,
+            messages=[{"role": "user", "content": prompt}],
+            raise_errors=True,
+            options=SUMMARY_OPTIONS
+        )
+    
+    def retrieval_prompt(self, message: str, context: ContextWindow, project_id: Optional[int]) -> str:
+        """
+        Get the system prompt with the project records most similar to a message appended.
+        
+        Args:
+            message (str): The message being answered
+            context (ContextWindow): The conversation context, whose turns are not repeated
+            project_id (Optional[int]): The project to retrieve from; None retrieves nothing
+        
+        Returns:
+            str: The system prompt for this message
+        """
+        if project_id is None or not embedding_index.enabled:
+            return self.system_prompt
+        try:
+            items = embedding_index.search(message, project_id)
+        except Exception as e:
+            # Retrieval only adds to the prompt, so the agent answers without it
+            logger.warning(f"Could not retrieve project records for {self.name}: {str(e)}")
+            return self.system_prompt
+        
+        turns = [turn["content"] for turn in context.messages()]
+        notes = [f"- {item['type'].capitalize()} #{item['id']}: {item['text']}" for item in items
+                 if not any(turn.startswith(item["text"]) for turn in turns)]
+        if not notes:
+            return self.system_prompt
+        return f"{self.system_prompt}\n\n{RETRIEVAL_HEADER}\n" + "\n".join(notes)
+    
+    def process_message(self, message: str, image_path: Optional[str] = None,
+                        context: Optional[ContextWindow] = None,
+                        raise_errors: bool = False,
+                        project_id: Optional[int] = None) -> str:
         """
         Process a message, optionally with an image.
         
         Args:
             message (str): The message to process
             image_path (Optional[str]): Path to an image file, if any
+            context (Optional[ContextWindow]): Conversation context to use
+                instead of the agent's own, for agents shared between requests
+            raise_errors (bool): Raise model errors instead of replying with an apology
+            project_id (Optional[int]): Project whose most relevant records are added to the prompt
             
         Returns:
             str: The agent's response
         """
+        if context is None:
+            context = self.context
+        
+        system_prompt = self.retrieval_prompt(message, context, project_id)
+        
         # Add to context
-        self.context.append({"role": "user", "content": message})
+        context.add("user", message)
         
         # Process with Ollama
         if image_path:
             response = self.ollama_client.generate_with_image(
-                system_prompt=self.system_prompt,
-                messages=self.context,
-                image_path=image_path
+                system_prompt=system_prompt,
+                messages=context.messages(),
+                image_path=image_path,
+                options=self.generation_options,
+                raise_errors=raise_errors
             )
         else:
             response = self.ollama_client.generate(
-                system_prompt=self.system_prompt,
-                messages=self.context
+                system_prompt=system_prompt,
+                messages=context.messages(),
+                options=self.generation_options,
+                raise_errors=raise_errors
             )
         
         # Add response to context
-        self.context.append({"role": "assistant", "content": response})
+        context.add("assistant", response)
         
         return response
     
+    def process_message_stream(self, message: str, image_path: Optional[str] = None,
+                               context: Optional[ContextWindow] = None,
+                               project_id: Optional[int] = None) -> Iterator[str]:
+        """
+        Process a message, yielding the response in chunks as it is generated.
+        
+        Args:
+            message (str): The message to process
+            image_path (Optional[str]): Path to an image file, if any
+            context (Optional[ContextWindow]): Conversation context to use
+                instead of the agent's own, for agents shared between requests
+            project_id (Optional[int]): Project whose most relevant records are added to the prompt
+        
+        Yields:
+            str: Successive chunks of the agent's response
+        """
+        if context is None:
+            context = self.context
+        
+        system_prompt = self.retrieval_prompt(message, context, project_id)
+        context.add("user", message)
+        
+        chunks = []
+        for chunk in self.ollama_client.generate_stream(
+            system_prompt=system_prompt,
+            messages=context.messages(),
+            image_path=image_path,
+            options=self.generation_options
+        ):
+            chunks.append(chunk)
+            yield chunk
+        
+        # Only the complete response goes into the context
+        context.add("assistant", "".join(chunks))
+    
     def reset_context(self):
         """Reset the conversation context."""
-        self.context = []
+        self.context.clear()
         logger.debug(f"Reset context for {self.name}")
 
 
@@ -101,6 +230,10 @@ class CoordinatorAgent(BaseAgent):
 class PlannerAgent(BaseAgent):
     """Plans the project structure and creates detailed specifications."""
     
+    # Specifications should not change between identical requests, which
+    # also makes repeated planning prompts answerable from the response cache
+    generation_options = {"temperature": 0}
+    
     def _get_role_specific_prompt(self) -> str:
         return (
             "Your role is to create detailed plans and specifications for the project. You should:\n"
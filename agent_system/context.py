@@ -0,0 +1,185 @@
+import logging
+import math
+import os
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Prompt token budgets per model. llama3 has an 8k context window; the budget
+# leaves room for the system prompt and the reply.
+DEFAULT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "4096"))
+MODEL_TOKEN_BUDGETS = {
+    "llama3:8b": 6144,
+    "llama3:8b-vision": 4096,
+}
+
+# When over budget, evict down to this fraction of it, so the summarizer runs
+# once per batch of turns rather than on every turn
+LOW_WATERMARK = 0.75
+
+# Rough characters-per-token ratio for English text with llama tokenizers
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SummarizerFn = Callable[[str, List[Dict[str, str]]], str]
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of tokens a message will take in the prompt.
+
+    Args:
+        text (str): The message content
+
+    Returns:
+        int: The estimated token count, including per-message overhead
+    """
+    return math.ceil(len(text) / CHARS_PER_TOKEN) + MESSAGE_OVERHEAD_TOKENS
+
+
+def get_token_budget(model: str) -> int:
+    """
+    Get the context token budget for a model.
+
+    Args:
+        model (str): The Ollama model name
+
+    Returns:
+        int: The prompt token budget
+    """
+    return MODEL_TOKEN_BUDGETS.get(model, DEFAULT_TOKEN_BUDGET)
+
+
+class ContextWindow:
+    """Sliding window of conversation turns bounded by a token budget."""
+
+    def __init__(self, token_budget: int = DEFAULT_TOKEN_BUDGET,
+                 summarizer: Optional[SummarizerFn] = None,
+                 min_turns: int = 2):
+        """
+        Initialize the context window.
+
+        Args:
+            token_budget (int): Maximum tokens for the summary plus retained turns
+            summarizer (Optional[SummarizerFn]): Called with the current summary and
+                the evicted turns; returns the new summary. Evicted turns are
+                dropped when no summarizer is given.
+            min_turns (int): Number of most recent turns that are never evicted
+        """
+        self.token_budget = token_budget
+        self.summarizer = summarizer
+        self.min_turns = min_turns
+        self.summary = ""
+        self.summary_tokens = 0
+        self.turn_tokens = 0
+        # ID of the newest stored message folded into the summary, if known
+        self.summarized_through: Optional[int] = None
+        self._turns: Deque[List] = deque()
+
+    @property
+    def total_tokens(self) -> int:
+        """Estimated tokens the window currently adds to a prompt."""
+        return self.turn_tokens + self.summary_tokens
+
+    def add(self, role: str, content: str, ref: Optional[int] = None):
+        """
+        Append a turn, evicting older turns if the budget is exceeded.
+
+        Args:
+            role (str): "user" or "assistant"
+            content (str): The message content
+            ref (Optional[int]): ID of the stored message this turn came from
+        """
+        tokens = estimate_tokens(content)
+        self._turns.append([{"role": role, "content": content}, tokens, ref])
+        self.turn_tokens += tokens
+
+        if self.total_tokens > self.token_budget:
+            self._evict()
+
+    def assign_refs(self, refs: List[int]):
+        """
+        Attach stored message IDs to the most recent turns once they are persisted.
+
+        Args:
+            refs (List[int]): Message IDs, oldest first, for the last len(refs) turns
+        """
+        for turn, ref in zip(list(self._turns)[-len(refs):], refs):
+            turn[2] = ref
+
+    @property
+    def last_ref(self) -> Optional[int]:
+        """ID of the newest stored message in the window, if known."""
+        for _, _, ref in reversed(self._turns):
+            if ref is not None:
+                return ref
+        return self.summarized_through
+
+    def set_summary(self, summary: str):
+        """
+        Replace the running summary of evicted turns.
+
+        Args:
+            summary (str): The summary text
+        """
+        self.summary = summary
+        self.summary_tokens = estimate_tokens(summary) if summary else 0
+
+    def messages(self) -> List[Dict[str, str]]:
+        """
+        Get the messages to send to the model.
+
+        Returns:
+            List[Dict[str, str]]: The running summary, if any, followed by the retained turns
+        """
+        messages = []
+        if self.summary:
+            messages.append({
+                "role": "system",
+                "content": f"Summary of the earlier conversation:\n{self.summary}"
+            })
+        messages.extend(turn for turn, _, _ in self._turns)
+        return messages
+
+    def clear(self):
+        """Drop all turns and the summary."""
+        self._turns.clear()
+        self.turn_tokens = 0
+        self.summarized_through = None
+        self.set_summary("")
+
+    def __len__(self) -> int:
+        return len(self._turns)
+
+    def _evict(self):
+        """Evict the oldest turns down to the low watermark and fold them into the summary."""
+        target = int(self.token_budget * LOW_WATERMARK)
+        evicted = []
+        evicted_through = None
+
+        while self.total_tokens > target and len(self._turns) > self.min_turns:
+            turn, tokens, ref = self._turns.popleft()
+            self.turn_tokens -= tokens
+            evicted.append(turn)
+            if ref is not None:
+                evicted_through = ref
+
+        if not evicted:
+            return
+
+        if self.summarizer:
+            try:
+                self.set_summary(self._fit_summary(self.summarizer(self.summary, evicted)))
+                if evicted_through is not None:
+                    self.summarized_through = evicted_through
+            except Exception as e:
+                # Keep the previous summary; the turns are gone either way
+                logger.exception(f"Error summarizing evicted context: {str(e)}")
+
+        logger.debug(f"Evicted {len(evicted)} turns from context window ({self.total_tokens}/{self.token_budget} tokens)")
+
+    def _fit_summary(self, summary: str) -> str:
+        """Truncate a summary so it can never take more than a quarter of the budget."""
+        max_chars = (self.token_budget // 4) * CHARS_PER_TOKEN
+        return summary.strip()[:max_chars]
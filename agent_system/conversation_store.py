@@ -0,0 +1,189 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from models import Message, ConversationSummary
+from agent_system.agents import BaseAgent
+from agent_system.context import ContextWindow
+from app import db
+
+logger = logging.getLogger(__name__)
+
+# Number of stored messages replayed into a context window on a cache miss
+RECENT_MESSAGES = int(os.environ.get("CONTEXT_RECENT_MESSAGES", "20"))
+# Number of conversation windows each worker keeps in memory
+CACHE_SIZE = int(os.environ.get("CONTEXT_CACHE_SIZE", "256"))
+
+
+class ConversationContextStore:
+    """Per-conversation context windows, rehydrated lazily from the messages table."""
+
+    def __init__(self, max_conversations: int = CACHE_SIZE, recent_messages: int = RECENT_MESSAGES):
+        """
+        Initialize the context store.
+
+        Args:
+            max_conversations (int): Number of windows kept in the in-memory LRU
+            recent_messages (int): Number of most recent messages loaded on a miss
+        """
+        self.max_conversations = max_conversations
+        self.recent_messages = recent_messages
+        self._lock = threading.Lock()
+        # (conversation_id, agent_id) -> (window, summary as last persisted)
+        self._windows: "OrderedDict[Tuple[int, int], List]" = OrderedDict()
+        # (conversation_id, agent_id) -> [lock, turns holding or waiting for it]; kept
+        # apart from the LRU so evicting a window cannot split a turn's lock
+        self._turn_locks: Dict[Tuple[int, int], List] = {}
+
+    @contextmanager
+    def turn(self, conversation_id: int, agent: BaseAgent) -> Iterator[ContextWindow]:
+        """
+        Hold an agent's context window for a conversation for one whole turn.
+
+        Turns of the same conversation and agent run one after another in this
+        process, so adding turns, evicting them and folding them into the
+        summary never interleave. Hold it from get() until after record().
+
+        Args:
+            conversation_id (int): The conversation ID
+            agent (BaseAgent): The agent the window belongs to
+
+        Yields:
+            ContextWindow: The context window, caught up with stored messages
+        """
+        key = (conversation_id, agent.agent_id)
+        with self._lock:
+            turn_lock = self._turn_locks.setdefault(key, [threading.Lock(), 0])
+            turn_lock[1] += 1
+        try:
+            with turn_lock[0]:
+                yield self.get(conversation_id, agent)
+        finally:
+            with self._lock:
+                turn_lock[1] -= 1
+                if not turn_lock[1]:
+                    del self._turn_locks[key]
+
+    def get(self, conversation_id: int, agent: BaseAgent) -> ContextWindow:
+        """
+        Get an agent's context window for a conversation.
+
+        A cached window is caught up with any messages written since it was
+        last used (for example by another worker), which is normally an
+        empty indexed range scan. A miss loads the stored summary plus at
+        most recent_messages messages, so the cost never depends on the
+        length of the conversation. Use turn() to change the window.
+
+        Args:
+            conversation_id (int): The conversation ID
+            agent (BaseAgent): The agent the window belongs to
+
+        Returns:
+            ContextWindow: The context window
+        """
+        key = (conversation_id, agent.agent_id)
+        with self._lock:
+            entry = self._windows.get(key)
+            if entry is not None:
+                self._windows.move_to_end(key)
+
+        if entry is None:
+            entry = [self._load(conversation_id, agent), None]
+            entry[1] = entry[0].summary
+            with self._lock:
+                self._windows[key] = entry
+                while len(self._windows) > self.max_conversations:
+                    self._windows.popitem(last=False)
+        else:
+            self._catch_up(conversation_id, entry[0])
+
+        return entry[0]
+
+    def record(self, conversation_id: int, agent: BaseAgent, messages: List[Message]):
+        """
+        Note that the latest turns of a window have been written as messages.
+
+        Call after the messages are flushed and before the commit; if the
+        running summary changed it is written in the same transaction.
+
+        Args:
+            conversation_id (int): The conversation ID
+            agent (BaseAgent): The agent the window belongs to
+            messages (List[Message]): The stored messages for the last turns, oldest first
+        """
+        with self._lock:
+            entry = self._windows.get((conversation_id, agent.agent_id))
+        if entry is None:
+            return
+
+        window = entry[0]
+        window.assign_refs([message.id for message in messages])
+
+        if window.summary != entry[1]:
+            db.session.merge(ConversationSummary(
+                conversation_id=conversation_id,
+                summary=window.summary,
+                summarized_through_id=window.summarized_through
+            ))
+            entry[1] = window.summary
+            logger.debug(f"Updated stored summary for conversation {conversation_id}")
+
+    def invalidate(self, conversation_id: int):
+        """
+        Drop every cached window for a conversation.
+
+        Args:
+            conversation_id (int): The conversation ID
+        """
+        with self._lock:
+            for key in [key for key in self._windows if key[0] == conversation_id]:
+                del self._windows[key]
+
+    def _load(self, conversation_id: int, agent: BaseAgent) -> ContextWindow:
+        """Build a window from the stored summary and the most recent messages."""
+        window = agent.new_context()
+
+        stored = db.session.get(ConversationSummary, conversation_id)
+        if stored:
+            window.set_summary(stored.summary)
+            window.summarized_through = stored.summarized_through_id
+
+        query = Message.query.filter(Message.conversation_id == conversation_id)
+        if window.summarized_through is not None:
+            query = query.filter(Message.id > window.summarized_through)
+        rows = query.order_by(Message.id.desc()).limit(self.recent_messages).all()
+
+        self._replay(window, reversed(rows))
+        logger.debug(f"Rehydrated context for conversation {conversation_id} from {len(rows)} messages")
+        return window
+
+    def _catch_up(self, conversation_id: int, window: ContextWindow):
+        """Replay messages stored since the window was last updated."""
+        last_ref = window.last_ref
+        if last_ref is None and len(window):
+            # Turns whose messages were never recorded; nothing safe to replay after
+            return
+
+        query = Message.query.filter(Message.conversation_id == conversation_id)
+        if last_ref is not None:
+            query = query.filter(Message.id > last_ref)
+        rows = query.order_by(Message.id.desc()).limit(self.recent_messages).all()
+        self._replay(window, reversed(rows))
+
+    def _replay(self, window: ContextWindow, rows):
+        """Add stored messages to a window without asking the model to summarize them."""
+        # Turns that fall off during a replay are dropped rather than
+        # summarized, so a cold load never waits on the model
+        summarizer, window.summarizer = window.summarizer, None
+        try:
+            for row in rows:
+                window.add("user" if row.is_user else "assistant", row.content, ref=row.id)
+        finally:
+            window.summarizer = summarizer
+
+
+# Shared by every AgentCoordinator in this process
+conversation_context_store = ConversationContextStore()
@@ -1,14 +1,61 @@
+import contextvars
+import json
 import logging
-from typing import Dict, List, Optional, Any, Tuple
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Callable, Dict, List, Optional, Any, Tuple, Iterator, Generator
 from datetime import datetime
 
-from models import AgentRole, TicketStatus, Ticket, Project, Agent, Checkpoint, Message, Conversation
-from agent_system.agents import BaseAgent, CoordinatorAgent, PlannerAgent, ResearcherAgent, DeveloperAgent, TesterAgent, ReviewerAgent
-from agent_system.ticket_system import TicketManager
+from models import AgentRole, TicketPriority, TicketStatus, Ticket, Project, Agent, Checkpoint, Message, Conversation
+from agent_system.agents import BaseAgent
+from agent_system.context import ContextWindow
+from agent_system.ticket_system import TICKET_TITLE_LENGTH, TicketManager
+from agent_system.registry import agent_registry
+from agent_system.conversation_store import conversation_context_store
+from agent_system.jobs import JOB_WORKERS, JobQueue, hold_job_result, job_handler, stored_job_result
+from agent_system.ollama_client import DEFAULT_READ_TIMEOUT
+from agent_system.scheduler import QUEUE_TIMEOUT, generation_priority
+from activity import record_activity
 from app import db
 
 logger = logging.getLogger(__name__)
 
+# Roles consulted by fan_out when none are given
+FAN_OUT_ROLES = (AgentRole.RESEARCHER, AgentRole.DEVELOPER, AgentRole.TESTER, AgentRole.REVIEWER)
+# Seconds each agent may take before fan_out returns without its answer
+FAN_OUT_TIMEOUT = float(os.environ.get("AGENT_FAN_OUT_TIMEOUT", "60"))
+# Agent calls run concurrently per worker process, across all requests
+FAN_OUT_WORKERS = int(os.environ.get("AGENT_FAN_OUT_WORKERS", "8"))
+# The planner may wait for a generation slot and then read its reply for up to
+# these timeouts; by default a run gets as long again before it is taken over
+ANALYSIS_VISIBILITY_TIMEOUT = float(os.environ.get("ANALYSIS_VISIBILITY_TIMEOUT",
+                                                   str(2 * (QUEUE_TIMEOUT + DEFAULT_READ_TIMEOUT))))
+
+MERGE_PROMPT = (
+    "You combine answers from specialist agents into a single reply to the user. "
+    "Keep every concrete recommendation, resolve or point out disagreements, drop repetition, "
+    "and mention any specialist whose answer is missing. Reply with the combined answer only."
+)
+
+PLAN_FORMAT = (
+    "Reply with a JSON array of tickets only. Give each ticket a \"title\", a \"description\", "
+    "a \"priority\" (LOW, MEDIUM, HIGH or CRITICAL) and optionally \"subtasks\", "
+    "an array of tickets of the same shape."
+)
+# Subtask levels and tickets taken from one plan
+PLAN_MAX_DEPTH = 3
+PLAN_MAX_TICKETS = 200
+
+# Shared so timed-out agent calls cannot pile up threads without bound
+_fan_out_executor = ThreadPoolExecutor(max_workers=FAN_OUT_WORKERS, thread_name_prefix="agent-fan-out")
+
+# Planner follow-ups have their own workers and a visibility timeout longer than a generation
+analysis_queue = JobQueue(workers=JOB_WORKERS,
+                          visibility_timeout=ANALYSIS_VISIBILITY_TIMEOUT,
+                          kinds=["analyze_project"],
+                          name="analysis")
+
 
 class AgentCoordinator:
     """Manages the coordination between multiple agents in the system."""
@@ -17,90 +64,35 @@ class AgentCoordinator:
         """
         Initialize the agent coordinator.
         
+        Agents come from the process-wide registry, so constructing a
+        coordinator does no database work once the registry is warm.
+        
         Args:
             project_id (int): The ID of the project being worked on
         """
         self.project_id = project_id
-        self.ticket_manager = TicketManager(project_id)
-        self.agents = {}
-        self.coordinator_agent = None
-        self._load_agents()
+        self.agents, self.coordinator_agent = agent_registry.snapshot()
+        self.actor = self.coordinator_agent.name if self.coordinator_agent else None
+        self.ticket_manager = TicketManager(project_id, actor=self.actor)
+        # Shared agents are stateless; conversation context lives here
+        self.contexts = {}
+        # IDs of follow-up jobs queued while handling messages
+        self.pending_jobs = []
         logger.debug(f"Initialized AgentCoordinator for project {project_id}")
     
-    def _load_agents(self):
-        """Load all agents from the database and initialize them."""
-        project = Project.query.get(self.project_id)
-        if not project:
-            raise ValueError(f"Project with ID {self.project_id} not found")
-        
-        db_agents = Agent.query.all()
-        if not db_agents:
-            logger.info("No agents found in database. Creating default agents.")
-            self._create_default_agents()
-            db_agents = Agent.query.all()
-        
-        for db_agent in db_agents:
-            agent_instance = self._create_agent_instance(db_agent)
-            self.agents[db_agent.id] = agent_instance
-            
-            # Set the coordinator agent
-            if db_agent.role == AgentRole.COORDINATOR:
-                self.coordinator_agent = agent_instance
-        
-        logger.debug(f"Loaded {len(self.agents)} agents")
-    
-    def _create_default_agents(self):
-        """Create default agents if none exist in the database."""
-        default_agents = [
-            {"name": "Alice", "role": AgentRole.COORDINATOR, "model": "llama3:8b-vision"},
-            {"name": "Bob", "role": AgentRole.PLANNER, "model": "llama3:8b-vision"},
-            {"name": "Charlie", "role": AgentRole.RESEARCHER, "model": "llama3:8b-vision"},
-            {"name": "Diana", "role": AgentRole.DEVELOPER, "model": "llama3:8b-vision"},
-            {"name": "Eve", "role": AgentRole.TESTER, "model": "llama3:8b-vision"},
-            {"name": "Frank", "role": AgentRole.REVIEWER, "model": "llama3:8b-vision"}
-        ]
-        
-        for agent_data in default_agents:
-            agent = Agent(
-                name=agent_data["name"],
-                role=agent_data["role"],
-                model=agent_data["model"],
-                description=f"Default {agent_data['role'].value} agent"
-            )
-            db.session.add(agent)
-        
-        db.session.commit()
-        logger.info("Created default agents")
-    
-    def _create_agent_instance(self, db_agent: Agent) -> BaseAgent:
+    def get_context(self, agent: BaseAgent) -> ContextWindow:
         """
-        Create an agent instance based on the agent's role.
+        Get this coordinator's conversation context for an agent.
         
         Args:
-            db_agent (Agent): The database agent model
+            agent (BaseAgent): The agent
             
         Returns:
-            BaseAgent: An instance of the appropriate agent class
-        """
-        agent_class_map = {
-            AgentRole.COORDINATOR: CoordinatorAgent,
-            AgentRole.PLANNER: PlannerAgent,
-            AgentRole.RESEARCHER: ResearcherAgent,
-            AgentRole.DEVELOPER: DeveloperAgent,
-            AgentRole.TESTER: TesterAgent,
-            AgentRole.REVIEWER: ReviewerAgent
-        }
-        
-        agent_class = agent_class_map.get(db_agent.role)
-        if not agent_class:
-            raise ValueError(f"Unknown agent role: {db_agent.role}")
-        
-        return agent_class(
-            agent_id=db_agent.id,
-            name=db_agent.name,
-            role=db_agent.role,
-            model=db_agent.model
-        )
+            ContextWindow: The context passed to the agent's model
+        """
+        if agent.agent_id not in self.contexts:
+            self.contexts[agent.agent_id] = agent.new_context()
+        return self.contexts[agent.agent_id]
     
     def get_agent_by_id(self, agent_id: int) -> Optional[BaseAgent]:
         """
@@ -144,68 +136,303 @@ class AgentCoordinator:
         if not self.coordinator_agent:
             raise ValueError("No coordinator agent found")
         
-        # Create a message record
-        db_message = Message(
-            content=message,
-            is_user=True,
-            conversation_id=conversation_id,
-            has_image=bool(image_path),
-            image_path=image_path
-        )
-        db.session.add(db_message)
-        db.session.commit()
+        # Hold the conversation context for the whole turn; it is loaded before this message is stored
+        with conversation_context_store.turn(conversation_id, self.coordinator_agent) as context:
+            # Create a message record
+            db_message = Message(
+                content=message,
+                is_user=True,
+                conversation_id=conversation_id,
+                has_image=bool(image_path),
+                image_path=image_path
+            )
+            db.session.add(db_message)
+            db.session.commit()
+            
+            # Process the message with the coordinator agent
+            response = self.coordinator_agent.process_message(message, image_path, context=context,
+                                                              project_id=self.project_id)
+            
+            # Create a response message record
+            response_message = Message(
+                content=response,
+                is_user=False,
+                agent_id=self.coordinator_agent.agent_id,
+                conversation_id=conversation_id,
+                has_image=False
+            )
+            db.session.add(response_message)
+            db.session.flush()
+            conversation_context_store.record(conversation_id, self.coordinator_agent, [db_message, response_message])
+            self._record_reply(conversation_id, response_message)
+            db.session.commit()
+            
+        # Analyze message for potential project actions
+        self._schedule_project_update(message, response)
         
-        # Process the message with the coordinator agent
-        response = self.coordinator_agent.process_message(message, image_path)
+        return response
+    
+    def stream_user_message(self, message: str, conversation_id: int,
+                            image_path: Optional[str] = None) -> Generator[str, None, Tuple[Message, Message]]:
+        """
+        Process a user message, yielding the coordinator's response as it streams.
         
-        # Create a response message record
-        response_message = Message(
-            content=response,
-            is_user=False,
-            agent_id=self.coordinator_agent.agent_id,
-            conversation_id=conversation_id,
-            has_image=False
-        )
-        db.session.add(response_message)
-        db.session.commit()
+        The user message and the assembled response are written together in a
+        single commit once generation finishes (or the stream is abandoned),
+        so nothing touches the database before the first chunk is sent.
         
-        # Analyze message for potential project actions
-        self._analyze_and_update_project(message, response)
+        Args:
+            message (str): The user message
+            conversation_id (int): The ID of the conversation
+            image_path (Optional[str]): Path to an image file, if any
         
-        return response
+        Yields:
+            str: Successive chunks of the coordinator's response
+        
+        Returns:
+            Tuple[Message, Message]: The persisted user and response messages
+        """
+        if not self.coordinator_agent:
+            raise ValueError("No coordinator agent found")
+        
+        # The context is held until the turn is recorded, even across the stream
+        with conversation_context_store.turn(conversation_id, self.coordinator_agent) as context:
+            received_at = datetime.utcnow()
+            chunks = []
+            completed = False
+            try:
+                for chunk in self.coordinator_agent.process_message_stream(message, image_path, context=context,
+                                                                               project_id=self.project_id):
+                    chunks.append(chunk)
+                    yield chunk
+                completed = True
+            finally:
+                db_message = Message(
+                    content=message,
+                    timestamp=received_at,
+                    is_user=True,
+                    conversation_id=conversation_id,
+                    has_image=bool(image_path),
+                    image_path=image_path
+                )
+                response_message = Message(
+                    content="".join(chunks),
+                    is_user=False,
+                    agent_id=self.coordinator_agent.agent_id,
+                    conversation_id=conversation_id,
+                    has_image=False
+                )
+                db.session.add(db_message)
+                db.session.add(response_message)
+                db.session.flush()
+                if not completed:
+                    # A stream cut short never added the reply to the context, so the
+                    # window no longer matches these messages; reload it from them
+                    conversation_context_store.invalidate(conversation_id)
+                conversation_context_store.record(conversation_id, self.coordinator_agent, [db_message, response_message])
+                self._record_reply(conversation_id, response_message)
+                db.session.commit()
+            
+        if completed:
+            self._schedule_project_update(message, response_message.content)
+        
+        return db_message, response_message
     
-    def _analyze_and_update_project(self, user_message: str, agent_response: str):
+    def fan_out(self, message: str,
+                roles: Optional[List[AgentRole]] = None,
+                timeout: float = FAN_OUT_TIMEOUT,
+                timeouts: Optional[Dict[AgentRole, float]] = None,
+                merge: bool = True) -> Dict[str, Any]:
         """
-        Analyze messages to identify project actions that need to be taken.
+        Ask several role agents the same question concurrently and merge their answers.
+        
+        Total latency is that of the slowest agent that answers in time,
+        not the sum. Agents that time out or fail are reported and left
+        out of the merge, so a partial result is still returned.
+        
+        Args:
+            message (str): The request sent to every agent
+            roles (Optional[List[AgentRole]]): Roles to consult; defaults to FAN_OUT_ROLES
+            timeout (float): Seconds each agent may take
+            timeouts (Optional[Dict[AgentRole, float]]): Per-role overrides of the timeout
+            merge (bool): Have the coordinator agent combine the answers into one reply
+        
+        Returns:
+            Dict[str, Any]: Per-role responses, timed-out and failed roles, and the merged reply
+        """
+        timeouts = timeouts or {}
+        started = time.monotonic()
+        
+        futures = {}
+        missing = []
+        for role in roles or FAN_OUT_ROLES:
+            agent = self.get_agent_by_role(role)
+            if agent is None:
+                missing.append(role.value)
+                continue
+            # Worker threads do not inherit context variables such as the
+            # generation priority, so each call runs in a copy of ours
+            call_context = contextvars.copy_context()
+            future = _fan_out_executor.submit(call_context.run, self._consult, agent, self.get_context(agent), message)
+            futures[role] = (agent, future, started + timeouts.get(role, timeout))
+        
+        responses, failed, timed_out = {}, {}, []
+        # Collect in deadline order so each wait is bounded by that agent's own timeout
+        for role, (agent, future, deadline) in sorted(futures.items(), key=lambda item: item[1][2]):
+            try:
+                content, seconds = future.result(timeout=max(0.0, deadline - time.monotonic()))
+                responses[role.value] = {'agent': agent.name, 'content': content, 'seconds': round(seconds, 2)}
+            except FutureTimeoutError:
+                # A call that has not started yet is dropped; a running one finishes unobserved
+                future.cancel()
+                timed_out.append(role.value)
+                logger.warning(f"{agent.name} did not answer within the fan-out timeout")
+            except Exception as e:
+                failed[role.value] = str(e)
+                logger.warning(f"{agent.name} failed during fan-out: {str(e)}")
+        
+        result = {
+            'responses': responses,
+            'timed_out': timed_out,
+            'failed': failed,
+            'missing': missing,
+            'seconds': round(time.monotonic() - started, 2)
+        }
+        if merge:
+            result['merged'] = self._merge_responses(message, responses, timed_out + list(failed))
+        return result
+    
+    def _consult(self, agent: BaseAgent, context: ContextWindow, message: str) -> Tuple[str, float]:
+        """Get one agent's answer for fan_out, timing it."""
+        started = time.monotonic()
+        content = agent.process_message(message, context=context, raise_errors=True, project_id=self.project_id)
+        return content, time.monotonic() - started
+    
+    def _merge_responses(self, message: str, responses: Dict[str, Dict[str, Any]], unanswered: List[str]) -> str:
+        """
+        Combine fan-out answers into one reply with the coordinator agent.
+        
+        Args:
+            message (str): The original request
+            responses (Dict[str, Dict[str, Any]]): Answers keyed by role
+            unanswered (List[str]): Roles that timed out or failed
+        
+        Returns:
+            str: The merged reply, or the answers listed one after another if merging fails
+        """
+        sections = [f"{role.title()} ({response['agent']}):\n{response['content']}"
+                    for role, response in responses.items()]
+        if unanswered:
+            sections.append(f"No answer from: {', '.join(unanswered)}")
+        listing = "\n\n".join(sections)
+        
+        if not responses or self.coordinator_agent is None or len(responses) == 1:
+            return listing
+        
+        try:
+            return self.coordinator_agent.ollama_client.generate(
+                system_prompt=MERGE_PROMPT,
+                messages=[{"role": "user", "content": f"Request: {message}\n\n{listing}"}],
+                raise_errors=True
+            )
+        except Exception as e:
+            logger.warning(f"Could not merge fan-out answers: {str(e)}")
+            return listing
+    
+    def _record_reply(self, conversation_id: int, response_message: Message):
+        """
+        Add an agent reply to the activity log, in the caller's transaction.
+        
+        Args:
+            conversation_id (int): The ID of the conversation
+            response_message (Message): The stored agent reply
+        """
+        conversation = db.session.get(Conversation, conversation_id)
+        title = conversation.title if conversation and conversation.title else 'Untitled'
+        record_activity(
+            "message.created",
+            f"New message in '{title}'",
+            "conversation",
+            conversation_id,
+            project_id=conversation.project_id if conversation else self.project_id,
+            detail=response_message.content,
+            actor=self.actor
+        )
+    
+    def _needs_project_update(self, user_message: str) -> bool:
+        """
+        Check whether a user message asks for project changes.
         
         Args:
             user_message (str): The user's message
-            agent_response (str): The agent's response
+        
+        Returns:
+            bool: True if the planner should follow up on the message
         """
         # This is a simplified implementation; in a real system, this would use
         # more sophisticated NLP/LLM processing to identify actions
+        return "new task" in user_message.lower() or "create ticket" in user_message.lower()
+    
+    def _schedule_project_update(self, user_message: str, agent_response: str):
+        """
+        Queue the planner follow-up for a message so the reply is not held up by it.
         
-        # Check if this might be a new ticket request
-        if "new task" in user_message.lower() or "create ticket" in user_message.lower():
-            # Ask the planner to create a more detailed specification
-            planner = self.get_agent_by_role(AgentRole.PLANNER)
-            if planner:
-                planning_prompt = (
-                    f"Based on this user request, create a detailed ticket specification:\n\n"
-                    f"User request: {user_message}\n\n"
-                    f"Include a title, description, and priority level."
-                )
-                plan_response = planner.process_message(planning_prompt)
+        Args:
+            user_message (str): The user's message
+            agent_response (str): The agent's response
+        """
+        if not self._needs_project_update(user_message):
+            return
+        
+        job = analysis_queue.enqueue(
+            "analyze_project",
+            {
+                "project_id": self.project_id,
+                "user_message": user_message,
+                "agent_response": agent_response
+            },
+            project_id=self.project_id
+        )
+        self.pending_jobs.append(job.id)
                 
-                # Extract ticket details (in a real system, would use more robust parsing)
-                # For now, just create a simple ticket
-                title = user_message[:100]  # Use first 100 chars as title
-                self.ticket_manager.create_ticket(
-                    title=title,
-                    description=user_message,
-                    priority="MEDIUM"
-                )
-                logger.info(f"Created new ticket from user message: {title}")
+    def _analyze_and_update_project(self, user_message: str, agent_response: str,
+                                    before_commit: Optional[Callable[[List[int]], None]] = None) -> List[int]:
+        """
+        Have the planner turn a user request into project tickets.
+        
+        The planner's tickets and subtasks are created together in one
+        batch. If its reply cannot be parsed, a single ticket is created
+        from the request instead.
+        
+        Args:
+            user_message (str): The user's message
+            agent_response (str): The agent's response
+            before_commit (Optional[Callable[[List[int]], None]]): Passed to TicketManager.create_tickets
+        
+        Returns:
+            List[int]: The IDs of the created tickets
+        """
+        # Ask the planner to create a more detailed specification
+        planner = self.get_agent_by_role(AgentRole.PLANNER)
+        if not planner:
+            return []
+        
+        planning_prompt = (
+            f"Based on this user request, create a detailed ticket specification:\n\n"
+            f"User request: {user_message}\n\n"
+            f"{PLAN_FORMAT}"
+        )
+        plan_response = planner.process_message(planning_prompt, context=self.get_context(planner),
+                                                project_id=self.project_id)
+        
+        items = _plan_to_ticket_items(plan_response)
+        if not items:
+            logger.info("Planner reply had no parsable tickets, creating one from the request")
+            items = [{"title": user_message[:100], "description": user_message, "priority": "MEDIUM"}]
+        
+        results = self.ticket_manager.create_tickets(items, before_commit=before_commit)
+        logger.info(f"Created {len(results)} tickets from user message")
+        return [result["id"] for result in results]
     
     def assign_ticket_to_agent(self, ticket_id: int, agent_id: int) -> bool:
         """
@@ -257,6 +484,9 @@ class AgentCoordinator:
             project_id=self.project_id
         )
         db.session.add(checkpoint)
+        db.session.flush()
+        record_activity("checkpoint.created", f"Checkpoint created: {name}", "checkpoint", checkpoint.id,
+                        self.project_id, description, actor=self.actor)
         db.session.commit()
         logger.info(f"Created new checkpoint: {name}")
         return checkpoint.id
@@ -281,6 +511,8 @@ class AgentCoordinator:
         
         if ticket not in checkpoint.related_tickets:
             checkpoint.related_tickets.append(ticket)
+            record_activity("checkpoint.ticket_added", f"Ticket added to checkpoint: {checkpoint.name}", "checkpoint",
+                            checkpoint.id, checkpoint.project_id, ticket.title, actor=self.actor)
             db.session.commit()
             logger.info(f"Added ticket {ticket_id} to checkpoint {checkpoint_id}")
             return True
@@ -305,6 +537,82 @@ class AgentCoordinator:
             project_id=self.project_id
         )
         db.session.add(conversation)
+        db.session.flush()
+        record_activity("conversation.created", f"Conversation started: {title}", "conversation", conversation.id,
+                        self.project_id, actor=self.actor)
         db.session.commit()
         logger.info(f"Created new conversation: {title}")
         return conversation.id
+
+
+@job_handler("analyze_project")
+def run_project_analysis(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Job handler running the planner follow-up for a chat message.
+    
+    The created ticket IDs are stored on the job with the tickets, so a
+    retry, or a run that outlived its visibility timeout, creates nothing.
+    
+    Args:
+        payload (Dict[str, Any]): project_id, user_message and agent_response
+    
+    Returns:
+        Dict[str, Any]: The IDs of the created tickets
+    """
+    stored = stored_job_result()
+    if stored is not None:
+        return stored
+    
+    coordinator = AgentCoordinator(payload["project_id"])
+    # Follow-ups yield to interactive chat when the models are busy
+    with generation_priority(interactive=False):
+        ticket_ids = coordinator._analyze_and_update_project(
+            payload["user_message"], payload["agent_response"],
+            before_commit=lambda ids: hold_job_result({"ticket_ids": ids})
+        )
+    return {"ticket_ids": ticket_ids}
+
+
+def _plan_to_ticket_items(plan_response: str) -> List[Dict[str, Any]]:
+    """
+    Turn the planner's JSON reply into a ticket batch for TicketManager.create_tickets.
+    
+    Subtasks follow their parent and refer to it with parent_index. Missing
+    or unknown priorities become MEDIUM, so one sloppy entry does not fail
+    the whole batch.
+    
+    Args:
+        plan_response (str): The planner's reply
+    
+    Returns:
+        List[Dict[str, Any]]: The ticket items, empty if the reply holds no tickets
+    """
+    start, end = plan_response.find("["), plan_response.rfind("]")
+    if start == -1 or end <= start:
+        return []
+    try:
+        plan = json.loads(plan_response[start:end + 1])
+    except ValueError:
+        return []
+    
+    items: List[Dict[str, Any]] = []
+    
+    def add(entries: Any, parent_index: Optional[int], depth: int):
+        if not isinstance(entries, list) or depth >= PLAN_MAX_DEPTH:
+            return
+        for entry in entries:
+            if len(items) >= PLAN_MAX_TICKETS:
+                return
+            if not isinstance(entry, dict) or not isinstance(entry.get("title"), str) or not entry["title"].strip():
+                continue
+            priority = str(entry.get("priority", "MEDIUM")).upper()
+            items.append({
+                "title": entry["title"].strip()[:TICKET_TITLE_LENGTH],
+                "description": str(entry.get("description") or ""),
+                "priority": priority if priority in TicketPriority.__members__ else "MEDIUM",
+                "parent_index": parent_index
+            })
+            add(entry.get("subtasks"), len(items) - 1, depth + 1)
+    
+    add(plan, None, 0)
+    return items
@@ -0,0 +1,459 @@
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, func, or_
+
+from models import Comment, Conversation, Message, Ticket
+from agent_system.ollama_client import OllamaClient
+from agent_system.scheduler import generation_priority
+from app import app, db
+
+try:
+    import numpy as np
+except ImportError:  # Only needed when EMBEDDING_INDEX_DIR is set
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# Directory of the on-disk embedding index; retrieval is off while unset
+EMBEDDING_INDEX_DIR = os.environ.get("EMBEDDING_INDEX_DIR")
+# Ollama model that embeds items and queries
+EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "nomic-embed-text")
+# Snippets added to an agent's prompt, and the similarity they need to qualify
+EMBEDDING_TOP_K = int(os.environ.get("EMBEDDING_TOP_K", "4"))
+EMBEDDING_MIN_SCORE = float(os.environ.get("EMBEDDING_MIN_SCORE", "0.4"))
+# Seconds between checks for new or changed items
+EMBEDDING_SYNC_INTERVAL = float(os.environ.get("EMBEDDING_SYNC_INTERVAL", "30"))
+# Texts sent to the embedding model per request
+EMBEDDING_BATCH_SIZE = 32
+# Characters of an item that are embedded, and that are kept as its snippet
+EMBEDDING_TEXT_CHARS = 2000
+EMBEDDING_SNIPPET_CHARS = 400
+# Rows written this recently wait for the next sync, so a transaction that
+# commits after a later one is not skipped by the watermark. Tickets are held
+# back by updated_at; comments and messages by the highest id seen this long ago
+EMBEDDING_SYNC_LAG = 5
+# Projects whose vectors are copied into one contiguous block in memory, so a
+# search reads only that project's rows instead of gathering them from the file
+EMBEDDING_BLOCK_CACHE = 32
+
+ITEM_KINDS = ("ticket", "comment", "message")
+
+# One fixed-size record per vector row, appended to keys.bin. Rows are never
+# rewritten: an item whose text changed gets a new row that supersedes its old one.
+KEY_DTYPE = np.dtype([
+    ("kind", "u1"),
+    ("id", "<i8"),
+    ("project_id", "<i8"),
+    # Leading bytes of the text's SHA-1, so unchanged items are not re-embedded
+    ("digest", "<u8"),
+    # Position of the snippet in texts.bin
+    ("offset", "<i8"),
+    ("length", "<i4"),
+]) if np is not None else None
+
+
+def _text_digest(text: str) -> int:
+    return int.from_bytes(hashlib.sha1(text.encode("utf-8")).digest()[:8], "little")
+
+
+class EmbeddingIndex:
+    """Append-only index of ticket, comment and message embeddings, memory-mapped from disk."""
+
+    def __init__(self, directory: Optional[str] = EMBEDDING_INDEX_DIR,
+                 model: str = EMBEDDING_MODEL,
+                 interval: float = EMBEDDING_SYNC_INTERVAL):
+        """
+        Initialize the index.
+
+        Args:
+            directory (Optional[str]): Directory holding the index; None disables it
+            model (str): The Ollama embedding model
+            interval (float): Seconds between syncs with the database
+        """
+        # Vectors of different models are not comparable, so each gets its own files
+        self.directory = os.path.join(directory, re.sub(r"[^\w.-]", "_", model)) if directory else None
+        self.enabled = self.directory is not None and np is not None
+        self.model = model
+        self.interval = interval
+        self.client = OllamaClient(model)
+        self._lock = threading.Lock()
+        self._started_pid: Optional[int] = None
+        self._dim: Optional[int] = None
+        self._count = 0
+        self._vectors = None
+        self._keys = np.zeros(0, dtype=KEY_DTYPE) if np is not None else None
+        self._live = np.zeros(0, dtype=bool) if np is not None else None
+        # (kind, id) -> newest row of the item
+        self._latest: Dict[Tuple[int, int], int] = {}
+        # project_id -> (rows, their vectors), least recently searched first
+        self._blocks: "OrderedDict[int, Tuple[Any, Any]]" = OrderedDict()
+        # kind -> (monotonic time, highest id then), oldest first, for kinds followed by id
+        self._horizons: Dict[str, Deque[Tuple[float, int]]] = {"comment": deque(), "message": deque()}
+        if directory and np is None:
+            logger.warning("EMBEDDING_INDEX_DIR is set but numpy is not installed; retrieval is disabled")
+
+    def start(self):
+        """Start the sync thread for this process, if not already running."""
+        if not self.enabled:
+            return
+        pid = os.getpid()
+        if self._started_pid == pid:
+            return
+        with self._lock:
+            # Threads do not survive a fork, so gunicorn workers start their own
+            if self._started_pid == pid:
+                return
+            threading.Thread(target=self._run, name="embedding-index", daemon=True).start()
+            self._started_pid = pid
+
+    def search(self, query: str, project_id: int, k: int = EMBEDDING_TOP_K,
+               min_score: float = EMBEDDING_MIN_SCORE) -> List[Dict[str, Any]]:
+        """
+        Find the items of a project most similar to a text.
+
+        Args:
+            query (str): The text to match
+            project_id (int): The project to search
+            k (int): Maximum number of items
+            min_score (float): Lowest cosine similarity returned
+
+        Returns:
+            List[Dict[str, Any]]: type, id, score and snippet text of each item, best first
+        """
+        if not self.enabled or not query.strip():
+            return []
+        self._refresh()
+        if not self._count:
+            return []
+        vector = self.client.embed([query[:EMBEDDING_TEXT_CHARS]])[0]
+        return self.nearest(vector, project_id, k, min_score)
+
+    def nearest(self, vector: List[float], project_id: Optional[int] = None, k: int = EMBEDDING_TOP_K,
+                min_score: float = EMBEDDING_MIN_SCORE) -> List[Dict[str, Any]]:
+        """
+        Find the items closest to an embedding vector.
+
+        Args:
+            vector (List[float]): The query embedding
+            project_id (Optional[int]): Only consider items of this project
+            k (int): Maximum number of items
+            min_score (float): Lowest cosine similarity returned
+
+        Returns:
+            List[Dict[str, Any]]: type, id, score and snippet text of each item, best first
+        """
+        with self._lock:
+            if self._vectors is None or k <= 0:
+                return []
+            keys = self._keys
+            if project_id is None:
+                rows, vectors = np.flatnonzero(self._live), self._vectors
+            else:
+                rows, vectors = self._block(project_id)
+        query = np.asarray(vector, dtype=np.float32)
+        if query.shape != (vectors.shape[1],):
+            raise ValueError(f"Query has {query.size} dimensions, the index has {vectors.shape[1]}")
+        query /= np.linalg.norm(query) or 1.0
+        if not rows.size:
+            return []
+
+        # Stored vectors have unit length, so the dot product is the cosine similarity
+        if project_id is None:
+            # Scoring every row and dropping superseded ones avoids copying the matrix
+            scores = (vectors @ query)[rows]
+        else:
+            scores = vectors @ query
+        if rows.size > k:
+            best = np.argpartition(scores, -k)[-k:]
+        else:
+            best = np.arange(rows.size)
+        best = best[np.argsort(scores[best])[::-1]]
+        return [self._item(keys[rows[i]], float(scores[i])) for i in best if scores[i] >= min_score]
+
+    def sync(self) -> int:
+        """
+        Embed the items created or changed since the last sync and append them.
+
+        Only one process per host syncs at a time; the others skip the round.
+
+        Returns:
+            int: The number of rows appended
+        """
+        if not self.enabled:
+            return 0
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self._path("lock"), "a+b") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return 0
+            try:
+                self._repair()
+                self._refresh()
+                meta = self._read_meta()
+                added = 0
+                for kind in ITEM_KINDS:
+                    while True:
+                        items, watermark = self._pending(kind, meta["watermarks"].get(kind))
+                        if not items:
+                            break
+                        added += self._append(kind, items, meta)
+                        meta["watermarks"][kind] = watermark
+                        self._write_meta(meta)
+                        if len(items) < EMBEDDING_BATCH_SIZE:
+                            break
+                return added
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def stats(self) -> Dict[str, Any]:
+        """Get the size of the index as this process sees it."""
+        self._refresh()
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "model": self.model,
+                "dimensions": self._dim,
+                "rows": self._count,
+                "items": int(self._live.sum()) if self._live is not None else 0
+            }
+
+    def _run(self):
+        while True:
+            with app.app_context(), generation_priority(interactive=False):
+                try:
+                    added = self.sync()
+                    if added:
+                        logger.info(f"Embedded {added} item(s) into the index")
+                except Exception as e:
+                    logger.exception(f"Error syncing the embedding index: {str(e)}")
+                finally:
+                    db.session.remove()
+            time.sleep(self.interval)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _read_meta(self) -> Dict[str, Any]:
+        try:
+            with open(self._path("meta.json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"model": self.model, "dimensions": None, "watermarks": {}}
+
+    def _write_meta(self, meta: Dict[str, Any]):
+        # Written whole then renamed, so readers never see half a file
+        temp_path = self._path("meta.json.tmp")
+        with open(temp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(temp_path, self._path("meta.json"))
+
+    def _refresh(self):
+        """Map rows appended since the last call, by this or any other process."""
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._dim is None:
+                self._dim = self._read_meta().get("dimensions")
+                if self._dim is None:
+                    return
+            try:
+                # Keys are written after their vectors, so a complete key means a complete row
+                count = os.path.getsize(self._path("keys.bin")) // KEY_DTYPE.itemsize
+            except FileNotFoundError:
+                return
+            if count <= self._count:
+                return
+
+            new_keys = np.fromfile(self._path("keys.bin"), dtype=KEY_DTYPE,
+                                   count=count - self._count, offset=self._count * KEY_DTYPE.itemsize)
+            live = np.concatenate([self._live, np.ones(len(new_keys), dtype=bool)])
+            for row, (kind, item_id) in enumerate(zip(new_keys["kind"].tolist(), new_keys["id"].tolist()),
+                                                  start=self._count):
+                previous = self._latest.get((kind, item_id))
+                if previous is not None:
+                    live[previous] = False
+                self._latest[(kind, item_id)] = row
+
+            self._vectors = np.memmap(self._path("vectors.f32"), dtype=np.float32, mode="r",
+                                      shape=(count, self._dim))
+            self._keys = np.concatenate([self._keys, new_keys])
+            # An item never changes project, so only the projects of new rows are stale
+            for project_id in np.unique(new_keys["project_id"]).tolist():
+                self._blocks.pop(project_id, None)
+            self._live = live
+            self._count = count
+
+    def _block(self, project_id: int) -> Tuple[Any, Any]:
+        """Get a project's live rows and a contiguous copy of their vectors; call with the lock held."""
+        block = self._blocks.get(project_id)
+        if block is not None:
+            self._blocks.move_to_end(project_id)
+            return block
+        rows = np.flatnonzero(self._live & (self._keys["project_id"] == project_id))
+        block = (rows, np.ascontiguousarray(self._vectors[rows]))
+        self._blocks[project_id] = block
+        while len(self._blocks) > EMBEDDING_BLOCK_CACHE:
+            self._blocks.popitem(last=False)
+        return block
+
+    def _repair(self):
+        """Drop the tail of a write that was interrupted, before appending after it."""
+        meta = self._read_meta()
+        if meta.get("dimensions") is None:
+            return
+        row_size = meta["dimensions"] * 4
+        try:
+            count = os.path.getsize(self._path("keys.bin")) // KEY_DTYPE.itemsize
+        except FileNotFoundError:
+            count = 0
+        end = 0
+        if count:
+            last = np.fromfile(self._path("keys.bin"), dtype=KEY_DTYPE, count=1,
+                               offset=(count - 1) * KEY_DTYPE.itemsize)[0]
+            end = int(last["offset"]) + int(last["length"])
+        for name, size in (("keys.bin", count * KEY_DTYPE.itemsize),
+                           ("vectors.f32", count * row_size),
+                           ("texts.bin", end)):
+            path = self._path(name)
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                logger.warning(f"Truncating incomplete write at the end of {path}")
+                os.truncate(path, size)
+
+    def _pending(self, kind: str, watermark: Any) -> Tuple[List[Tuple[int, int, str]], Any]:
+        """
+        Get the next batch of items of a kind past the watermark.
+
+        Args:
+            kind (str): One of ITEM_KINDS
+            watermark (Any): Where the previous batch ended, or None
+
+        Returns:
+            Tuple[List[Tuple[int, int, str]], Any]: (id, project_id, text) of each item, and the new watermark
+        """
+        if kind == "ticket":
+            cutoff = datetime.utcnow() - timedelta(seconds=EMBEDDING_SYNC_LAG)
+            # Tickets are edited, so they are followed by updated_at
+            query = (db.session.query(Ticket.id, Ticket.project_id, Ticket.title, Ticket.description, Ticket.updated_at)
+                     .filter(Ticket.updated_at < cutoff))
+            if watermark:
+                updated_at = datetime.fromisoformat(watermark[0])
+                query = query.filter(or_(Ticket.updated_at > updated_at,
+                                         and_(Ticket.updated_at == updated_at, Ticket.id > watermark[1])))
+            rows = query.order_by(Ticket.updated_at, Ticket.id).limit(EMBEDDING_BATCH_SIZE).all()
+            items = [(row.id, row.project_id, f"{row.title}\n{row.description or ''}".strip()) for row in rows]
+            return items, [rows[-1].updated_at.isoformat(), rows[-1].id] if rows else watermark
+
+        # Comments and messages are never edited, so they are followed by id alone;
+        # their timestamps need not follow id order
+        model = Comment if kind == "comment" else Message
+        settled = self._settled_id(kind, model)
+        if settled is None:
+            return [], watermark
+        if kind == "comment":
+            query = (db.session.query(Comment.id, Ticket.project_id, Comment.content)
+                     .join(Ticket, Comment.ticket_id == Ticket.id))
+        else:
+            query = (db.session.query(Message.id, Conversation.project_id, Message.content)
+                     .join(Conversation, Message.conversation_id == Conversation.id)
+                     .filter(Conversation.project_id.isnot(None)))
+        query = query.filter(model.id <= settled)
+        if watermark:
+            query = query.filter(model.id > watermark)
+        rows = query.order_by(model.id).limit(EMBEDDING_BATCH_SIZE).all()
+        return [tuple(row) for row in rows], rows[-1][0] if rows else watermark
+
+    def _settled_id(self, kind: str, model) -> Optional[int]:
+        """
+        Get the highest id of a kind that was already taken EMBEDDING_SYNC_LAG seconds ago.
+
+        Ids are handed out before their transactions commit, so a lower id
+        can appear after a higher one; by then the lag has passed it.
+
+        Args:
+            kind (str): "comment" or "message"
+            model: The model whose ids are followed
+
+        Returns:
+            Optional[int]: The settled id, or None until the lag has passed since the first look
+        """
+        now = time.monotonic()
+        horizons = self._horizons[kind]
+        horizons.append((now, db.session.query(func.max(model.id)).scalar() or 0))
+        # Keep only the newest look that is old enough, and the ones after it
+        while len(horizons) > 1 and now - horizons[1][0] >= EMBEDDING_SYNC_LAG:
+            horizons.popleft()
+        seen_at, settled = horizons[0]
+        return settled if now - seen_at >= EMBEDDING_SYNC_LAG else None
+
+    def _append(self, kind: str, items: List[Tuple[int, int, str]], meta: Dict[str, Any]) -> int:
+        """Embed items whose text changed and append them to the files."""
+        kind_code = ITEM_KINDS.index(kind)
+        with self._lock:
+            keys, latest = self._keys, dict(self._latest)
+        fresh = []
+        for item_id, project_id, text in items:
+            text = (text or "").strip()[:EMBEDDING_TEXT_CHARS]
+            if not text:
+                continue
+            digest = _text_digest(text)
+            row = latest.get((kind_code, item_id))
+            if row is not None and int(keys[row]["digest"]) == digest:
+                continue
+            fresh.append((item_id, project_id, text, digest))
+        if not fresh:
+            return 0
+
+        vectors = np.asarray(self.client.embed([text for _, _, text, _ in fresh]), dtype=np.float32)
+        if meta.get("dimensions") is None:
+            meta["dimensions"] = int(vectors.shape[1])
+            self._write_meta(meta)
+        elif vectors.shape[1] != meta["dimensions"]:
+            raise ValueError(f"{self.model} returned {vectors.shape[1]} dimensions, the index has {meta['dimensions']}")
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.where(norms == 0, 1, norms)
+
+        records = np.zeros(len(fresh), dtype=KEY_DTYPE)
+        snippets = []
+        offset = os.path.getsize(self._path("texts.bin")) if os.path.exists(self._path("texts.bin")) else 0
+        for i, (item_id, project_id, text, digest) in enumerate(fresh):
+            snippet = text[:EMBEDDING_SNIPPET_CHARS].encode("utf-8")
+            records[i] = (kind_code, item_id, project_id, digest, offset, len(snippet))
+            snippets.append(snippet)
+            offset += len(snippet)
+
+        # Snippets and vectors first, keys last: a row exists once its key is complete
+        with open(self._path("texts.bin"), "ab") as f:
+            f.write(b"".join(snippets))
+        with open(self._path("vectors.f32"), "ab") as f:
+            f.write(vectors.tobytes())
+        with open(self._path("keys.bin"), "ab") as f:
+            f.write(records.tobytes())
+        self._refresh()
+        return len(fresh)
+
+    def _item(self, key, score: float) -> Dict[str, Any]:
+        with open(self._path("texts.bin"), "rb") as f:
+            f.seek(int(key["offset"]))
+            text = f.read(int(key["length"])).decode("utf-8", errors="ignore")
+        return {
+            "type": ITEM_KINDS[int(key["kind"])],
+            "id": int(key["id"]),
+            "project_id": int(key["project_id"]),
+            "score": round(score, 4),
+            "text": text
+        }
+
+
+# Shared by the whole process
+embedding_index = EmbeddingIndex()
@@ -0,0 +1,351 @@
+import logging
+import os
+import re
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import update
+
+from models import AgentRole, Checkpoint, Comment, Ticket, TicketPriority, TicketStatus, checkpoint_ticket
+from activity import record_ticket_activity
+from agent_system.agents import BaseAgent
+from agent_system.jobs import JobQueue, job_handler
+from agent_system.registry import agent_registry
+from agent_system.scheduler import DEFAULT_MAX_INFLIGHT, generation_priority
+from agent_system.ticket_system import TicketManager
+from app import db
+
+logger = logging.getLogger(__name__)
+
+# Tickets worked on at once per process. Each ticket holds at most one
+# generation slot at a time, so matching the per-model slots keeps them busy.
+TICKET_WORKERS = int(os.environ.get("TICKET_WORKERS", str(DEFAULT_MAX_INFLIGHT)))
+# A ticket makes two generations that yield to interactive chat, so it may
+# legitimately run far longer than an ordinary job
+TICKET_VISIBILITY_TIMEOUT = float(os.environ.get("TICKET_VISIBILITY_TIMEOUT", "900"))
+
+EXECUTOR_ACTOR = "executor"
+
+# Unassigned tickets go to the first role whose pattern matches, else to a developer
+ROLE_PATTERNS = (
+    (AgentRole.REVIEWER, re.compile(r"\b(review|audit)", re.IGNORECASE)),
+    (AgentRole.TESTER, re.compile(r"\b(test|qa\b|verif)", re.IGNORECASE)),
+    (AgentRole.RESEARCHER, re.compile(r"\b(research|investigat|evaluat|compar|spike)", re.IGNORECASE)),
+)
+
+PRIORITY_ORDER = {
+    TicketPriority.CRITICAL: 0,
+    TicketPriority.HIGH: 1,
+    TicketPriority.MEDIUM: 2,
+    TicketPriority.LOW: 3
+}
+
+# Longest subtask result quoted to the agent working on the parent ticket
+SUBTASK_RESULT_CHARS = 1000
+
+REVIEW_PROMPT = (
+    "Review the work done on this ticket. Start your reply with APPROVED if it is complete, "
+    "or with CHANGES REQUESTED followed by what is missing."
+)
+
+# Ticket work has its own workers and visibility timeout
+ticket_queue = JobQueue(workers=TICKET_WORKERS,
+                        visibility_timeout=TICKET_VISIBILITY_TIMEOUT,
+                        kinds=["execute_ticket"],
+                        name="ticket")
+
+
+class TicketExecutor:
+    """Works through a project's tickets in dependency order, running independent tickets in parallel."""
+
+    def __init__(self, project_id: int, queue: JobQueue = ticket_queue):
+        """
+        Initialize the executor.
+
+        Args:
+            project_id (int): The ID of the project
+            queue (JobQueue): Queue the ticket jobs are run on
+        """
+        self.project_id = project_id
+        self.queue = queue
+        self.ticket_manager = TicketManager(project_id, actor=EXECUTOR_ACTOR)
+
+    def dependency_graph(self) -> Dict[int, Set[int]]:
+        """
+        Build the project's ticket dependency graph.
+
+        A parent ticket depends on its subtasks. Checkpoints run in
+        milestone order, so every ticket of a checkpoint depends on the
+        tickets of the checkpoint before it. A ticket in several
+        checkpoints belongs to the earliest.
+
+        Returns:
+            Dict[int, Set[int]]: The tickets each ticket waits for, keyed by ticket ID
+        """
+        return self._build_graph(self._load_tickets())
+
+    def plan(self) -> Dict[str, Any]:
+        """
+        Get which tickets can run now and which are waiting.
+
+        Returns:
+            Dict[str, Any]: Ready, waiting and cyclic ticket IDs, and ticket counts per status
+        """
+        tickets = self._load_tickets()
+        graph = self._build_graph(tickets)
+        statuses = {ticket_id: status for ticket_id, (_, status, _) in tickets.items()}
+        cyclic = _unreachable(graph)
+
+        ready, waiting = [], []
+        for ticket_id, dependencies in graph.items():
+            if statuses[ticket_id] != TicketStatus.OPEN or ticket_id in cyclic:
+                continue
+            if all(statuses[dependency] == TicketStatus.COMPLETED for dependency in dependencies):
+                ready.append(ticket_id)
+            else:
+                waiting.append(ticket_id)
+
+        # Urgent tickets are dispatched, and so claimed by workers, first
+        ready.sort(key=lambda ticket_id: (PRIORITY_ORDER[tickets[ticket_id][2]], ticket_id))
+
+        counts = {status.value: 0 for status in TicketStatus}
+        for status in statuses.values():
+            counts[status.value] += 1
+
+        return {
+            'ready': ready,
+            'waiting': sorted(waiting),
+            'cyclic': sorted(cyclic),
+            'counts': counts
+        }
+
+    def dispatch(self) -> List[int]:
+        """
+        Hand every ready ticket to an agent and queue its work.
+
+        Each ticket is claimed with a conditional update from OPEN to
+        IN_PROGRESS, so tickets finishing at the same time never dispatch
+        the same dependent twice. The claim and the job commit together.
+
+        Returns:
+            List[int]: IDs of the tickets dispatched
+        """
+        dispatched = []
+        for ticket_id in self.plan()['ready']:
+            ticket = db.session.get(Ticket, ticket_id)
+            agent = self._agent_for(ticket)
+            if agent is None:
+                logger.warning(f"No agent available for ticket {ticket_id}")
+                continue
+
+            claimed = db.session.execute(
+                update(Ticket)
+                .where(Ticket.id == ticket_id, Ticket.status == TicketStatus.OPEN)
+                .values(status=TicketStatus.IN_PROGRESS,
+                        assigned_agent_id=agent.agent_id,
+                        updated_at=datetime.utcnow())
+            )
+            if claimed.rowcount != 1:
+                # Another dispatcher got there first
+                db.session.rollback()
+                continue
+
+            record_ticket_activity(ticket, "ticket.dispatched", f"Ticket dispatched: {ticket.title}",
+                                   f"Assigned to {agent.name}", actor=EXECUTOR_ACTOR)
+            self.queue.enqueue("execute_ticket", {"ticket_id": ticket_id}, project_id=self.project_id)
+            dispatched.append(ticket_id)
+
+        if dispatched:
+            logger.info(f"Dispatched {len(dispatched)} ticket(s) in project {self.project_id}")
+        return dispatched
+
+    def execute(self, ticket: Ticket) -> Dict[str, Any]:
+        """
+        Advance a dispatched ticket: work on it, review it, then release its dependents.
+
+        Each step starts from the ticket's stored status, so a job that is
+        run again after a lost worker resumes where the last run stopped.
+
+        Args:
+            ticket (Ticket): The ticket, IN_PROGRESS or REVIEW
+
+        Returns:
+            Dict[str, Any]: The ticket's final status and the tickets dispatched after it
+        """
+        # Ticket work yields to interactive chat, most urgent tickets first
+        with generation_priority(interactive=False, ticket_priority=ticket.priority):
+            if ticket.status == TicketStatus.IN_PROGRESS:
+                self._work(ticket)
+            if ticket.status == TicketStatus.REVIEW:
+                self._review(ticket)
+
+        dispatched = self.dispatch() if ticket.status == TicketStatus.COMPLETED else []
+        return {"status": ticket.status.value, "dispatched": dispatched}
+
+    def _work(self, ticket: Ticket):
+        """Have the assigned agent work on a ticket and move it to review."""
+        agent = self._agent_for(ticket)
+        if agent is None:
+            self._block(ticket, "No agent is available for this ticket")
+            return
+
+        try:
+            result = agent.process_message(self._work_prompt(ticket), context=agent.new_context(),
+                                           raise_errors=True, project_id=self.project_id)
+        except Exception as e:
+            logger.exception(f"{agent.name} failed on ticket {ticket.id}: {str(e)}")
+            self._block(ticket, f"{agent.name} could not work on this ticket: {str(e)}")
+            return
+
+        self.ticket_manager.add_comment(ticket.id, result, agent_id=agent.agent_id)
+        self._set_status(ticket, TicketStatus.REVIEW)
+
+    def _review(self, ticket: Ticket):
+        """Have a reviewer check a ticket's result and complete or block it."""
+        reviewer = self._agent_by_role(AgentRole.REVIEWER)
+        if reviewer is None or reviewer.agent_id == ticket.assigned_agent_id:
+            self._set_status(ticket, TicketStatus.COMPLETED)
+            return
+
+        try:
+            verdict = reviewer.process_message(f"{REVIEW_PROMPT}\n\n{self._review_material(ticket)}",
+                                               context=reviewer.new_context(), raise_errors=True,
+                                               project_id=self.project_id)
+        except Exception as e:
+            logger.exception(f"{reviewer.name} failed to review ticket {ticket.id}: {str(e)}")
+            self._block(ticket, f"{reviewer.name} could not review this ticket: {str(e)}")
+            return
+
+        self.ticket_manager.add_comment(ticket.id, verdict, agent_id=reviewer.agent_id)
+        # Only an explicit rejection holds the ticket back for a person to look at
+        rejected = verdict.strip().upper().startswith("CHANGES REQUESTED")
+        self._set_status(ticket, TicketStatus.BLOCKED if rejected else TicketStatus.COMPLETED)
+
+    def _block(self, ticket: Ticket, reason: str):
+        self.ticket_manager.add_comment(ticket.id, reason)
+        self._set_status(ticket, TicketStatus.BLOCKED)
+
+    def _set_status(self, ticket: Ticket, status: TicketStatus):
+        if not self.ticket_manager.update_ticket_status(ticket.id, status):
+            raise RuntimeError(f"Could not move ticket {ticket.id} to {status.value}")
+
+    def _work_prompt(self, ticket: Ticket) -> str:
+        """The request given to the agent working on a ticket, with its subtasks' results."""
+        parts = [
+            "Work on this ticket and reply with the result.",
+            f"Title: {ticket.title}",
+            f"Description: {ticket.description or 'None'}"
+        ]
+        for subtask in ticket.subtasks.filter(Ticket.status == TicketStatus.COMPLETED).order_by(Ticket.id):
+            result = _latest_agent_comment(subtask, subtask.assigned_agent_id)
+            if result:
+                parts.append(f"Result of subtask \"{subtask.title}\":\n{result[:SUBTASK_RESULT_CHARS]}")
+        return "\n\n".join(parts)
+
+    def _review_material(self, ticket: Ticket) -> str:
+        result = _latest_agent_comment(ticket, ticket.assigned_agent_id) or "No result was recorded."
+        return f"Title: {ticket.title}\n\nDescription: {ticket.description or 'None'}\n\nResult:\n{result}"
+
+    def _agent_for(self, ticket: Ticket) -> Optional[BaseAgent]:
+        """The ticket's assigned agent, or the agent of the role its text suggests."""
+        agents, _ = agent_registry.snapshot()
+        if ticket.assigned_agent_id in agents:
+            return agents[ticket.assigned_agent_id]
+        return self._agent_by_role(ticket_role(ticket))
+
+    def _agent_by_role(self, role: AgentRole) -> Optional[BaseAgent]:
+        agents, _ = agent_registry.snapshot()
+        return next((agent for agent in agents.values() if agent.role == role), None)
+
+    def _load_tickets(self) -> Dict[int, Tuple[Optional[int], TicketStatus, TicketPriority]]:
+        """Each ticket's parent, status and priority, keyed by ticket ID."""
+        rows = (db.session.query(Ticket.id, Ticket.parent_ticket_id, Ticket.status, Ticket.priority)
+                .filter(Ticket.project_id == self.project_id)
+                .all())
+        return {ticket_id: (parent_id, status, priority) for ticket_id, parent_id, status, priority in rows}
+
+    def _build_graph(self, tickets: Dict[int, Tuple[Optional[int], TicketStatus, TicketPriority]]) -> Dict[int, Set[int]]:
+        graph: Dict[int, Set[int]] = {ticket_id: set() for ticket_id in tickets}
+        for ticket_id, (parent_id, _, _) in tickets.items():
+            if parent_id in graph:
+                graph[parent_id].add(ticket_id)
+
+        members = (db.session.query(checkpoint_ticket.c.checkpoint_id, checkpoint_ticket.c.ticket_id)
+                   .join(Checkpoint, Checkpoint.id == checkpoint_ticket.c.checkpoint_id)
+                   .filter(Checkpoint.project_id == self.project_id)
+                   .order_by(Checkpoint.milestone_date.is_(None), Checkpoint.milestone_date, Checkpoint.id)
+                   .all())
+        stages: Dict[int, List[int]] = {}
+        placed: Set[int] = set()
+        for checkpoint_id, ticket_id in members:
+            if ticket_id in graph and ticket_id not in placed:
+                placed.add(ticket_id)
+                stages.setdefault(checkpoint_id, []).append(ticket_id)
+
+        # Depending on the previous stage alone is enough, since it in turn
+        # depends on the stage before it
+        previous: List[int] = []
+        for stage in stages.values():
+            for ticket_id in stage:
+                graph[ticket_id].update(previous)
+            previous = stage
+        return graph
+
+
+def ticket_role(ticket: Ticket) -> AgentRole:
+    """
+    Guess which role should work on an unassigned ticket from its text.
+
+    Args:
+        ticket (Ticket): The ticket
+
+    Returns:
+        AgentRole: The role
+    """
+    text = f"{ticket.title} {ticket.description or ''}"
+    for role, pattern in ROLE_PATTERNS:
+        if pattern.search(text):
+            return role
+    return AgentRole.DEVELOPER
+
+
+def _latest_agent_comment(ticket: Ticket, agent_id: Optional[int]) -> Optional[str]:
+    if agent_id is None:
+        return None
+    comment = ticket.comments.filter_by(agent_id=agent_id).order_by(Comment.id.desc()).first()
+    return comment.content if comment else None
+
+
+def _unreachable(graph: Dict[int, Set[int]]) -> Set[int]:
+    """Tickets that can never run because they are on, or wait for, a dependency cycle."""
+    remaining = {ticket_id: len(dependencies) for ticket_id, dependencies in graph.items()}
+    dependents: Dict[int, List[int]] = {ticket_id: [] for ticket_id in graph}
+    for ticket_id, dependencies in graph.items():
+        for dependency in dependencies:
+            dependents[dependency].append(ticket_id)
+
+    resolvable = [ticket_id for ticket_id, count in remaining.items() if count == 0]
+    while resolvable:
+        ticket_id = resolvable.pop()
+        for dependent in dependents[ticket_id]:
+            remaining[dependent] -= 1
+            if remaining[dependent] == 0:
+                resolvable.append(dependent)
+    return {ticket_id for ticket_id, count in remaining.items() if count > 0}
+
+
+@job_handler("execute_ticket")
+def run_ticket(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Job handler working on one dispatched ticket.
+
+    Args:
+        payload (Dict[str, Any]): ticket_id
+
+    Returns:
+        Dict[str, Any]: The ticket's final status and the tickets dispatched after it
+    """
+    ticket = db.session.get(Ticket, payload["ticket_id"])
+    if ticket is None:
+        return {"status": None, "dispatched": []}
+    return TicketExecutor(ticket.project_id).execute(ticket)
@@ -0,0 +1,142 @@
+import base64
+import io
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+from blob_store import blob_digest, resolve_path
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Without Pillow images are sent to the model as uploaded
+    Image = None
+    ImageOps = None
+
+logger = logging.getLogger(__name__)
+
+# Longest side sent to the vision model; larger images are downsized since
+# the model resamples to its own input resolution anyway
+VISION_IMAGE_MAX_SIDE = int(os.environ.get("VISION_IMAGE_MAX_SIDE", "1120"))
+VISION_IMAGE_QUALITY = int(os.environ.get("VISION_IMAGE_QUALITY", "85"))
+# Memory budget for encoded payloads kept between vision turns
+VISION_IMAGE_CACHE_BYTES = int(os.environ.get("VISION_IMAGE_CACHE_MB", "64")) * 1024 * 1024
+
+
+class ImagePayloadCache:
+    """LRU cache of base64 image payloads, bounded by total size."""
+
+    def __init__(self, max_bytes: int = VISION_IMAGE_CACHE_BYTES):
+        """
+        Initialize the cache.
+
+        Args:
+            max_bytes (int): Total size of cached payloads before the least recently used are evicted
+        """
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, str]" = OrderedDict()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[str]:
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return payload
+
+    def put(self, key: Hashable, payload: str):
+        if len(payload) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._entries[key] = payload
+            self._size += len(payload)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get cache usage counters.
+
+        Returns:
+            Dict[str, Any]: Entries, bytes held, hits and misses
+        """
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+
+# Shared by every client in this process
+vision_image_cache = ImagePayloadCache()
+
+
+def encode_image_for_vision(image_path: str, max_side: int = VISION_IMAGE_MAX_SIDE) -> str:
+    """
+    Get the base64 payload sent to the vision model for an image.
+
+    The image is downsized and re-encoded once; follow-up turns about the
+    same image reuse the cached payload.
+
+    Args:
+        image_path (str): Blob reference or path of the image file
+        max_side (int): Longest side of the image sent to the model
+
+    Returns:
+        str: The base64-encoded image
+    """
+    path = resolve_path(image_path)
+    digest = blob_digest(image_path)
+    if digest is None:
+        # Files outside the blob store can change; key them by version too
+        stat = os.stat(path)
+        digest = (os.path.realpath(path), stat.st_mtime_ns, stat.st_size)
+    key = (digest, max_side)
+
+    payload = vision_image_cache.get(key)
+    if payload is None:
+        with open(path, "rb") as f:
+            original = f.read()
+        payload = base64.b64encode(_preprocess(original, max_side)).decode("ascii")
+        vision_image_cache.put(key, payload)
+    return payload
+
+
+def _preprocess(original: bytes, max_side: int) -> bytes:
+    """Downsize and re-encode an image, keeping the original when that is smaller."""
+    if Image is None:
+        return original
+    try:
+        with Image.open(io.BytesIO(original)) as image:
+            # Phones store rotation in EXIF; the model sees raw pixels
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((max_side, max_side))
+
+            output = io.BytesIO()
+            if image.mode in ("RGBA", "LA") or "transparency" in image.info:
+                image.save(output, format="PNG", optimize=True)
+            else:
+                image.convert("RGB").save(output, format="JPEG", quality=VISION_IMAGE_QUALITY, optimize=True)
+            processed = output.getvalue()
+    except Exception as e:
+        logger.warning(f"Could not preprocess image, sending it unchanged: {str(e)}")
+        return original
+
+    if len(processed) >= len(original):
+        return original
+    logger.debug(f"Preprocessed image from {len(original)} to {len(processed)} bytes")
+    return processed
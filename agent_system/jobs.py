@@ -0,0 +1,354 @@
+import json
+import logging
+import os
+import socket
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import and_, or_, update
+from sqlalchemy.exc import IntegrityError
+
+from models import Job, JobStatus
+from app import app, db
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", "2"))
+# A running job whose worker has not finished it within this many seconds is
+# assumed lost and handed to another worker (at-least-once delivery)
+JOB_VISIBILITY_TIMEOUT = float(os.environ.get("JOB_VISIBILITY_TIMEOUT", "300"))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_BACKOFF = float(os.environ.get("JOB_RETRY_BACKOFF", "5"))
+
+JobHandler = Callable[[Dict[str, Any]], Any]
+
+_handlers: Dict[str, JobHandler] = {}
+
+# Job kinds drained only by their own queue, never by the general one
+_dedicated_kinds: Set[str] = set()
+
+# The job each worker thread is running, as (job ID, worker ID)
+_running = threading.local()
+
+
+class JobLostError(RuntimeError):
+    """Raised when a running job has been handed to another worker."""
+
+
+def job_handler(kind: str) -> Callable[[JobHandler], JobHandler]:
+    """
+    Register a function as the handler for a job kind.
+
+    Handlers receive the decoded payload and run inside an application
+    context. They may run more than once for the same job, so they must be
+    safe to repeat; hold_job_result helps with side effects that must not
+    be. The return value, if any, is stored as the job result.
+
+    Args:
+        kind (str): The job kind
+
+    Returns:
+        Callable: A decorator registering the handler
+    """
+    def decorator(func: JobHandler) -> JobHandler:
+        _handlers[kind] = func
+        return func
+    return decorator
+
+
+def stored_job_result() -> Any:
+    """
+    Get the result an earlier attempt of the running job stored with hold_job_result.
+
+    Returns:
+        Any: The decoded result, or None if no attempt has stored one
+    """
+    job_id, _ = _running.job
+    result = db.session.query(Job.result).filter(Job.id == job_id).scalar()
+    return json.loads(result) if result is not None else None
+
+
+def hold_job_result(result: Any):
+    """
+    Store the running job's result in the current transaction.
+
+    Handlers whose side effects must happen once call this before they
+    commit them, and return stored_job_result() when a later attempt
+    finds one. The write only succeeds while this worker still holds the
+    job, so a run that outlived its visibility timeout cannot commit
+    alongside the worker that took the job over.
+
+    Args:
+        result (Any): JSON-serializable result
+
+    Raises:
+        JobLostError: If the job is no longer this worker's or already has a result
+    """
+    job_id, worker_id = _running.job
+    held = db.session.execute(
+        update(Job)
+        .where(Job.id == job_id, Job.locked_by == worker_id, Job.status == JobStatus.RUNNING,
+               Job.result.is_(None))
+        .values(result=json.dumps(result))
+    )
+    if held.rowcount != 1:
+        raise JobLostError(f"Job {job_id} is no longer held by {worker_id}")
+
+
+class JobQueue:
+    """Database-backed job queue drained by a pool of in-process worker threads."""
+
+    def __init__(self, workers: int = JOB_WORKERS,
+                 poll_interval: float = JOB_POLL_INTERVAL,
+                 visibility_timeout: float = JOB_VISIBILITY_TIMEOUT,
+                 retry_backoff: float = JOB_RETRY_BACKOFF,
+                 kinds: Optional[Iterable[str]] = None,
+                 name: str = "job"):
+        """
+        Initialize the job queue.
+
+        Args:
+            workers (int): Number of worker threads per process
+            poll_interval (float): Seconds between polls when the queue is idle
+            visibility_timeout (float): Seconds before a running job is considered lost
+            retry_backoff (float): Base delay in seconds before retrying a failed job
+            kinds (Optional[Iterable[str]]): Job kinds this queue alone runs; None
+                for the general queue, which runs every other kind
+            name (str): Prefix of the worker thread names
+        """
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.visibility_timeout = visibility_timeout
+        self.retry_backoff = retry_backoff
+        self.kinds = frozenset(kinds) if kinds is not None else None
+        self.name = name
+        if self.kinds:
+            _dedicated_kinds.update(self.kinds)
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+        self._started_pid: Optional[int] = None
+
+    def enqueue(self, kind: str, payload: Dict[str, Any],
+                project_id: Optional[int] = None,
+                max_attempts: int = JOB_MAX_ATTEMPTS,
+                run_after: Optional[datetime] = None,
+                dedup_key: Optional[str] = None) -> Optional[Job]:
+        """
+        Add a job to the queue and commit it.
+
+        Jobs with a dedup_key are queued only while no other job with that
+        key is queued; the database enforces it, so racing workers cannot
+        both succeed. A running job with the key does not block a new one.
+
+        Args:
+            kind (str): The job kind; must have a registered handler
+            payload (Dict[str, Any]): JSON-serializable job arguments
+            project_id (Optional[int]): The project the job belongs to, if any
+            max_attempts (int): Attempts before the job is marked failed
+            run_after (Optional[datetime]): Earliest time the job may run; defaults to now
+            dedup_key (Optional[str]): Key of which at most one job may be queued at a time
+
+        Returns:
+            Optional[Job]: The queued job, or None if one with the same dedup_key already was
+        """
+        if kind not in _handlers:
+            raise ValueError(f"No handler registered for job kind: {kind}")
+
+        job = Job(
+            kind=kind,
+            payload=json.dumps(payload),
+            status=JobStatus.QUEUED,
+            max_attempts=max_attempts,
+            project_id=project_id,
+            run_after=run_after or datetime.utcnow(),
+            dedup_key=dedup_key
+        )
+        db.session.add(job)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            if dedup_key is None:
+                raise
+            db.session.rollback()
+            logger.debug(f"A {kind} job with dedup key {dedup_key} is already queued")
+            return None
+        logger.info(f"Queued job {job.id} ({kind})")
+
+        self.start()
+        self._wakeup.set()
+        return job
+
+    def start(self):
+        """Start the worker threads for this process, if not already running."""
+        pid = os.getpid()
+        if self._started_pid == pid:
+            return
+
+        with self._lock:
+            # Threads do not survive a fork, so gunicorn workers start their own
+            if self._started_pid == pid:
+                return
+            self._threads = []
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker_loop,
+                                          args=(f"{socket.gethostname()}:{pid}:{i}",),
+                                          name=f"{self.name}-worker-{i}",
+                                          daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            self._started_pid = pid
+            logger.info(f"Started {self.workers} {self.name} workers in process {pid}")
+
+    def _worker_loop(self, worker_id: str):
+        """Claim and run jobs until the process exits."""
+        with app.app_context():
+            while True:
+                try:
+                    job = self._claim(worker_id)
+                except Exception as e:
+                    db.session.rollback()
+                    logger.exception(f"Error claiming job: {str(e)}")
+                    job = None
+
+                if job is None:
+                    self._wakeup.wait(self.poll_interval)
+                    self._wakeup.clear()
+                    continue
+
+                try:
+                    self._run(job)
+                finally:
+                    db.session.remove()
+
+    def _runnable(self, now: datetime):
+        """
+        Query the id, status and lock time of this queue's runnable jobs, next due first.
+
+        Args:
+            now (datetime): The current time
+
+        Returns:
+            Query: The candidates for the next claim
+        """
+        stale_before = now - timedelta(seconds=self.visibility_timeout)
+
+        query = db.session.query(Job.id, Job.status, Job.locked_at)
+        # Visibility timeouts differ per queue, so a queue only ever claims its own kinds
+        if self.kinds is not None:
+            query = query.filter(Job.kind.in_(self.kinds))
+        elif _dedicated_kinds:
+            query = query.filter(Job.kind.notin_(_dedicated_kinds))
+
+        return (query
+                .filter(or_(and_(Job.status == JobStatus.QUEUED, Job.run_after <= now),
+                            and_(Job.status == JobStatus.RUNNING, Job.locked_at < stale_before)))
+                .order_by(Job.run_after, Job.id))
+
+    def _claim(self, worker_id: str) -> Optional[Job]:
+        """
+        Atomically take the next runnable job.
+
+        A job is runnable when it is queued and due, or when it has been
+        running for longer than the visibility timeout. The conditional
+        UPDATE means only one worker, in any process, wins a given job.
+        """
+        now = datetime.utcnow()
+        candidate = self._runnable(now).first()
+        if candidate is None:
+            db.session.rollback()
+            return None
+
+        job_id, status, locked_at = candidate
+        unchanged = Job.locked_at == locked_at if locked_at is not None else Job.locked_at.is_(None)
+        claimed = db.session.execute(
+            update(Job)
+            .where(Job.id == job_id, Job.status == status, unchanged)
+            .values(status=JobStatus.RUNNING,
+                    locked_at=now,
+                    locked_by=worker_id,
+                    attempts=Job.attempts + 1,
+                    updated_at=now)
+        )
+        db.session.commit()
+
+        if claimed.rowcount != 1:
+            # Another worker got there first; poll again straight away
+            self._wakeup.set()
+            return None
+        return db.session.get(Job, job_id)
+
+    def _run(self, job: Job):
+        """
+        Run a claimed job and record its outcome.
+
+        The outcome is only written while this worker still holds the job;
+        a run that outlived its visibility timeout leaves the job to the
+        worker that took it over.
+        """
+        job_id, kind, worker_id = job.id, job.kind, job.locked_by
+        attempts, max_attempts = job.attempts, job.max_attempts
+        held = and_(Job.id == job_id, Job.locked_by == worker_id, Job.status == JobStatus.RUNNING)
+        handler = _handlers.get(kind)
+        _running.job = (job_id, worker_id)
+        try:
+            if handler is None:
+                raise ValueError(f"No handler registered for job kind: {kind}")
+            if attempts > max_attempts:
+                raise RuntimeError(f"Job exceeded {max_attempts} attempts")
+
+            result = handler(json.loads(job.payload))
+
+            done = db.session.execute(
+                update(Job)
+                .where(held)
+                .values(status=JobStatus.SUCCEEDED,
+                        result=json.dumps(result) if result is not None else None,
+                        error=None,
+                        locked_at=None,
+                        updated_at=datetime.utcnow())
+            )
+            db.session.commit()
+            if done.rowcount != 1:
+                logger.warning(f"Job {job_id} ({kind}) finished after another worker took it over")
+                return
+            logger.info(f"Job {job_id} ({kind}) succeeded on attempt {attempts}")
+
+        except JobLostError as e:
+            db.session.rollback()
+            logger.warning(f"Job {job_id} ({kind}) abandoned: {str(e)}")
+
+        except Exception as e:
+            db.session.rollback()
+            logger.exception(f"Job {job_id} ({kind}) failed on attempt {attempts}: {str(e)}")
+
+            if handler is None or attempts >= max_attempts:
+                values = {"status": JobStatus.FAILED}
+            else:
+                values = {"status": JobStatus.QUEUED,
+                          "run_after": datetime.utcnow() + timedelta(seconds=self.retry_backoff * 2 ** (attempts - 1))}
+            try:
+                db.session.execute(
+                    update(Job)
+                    .where(held)
+                    .values(error=str(e), locked_at=None, updated_at=datetime.utcnow(), **values)
+                )
+                db.session.commit()
+            except IntegrityError:
+                # A job with the same dedup key was queued meanwhile and stands in for the retry
+                db.session.rollback()
+                db.session.execute(
+                    update(Job)
+                    .where(held)
+                    .values(status=JobStatus.FAILED, error=str(e), locked_at=None, updated_at=datetime.utcnow())
+                )
+                db.session.commit()
+
+        finally:
+            _running.job = None
+
+
+# Shared by the whole process
+job_queue = JobQueue()
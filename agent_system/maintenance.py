@@ -0,0 +1,48 @@
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from models import Job
+from activity import prune_activity
+from agent_system.jobs import job_queue, job_handler
+
+logger = logging.getLogger(__name__)
+
+# Seconds between activity log prunes
+ACTIVITY_PRUNE_INTERVAL = float(os.environ.get("ACTIVITY_PRUNE_INTERVAL", "21600"))
+
+
+def schedule_activity_prune(delay: float = 0) -> Optional[Job]:
+    """
+    Queue the activity log prune unless one is already waiting.
+
+    Every worker calls this at startup and each prune queues the next. The
+    queued prune holds a fixed dedup key, so however these race only a
+    single prune chain stays alive rather than one per process.
+
+    Args:
+        delay (float): Seconds from now before the prune may run
+
+    Returns:
+        Optional[Job]: The queued job, or None if one was already queued
+    """
+    return job_queue.enqueue("prune_activity", {},
+                             run_after=datetime.utcnow() + timedelta(seconds=delay),
+                             dedup_key="prune_activity")
+
+
+@job_handler("prune_activity")
+def run_activity_prune(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Job handler deleting expired activity events, then queueing the next prune.
+
+    Args:
+        payload (Dict[str, Any]): Unused
+
+    Returns:
+        Dict[str, Any]: The number of events deleted
+    """
+    deleted = prune_activity()
+    schedule_activity_prune(ACTIVITY_PRUNE_INTERVAL)
+    return {"deleted": deleted}
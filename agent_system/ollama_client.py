@@ -1,64 +1,479 @@
 import requests
 import json
-import base64
 import logging
 import os
-from typing import Dict, List, Optional, Any
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Any, Iterator, Set
+
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from agent_system.scheduler import generation_scheduler
+from agent_system.images import encode_image_for_vision
+from agent_system.response_cache import is_deterministic, response_cache, response_cache_key
 
 logger = logging.getLogger(__name__)
 
+# Transport settings, overridable per deployment through the environment
+DEFAULT_OLLAMA_HOST = os.environ.get("OLLAMA_HOST", "http://localhost:11434")
+DEFAULT_POOL_SIZE = int(os.environ.get("OLLAMA_POOL_SIZE", "10"))
+DEFAULT_CONNECT_TIMEOUT = float(os.environ.get("OLLAMA_CONNECT_TIMEOUT", "3.05"))
+DEFAULT_READ_TIMEOUT = float(os.environ.get("OLLAMA_READ_TIMEOUT", "120"))
+DEFAULT_MAX_RETRIES = int(os.environ.get("OLLAMA_MAX_RETRIES", "3"))
+DEFAULT_RETRY_BACKOFF = float(os.environ.get("OLLAMA_RETRY_BACKOFF", "0.5"))
+# Backend pool settings: the hosts generations are spread over, how often
+# each is health-checked, and when a failing host is ejected
+OLLAMA_HOSTS = [host.strip().rstrip("/") for host in os.environ.get("OLLAMA_HOSTS", DEFAULT_OLLAMA_HOST).split(",") if host.strip()]
+OLLAMA_HEALTH_INTERVAL = float(os.environ.get("OLLAMA_HEALTH_INTERVAL", "15"))
+OLLAMA_BREAKER_THRESHOLD = int(os.environ.get("OLLAMA_BREAKER_THRESHOLD", "3"))
+OLLAMA_BREAKER_COOLDOWN = float(os.environ.get("OLLAMA_BREAKER_COOLDOWN", "30"))
+# Outstanding requests a host may have beyond another before routing prefers
+# the host with the model already loaded less than a lighter-loaded one
+OLLAMA_AFFINITY_WEIGHT = float(os.environ.get("OLLAMA_AFFINITY_WEIGHT", "2"))
+# How long Ollama keeps a model loaded after each request (Ollama's own default is 5m)
+OLLAMA_KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")
+
+
+class OllamaTransport:
+    """Pooled keep-alive HTTP transport for a single Ollama host."""
+    
+    def __init__(self,
+                 host: str = DEFAULT_OLLAMA_HOST,
+                 pool_size: int = DEFAULT_POOL_SIZE,
+                 connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout: float = DEFAULT_READ_TIMEOUT,
+                 max_retries: int = DEFAULT_MAX_RETRIES,
+                 backoff_factor: float = DEFAULT_RETRY_BACKOFF):
+        """
+        Initialize the transport.
+        
+        Args:
+            host (str): The Ollama host, e.g. http://localhost:11434
+            pool_size (int): Maximum number of open connections to the host
+            connect_timeout (float): Seconds to wait for a TCP connection
+            read_timeout (float): Seconds to wait between response bytes
+            max_retries (int): Retries for connection errors and 502/503/504
+            backoff_factor (float): Exponential backoff factor between retries
+        """
+        self.host = host.rstrip("/")
+        self.base_url = f"{self.host}/api"
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        
+        # Generations are not idempotent, so read errors are never retried;
+        # only failures that happened before Ollama accepted the request are.
+        retry = Retry(total=max_retries,
+                      connect=max_retries,
+                      read=0,
+                      status=max_retries,
+                      backoff_factor=backoff_factor,
+                      status_forcelist=(502, 503, 504),
+                      allowed_methods=frozenset({"GET", "POST"}),
+                      raise_on_status=False)
+        
+        # pool_block keeps the number of sockets per worker at pool_size;
+        # callers beyond that wait for a connection to be returned.
+        adapter = HTTPAdapter(pool_connections=1,
+                              pool_maxsize=pool_size,
+                              pool_block=True,
+                              max_retries=retry)
+        
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        logger.debug(f"Initialized OllamaTransport for {self.host} (pool size {pool_size})")
+    
+    def post_json(self, path: str, payload: Dict[str, Any], timeout: Optional[Any] = None) -> Dict[str, Any]:
+        """
+        POST a JSON payload to an Ollama API path and decode the JSON reply.
+        
+        Args:
+            path (str): The API path, e.g. /chat
+            payload (Dict[str, Any]): The request body
+            timeout (Optional[Any]): Override for the (connect, read) timeout
+        
+        Returns:
+            Dict[str, Any]: The decoded response body
+        """
+        response = self.session.post(f"{self.base_url}{path}",
+                                     json=payload,
+                                     timeout=timeout or self.timeout)
+        response.raise_for_status()
+        return response.json()
+    
+    def stream_json_lines(self, path: str, payload: Dict[str, Any], timeout: Optional[Any] = None) -> Iterator[Dict[str, Any]]:
+        """
+        POST a JSON payload and yield each object of the NDJSON response.
+        
+        The connection is returned to the pool once the stream is exhausted
+        or the generator is closed.
+        
+        Args:
+            path (str): The API path, e.g. /chat
+            payload (Dict[str, Any]): The request body
+            timeout (Optional[Any]): Override for the (connect, read) timeout
+        
+        Yields:
+            Dict[str, Any]: Each decoded line of the response
+        """
+        with self.session.post(f"{self.base_url}{path}",
+                               json=payload,
+                               timeout=timeout or self.timeout,
+                               stream=True) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if line:
+                    yield json.loads(line)
+    
+    def get_json(self, path: str, timeout: Optional[Any] = None) -> Dict[str, Any]:
+        """
+        GET an Ollama API path and decode the JSON reply.
+        
+        Args:
+            path (str): The API path, e.g. /tags
+            timeout (Optional[Any]): Override for the (connect, read) timeout
+        
+        Returns:
+            Dict[str, Any]: The decoded response body
+        """
+        response = self.session.get(f"{self.base_url}{path}", timeout=timeout or self.timeout)
+        response.raise_for_status()
+        return response.json()
+    
+    def close(self):
+        """Close all pooled connections."""
+        self.session.close()
+
+
+# One transport (and therefore one connection pool) per host per process, shared
+# by pinned clients and single-host pools
+_transports: Dict[str, OllamaTransport] = {}
+_transports_lock = threading.Lock()
+
+
+def get_transport(host: Optional[str] = None) -> OllamaTransport:
+    """
+    Get the shared transport for an Ollama host, creating it on first use.
+    
+    Args:
+        host (Optional[str]): The Ollama host; defaults to OLLAMA_HOST
+    
+    Returns:
+        OllamaTransport: The process-wide transport for the host
+    """
+    host = (host or DEFAULT_OLLAMA_HOST).rstrip("/")
+    transport = _transports.get(host)
+    if transport is None:
+        with _transports_lock:
+            transport = _transports.get(host)
+            if transport is None:
+                transport = OllamaTransport(host)
+                _transports[host] = transport
+    return transport
+
+
+def _is_host_failure(error: Exception) -> bool:
+    """Whether an error says the host is unhealthy, rather than the request being bad."""
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return True
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code >= 500
+    return False
+
+
+class OllamaBackend:
+    """Routing state, circuit breaker and counters for one host in a BackendPool."""
+    
+    def __init__(self, host: str, failover: bool = False):
+        """
+        Initialize the backend.
+        
+        Args:
+            host (str): The Ollama host, e.g. http://gpu-1:11434
+            failover (bool): Whether the pool has other hosts to fail over to
+        """
+        self.host = host.rstrip("/")
+        # With another host to move to, a host that cannot be reached or answers
+        # 502/503/504 is given up on at once instead of retried with backoff;
+        # the pool's failover is the recovery path
+        self.transport = OllamaTransport(self.host, max_retries=0) if failover else get_transport(self.host)
+        # Models the host has pulled (/api/tags); None until first checked
+        self.models: Optional[Set[str]] = None
+        # Models the host currently holds in memory (/api/ps)
+        self.loaded: Set[str] = set()
+        self.outstanding = 0
+        self.consecutive_failures = 0
+        # Monotonic time until which the circuit is open; 0 when closed
+        self.open_until = 0.0
+        self.trial_in_flight = False
+        self.requests = 0
+        self.failures = 0
+        self.busy_seconds = 0.0
+        self.last_error: Optional[str] = None
+        self.last_checked: Optional[float] = None
+    
+    def is_open(self, now: float) -> bool:
+        return self.open_until > now
+    
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        if self.is_open(now):
+            state = "open"
+        elif self.open_until:
+            state = "half_open"
+        else:
+            state = "closed"
+        return {
+            "host": self.host,
+            "circuit": state,
+            "retry_in": round(self.open_until - now, 1) if state == "open" else 0,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "avg_seconds": round(self.busy_seconds / self.requests, 3) if self.requests else None,
+            "models": sorted(self.models) if self.models is not None else None,
+            "loaded": sorted(self.loaded),
+            "last_error": self.last_error,
+            "last_checked_ago": round(now - self.last_checked, 1) if self.last_checked else None
+        }
+
+
+class BackendPool:
+    """Spreads generations over several Ollama hosts by load and model affinity."""
+    
+    def __init__(self,
+                 hosts: Optional[List[str]] = None,
+                 health_interval: float = OLLAMA_HEALTH_INTERVAL,
+                 failure_threshold: int = OLLAMA_BREAKER_THRESHOLD,
+                 cooldown: float = OLLAMA_BREAKER_COOLDOWN,
+                 affinity_weight: float = OLLAMA_AFFINITY_WEIGHT):
+        """
+        Initialize the pool.
+        
+        Args:
+            hosts (Optional[List[str]]): Ollama hosts; defaults to OLLAMA_HOSTS
+            health_interval (float): Seconds between health checks of every host
+            failure_threshold (int): Consecutive failures that open a host's circuit
+            cooldown (float): Seconds an open circuit waits before a trial request
+            affinity_weight (float): Outstanding requests a loaded model is worth when routing
+        """
+        hosts = list(dict.fromkeys(host.rstrip("/") for host in (hosts or OLLAMA_HOSTS)))
+        self.backends = [OllamaBackend(host, failover=len(hosts) > 1) for host in hosts]
+        self.health_interval = health_interval
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.affinity_weight = affinity_weight
+        self._lock = threading.Lock()
+        self._started_pid: Optional[int] = None
+    
+    def start(self):
+        """Start the health check thread for this process, if not already running."""
+        pid = os.getpid()
+        if self._started_pid == pid:
+            return
+        with self._lock:
+            # Threads do not survive a fork, so gunicorn workers start their own
+            if self._started_pid == pid:
+                return
+            threading.Thread(target=self._health_loop, name="ollama-health", daemon=True).start()
+            self._started_pid = pid
+    
+    @contextmanager
+    def lease(self, model: str, exclude: Optional[Set[str]] = None) -> Iterator[OllamaBackend]:
+        """
+        Pick a host for a request and count it as outstanding until the block exits.
+        
+        Errors raised in the block are recorded against the host; connection
+        errors, timeouts and 5xx responses count towards its circuit breaker.
+        
+        Args:
+            model (str): The model the request is for
+            exclude (Optional[Set[str]]): Hosts to avoid if any other can serve, e.g. one that just failed
+        
+        Yields:
+            OllamaBackend: The chosen host
+        """
+        self.start()
+        backend = self._acquire(model, exclude or set())
+        started = time.monotonic()
+        error = None
+        try:
+            yield backend
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._release(backend, model, time.monotonic() - started, error)
+    
+    def backends_for(self, model: str) -> List[OllamaBackend]:
+        """
+        Get the hosts that can serve a model and are not ejected.
+        
+        Args:
+            model (str): The model name
+        
+        Returns:
+            List[OllamaBackend]: The hosts
+        """
+        now = time.monotonic()
+        with self._lock:
+            return [backend for backend in self.backends
+                    if not backend.is_open(now) and (backend.models is None or model in backend.models)]
+    
+    def check_health(self):
+        """Refresh every host's model lists, counting failures towards its circuit breaker."""
+        for backend in self.backends:
+            timeout = (DEFAULT_CONNECT_TIMEOUT, 5)
+            try:
+                tags = backend.transport.get_json("/tags", timeout=timeout)
+                models = {model.get("name") for model in tags.get("models", [])}
+                try:
+                    loaded = {model.get("name") for model in backend.transport.get_json("/ps", timeout=timeout).get("models", [])}
+                except requests.HTTPError:
+                    # Older Ollama versions have no /api/ps
+                    loaded = None
+            except Exception as e:
+                self._record(backend, e)
+                logger.warning(f"Health check of {backend.host} failed: {str(e)}")
+            else:
+                with self._lock:
+                    backend.models = models
+                    if loaded is not None:
+                        backend.loaded = loaded
+                self._record(backend, None)
+            finally:
+                backend.last_checked = time.monotonic()
+    
+    def healthy(self) -> bool:
+        """Whether any host is accepting requests."""
+        now = time.monotonic()
+        return any(not backend.is_open(now) for backend in self.backends)
+    
+    def stats(self) -> List[Dict[str, Any]]:
+        """
+        Get routing state and counters per host.
+        
+        Returns:
+            List[Dict[str, Any]]: One entry per host
+        """
+        with self._lock:
+            return [backend.stats() for backend in self.backends]
+    
+    def _acquire(self, model: str, exclude: Set[str]) -> OllamaBackend:
+        """Choose the host with the lowest load, counting a loaded model as a head start."""
+        now = time.monotonic()
+        with self._lock:
+            # Closed circuits, plus one trial request to each half-open circuit
+            candidates = [backend for backend in self.backends
+                          if not backend.is_open(now) and not (backend.open_until and backend.trial_in_flight)]
+            candidates = [backend for backend in candidates if backend.host not in exclude] or candidates
+            if not candidates:
+                # Every host is ejected; try the one closest to its retry rather than fail outright
+                candidates = [min(self.backends, key=lambda backend: backend.open_until)]
+            
+            serving = [backend for backend in candidates if backend.models is None or model in backend.models]
+            backend = min(serving or candidates, key=lambda backend: (
+                backend.outstanding + (0 if model in backend.loaded else self.affinity_weight),
+                backend.requests
+            ))
+            
+            if backend.open_until:
+                backend.trial_in_flight = True
+            backend.outstanding += 1
+            return backend
+    
+    def _release(self, backend: OllamaBackend, model: str, seconds: float, error: Optional[Exception]):
+        with self._lock:
+            backend.outstanding -= 1
+            backend.requests += 1
+            backend.busy_seconds += seconds
+            backend.trial_in_flight = False
+            if error is None:
+                backend.loaded.add(model)
+            elif isinstance(error, requests.HTTPError) and error.response is not None and error.response.status_code == 404:
+                # The host does not have the model; route around it until the next health check
+                if backend.models is not None:
+                    backend.models.discard(model)
+        self._record(backend, error if error is not None and _is_host_failure(error) else None)
+    
+    def _record(self, backend: OllamaBackend, error: Optional[Exception]):
+        """Update a host's circuit breaker with the outcome of a request or health check."""
+        with self._lock:
+            if error is None:
+                if backend.open_until:
+                    logger.info(f"Ollama host {backend.host} recovered")
+                backend.consecutive_failures = 0
+                backend.open_until = 0.0
+                return
+            
+            backend.failures += 1
+            backend.consecutive_failures += 1
+            backend.last_error = str(error)
+            # A failed trial re-opens the circuit at once
+            if backend.open_until or backend.consecutive_failures >= self.failure_threshold:
+                backend.open_until = time.monotonic() + self.cooldown
+                logger.warning(f"Ejected Ollama host {backend.host} for {self.cooldown}s: {str(error)}")
+    
+    def _health_loop(self):
+        while True:
+            try:
+                self.check_health()
+            except Exception as e:
+                logger.exception(f"Error checking Ollama hosts: {str(e)}")
+            time.sleep(self.health_interval)
+
+
+# Shared by every client in this process
+backend_pool = BackendPool()
+
 
 class OllamaClient:
     """Client for interacting with Ollama API."""
     
-    def __init__(self, model: str = "llama3:8b-vision"):
+    def __init__(self, model: str = "llama3:8b-vision", host: Optional[str] = None,
+                 pool: Optional[BackendPool] = None):
         """
         Initialize the Ollama client.
         
         Args:
             model (str): The model to use
+            host (Optional[str]): Pin the client to this Ollama host instead of the backend pool
+            pool (Optional[BackendPool]): Pool to route requests through; defaults to the shared pool
         """
-        self.base_url = "http://localhost:11434/api"
+        self.pool = None if host else (pool or backend_pool)
+        self.transport = get_transport(host) if host else self.pool.backends[0].transport
+        self.base_url = self.transport.base_url
         self.model = model
         logger.debug(f"Initialized OllamaClient with model: {model}")
     
-    def generate(self, system_prompt: str, messages: List[Dict[str, str]]) -> str:
+    def generate(self, system_prompt: str, messages: List[Dict[str, str]], raise_errors: bool = False,
+                 options: Optional[Dict[str, Any]] = None) -> str:
         """
         Generate a text response from Ollama.
         
         Args:
             system_prompt (str): The system prompt
             messages (List[Dict[str, str]]): List of conversation messages
+            raise_errors (bool): Raise transport errors instead of returning an apology,
+                for internal calls whose output is not shown to the user
+            options (Optional[Dict[str, Any]]): Ollama generation options, e.g. temperature
             
         Returns:
             str: The generated text response
         """
         try:
-            # For development, use mock responses since Ollama isn't available
-            if not messages:
-                return "Hello! I'm the Fractalyx Coordinator. How can I help you today?"
-                
-            # Get the last user message
-            last_message = messages[-1].get("content", "") if messages[-1].get("role") == "user" else ""
-            
-            # Generate response based on input
-            if "help" in last_message.lower():
-                return "I'm here to help! As the Fractal Intelligence Coordinator, I can assist with project planning, task management, research, and development support. What would you like to work on today?"
-            elif "project" in last_message.lower() or "plan" in last_message.lower():
-                return "I'd be happy to help with your project! To get started, I'll need to understand your goals. Could you tell me more about what you're trying to build, and what your key requirements are?"
-            elif "task" in last_message.lower() or "ticket" in last_message.lower():
-                return "Creating tasks is a great way to organize your project. Each task should be specific, measurable, and have a clear definition of done. Would you like me to help you break down your project into manageable tasks?"
-            elif "research" in last_message.lower():
-                return "Research is crucial for informed decisions. I can help gather information on technologies, methodologies, or industry trends related to your project. What specific topic would you like me to research?"
-            elif "code" in last_message.lower() or "develop" in last_message.lower():
-                return "For development work, I can help plan the architecture, suggest technologies, and even generate code snippets. What are you trying to build?"
-            else:
-                return "I've received your message. As your Fractal Intelligence Coordinator, I'm here to help with any aspect of your project. Could you provide more specific details about what you're working on, so I can offer more targeted assistance?"
+            return self._chat(self._format_messages(system_prompt, messages), options)
         except Exception as e:
+            if raise_errors:
+                raise
             logger.exception(f"Error generating response: {str(e)}")
             return f"I apologize, but I encountered an error while processing your request. Please try again."
     
-    def generate_with_image(self, system_prompt: str, messages: List[Dict[str, str]], image_path: str) -> str:
+    def generate_with_image(self, system_prompt: str, messages: List[Dict[str, str]], image_path: str,
+                            options: Optional[Dict[str, Any]] = None, raise_errors: bool = False) -> str:
         """
         Generate a text response from Ollama, including an image.
         
@@ -66,27 +481,192 @@ class OllamaClient:
             system_prompt (str): The system prompt
             messages (List[Dict[str, str]]): List of conversation messages
             image_path (str): Path to the image file
+            options (Optional[Dict[str, Any]]): Ollama generation options
+            raise_errors (bool): Raise errors instead of returning an apology
             
         Returns:
             str: The generated text response
         """
         try:
-            # For development, return mock responses since Ollama isn't available
-            if not messages:
-                return "I can see you've shared an image with me. How can I help with this?"
-                
-            # Get the last user message
-            last_message = messages[-1].get("content", "") if messages[-1].get("role") == "user" else ""
-            
-            # Get the image filename
-            image_filename = os.path.basename(image_path)
-            
-            # Generate response based on the image and input
-            return f"I've received your image '{image_filename}'. As your Fractal Intelligence Coordinator, I can analyze this visual information to assist with your project. Could you tell me more about what you'd like me to do with this image?"
+            formatted_messages = self._format_messages(system_prompt, messages)
+            self._attach_image(formatted_messages, image_path)
+            return self._chat(formatted_messages, options)
         except Exception as e:
+            if raise_errors:
+                raise
             logger.exception(f"Error generating response with image: {str(e)}")
             return f"I apologize, but I encountered an error while processing your image. Please try again."
     
+    def generate_stream(self, system_prompt: str, messages: List[Dict[str, str]],
+                        image_path: Optional[str] = None,
+                        options: Optional[Dict[str, Any]] = None) -> Iterator[str]:
+        """
+        Generate a response from Ollama, yielding text chunks as they arrive.
+        
+        Args:
+            system_prompt (str): The system prompt
+            messages (List[Dict[str, str]]): List of conversation messages
+            image_path (Optional[str]): Path to an image file, if any
+            options (Optional[Dict[str, Any]]): Ollama generation options
+        
+        Yields:
+            str: Successive chunks of the generated text
+        """
+        produced = False
+        try:
+            formatted_messages = self._format_messages(system_prompt, messages)
+            if image_path:
+                self._attach_image(formatted_messages, image_path)
+            
+            cache_key = self._cache_key(formatted_messages, options)
+            if cache_key:
+                cached = response_cache.get(cache_key)
+                if cached is not None:
+                    yield cached
+                    return
+            
+            payload = {
+                "model": self.model,
+                "messages": formatted_messages,
+                "stream": True,
+                "keep_alive": OLLAMA_KEEP_ALIVE
+            }
+            if options:
+                payload["options"] = options
+            # The slot is held until the stream finishes or the caller closes it
+            with generation_scheduler.slot(self.model), self._backend() as transport:
+                started = time.monotonic()
+                chunks = []
+                for data in transport.stream_json_lines("/chat", payload):
+                    content = data.get("message", {}).get("content", "")
+                    if content:
+                        produced = True
+                        chunks.append(content)
+                        yield content
+                    if data.get("done"):
+                        # Only complete responses are cached
+                        if cache_key and chunks:
+                            response_cache.put(cache_key, "".join(chunks), time.monotonic() - started)
+                        break
+        except Exception as e:
+            logger.exception(f"Error streaming response: {str(e)}")
+            # A reply that already started is left truncated rather than
+            # having an apology spliced onto it
+            if not produced:
+                yield "I apologize, but I encountered an error while processing your request. Please try again."
+    
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """
+        Get embedding vectors from the /api/embed endpoint.
+        
+        Args:
+            texts (List[str]): Texts to embed in one request
+        
+        Returns:
+            List[List[float]]: One vector per text, in order
+        
+        Raises:
+            requests.RequestException: If the host fails to answer
+        """
+        payload = {
+            "model": self.model,
+            "input": texts,
+            "keep_alive": OLLAMA_KEEP_ALIVE
+        }
+        with generation_scheduler.slot(self.model), self._backend() as transport:
+            data = transport.post_json("/embed", payload)
+        embeddings = data.get("embeddings", [])
+        if len(embeddings) != len(texts):
+            raise ValueError(f"Expected {len(texts)} embeddings from {self.model}, got {len(embeddings)}")
+        return embeddings
+
+    def _attach_image(self, formatted_messages: List[Dict[str, Any]], image_path: str):
+        """
+        Attach the preprocessed, base64-encoded image to the last formatted message.
+        
+        Args:
+            formatted_messages (List[Dict[str, Any]]): Messages in Ollama format
+            image_path (str): Blob reference or path of the image file
+        """
+        # Ollama expects images on the message they belong to
+        formatted_messages[-1]["images"] = [encode_image_for_vision(image_path)]
+    
+    @contextmanager
+    def _backend(self, exclude: Optional[Set[str]] = None) -> Iterator[OllamaTransport]:
+        """Get the transport of the host that should serve the next request."""
+        if self.pool is None:
+            yield self.transport
+            return
+        with self.pool.lease(self.model, exclude) as backend:
+            yield backend.transport
+    
+    def _cache_key(self, formatted_messages: List[Dict[str, Any]],
+                   options: Optional[Dict[str, Any]]) -> Optional[str]:
+        """
+        Get the response cache key of a request, if its response may be cached.
+        
+        Args:
+            formatted_messages (List[Dict[str, Any]]): Messages in Ollama format
+            options (Optional[Dict[str, Any]]): Generation options
+        
+        Returns:
+            Optional[str]: The key, or None when sampling makes the response vary
+        """
+        if not response_cache.enabled or not is_deterministic(options):
+            return None
+        return response_cache_key(self.model, formatted_messages, options)
+    
+    def _chat(self, formatted_messages: List[Dict[str, Any]], options: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Send a non-streaming request to the /api/chat endpoint.
+        
+        Deterministic requests are answered from the response cache when possible.
+        
+        Args:
+            formatted_messages (List[Dict[str, Any]]): Messages in Ollama format
+            options (Optional[Dict[str, Any]]): Generation options
+        
+        Returns:
+            str: The content of the assistant message
+        """
+        cache_key = self._cache_key(formatted_messages, options)
+        if cache_key:
+            cached = response_cache.get(cache_key)
+            if cached is not None:
+                return cached
+        
+        payload = {
+            "model": self.model,
+            "messages": formatted_messages,
+            "stream": False,
+            "keep_alive": OLLAMA_KEEP_ALIVE
+        }
+        if options:
+            payload["options"] = options
+        # A host that refused the request or failed with a 5xx did not run the
+        # generation, so the request may move to another host once
+        attempts = 2 if self.pool is not None and len(self.pool.backends) > 1 else 1
+        failed_hosts = set()
+        for attempt in range(attempts):
+            try:
+                with generation_scheduler.slot(self.model), self._backend(failed_hosts) as transport:
+                    started = time.monotonic()
+                    data = transport.post_json("/chat", payload)
+                    elapsed = time.monotonic() - started
+                break
+            except (requests.ConnectionError, requests.HTTPError) as e:
+                # A read timeout may mean the generation is still running on the host;
+                # a connect timeout means it never started
+                if attempt + 1 == attempts or not _is_host_failure(e) or isinstance(e, requests.ReadTimeout):
+                    raise
+                failed_hosts.add(transport.host)
+                logger.warning(f"Ollama host {transport.host} failed, retrying on another host: {str(e)}")
+        content = data.get("message", {}).get("content", "")
+        
+        if cache_key and content:
+            response_cache.put(cache_key, content, elapsed)
+        return content
+    
     def _format_messages(self, system_prompt: str, messages: List[Dict[str, str]]) -> List[Dict[str, Any]]:
         """
         Format messages for the Ollama API.
@@ -105,8 +685,8 @@ class OllamaClient:
             content = message.get("content", "")
             
             # Map roles to Ollama expected format
-            if role == "assistant":
-                ollama_role = "assistant"
+            if role in ("assistant", "system"):
+                ollama_role = role
             else:
                 ollama_role = "user"
             
@@ -0,0 +1,443 @@
+#!/usr/bin/env python3
+"""
+Local stub of the Ollama HTTP API for offline development and benchmarking.
+
+The stub replays canned /api/chat responses over keep-alive HTTP/1.1, either
+as one JSON body or as chunked NDJSON when "stream" is true, so the pooled
+transport in agent_system.ollama_client can be exercised without a GPU.
+/api/generate is answered too, so model warm-up runs against the stub, and
+/api/embed returns hashed bag-of-words vectors, so texts sharing words come
+out similar and the embedding index can be exercised offline.
+
+Usage:
+    python -m agent_system.ollama_stub serve --port 11434 [--latency 0.2] [--replay responses.json]
+    python -m agent_system.ollama_stub bench --requests 500 --concurrency 12
+    python -m agent_system.ollama_stub pool-bench --hosts 3 --requests 300
+
+To try the backend pool by hand, run several stubs on different ports and
+set OLLAMA_HOSTS=http://127.0.0.1:11434,http://127.0.0.1:11435.
+
+A replay file is a JSON list of strings (returned round-robin) or a JSON
+object mapping lowercase keywords to responses (first keyword found in the
+last user message wins, "*" is the fallback).
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import logging
+import math
+import os
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Any, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# Keyword replies used when no replay file is given
+DEFAULT_RESPONSES = {
+    "help": "I'm here to help! As the Fractal Intelligence Coordinator, I can assist with project planning, task management, research, and development support. What would you like to work on today?",
+    "project": "I'd be happy to help with your project! To get started, I'll need to understand your goals. Could you tell me more about what you're trying to build, and what your key requirements are?",
+    "plan": "I'd be happy to help with your project! To get started, I'll need to understand your goals. Could you tell me more about what you're trying to build, and what your key requirements are?",
+    "task": "Creating tasks is a great way to organize your project. Each task should be specific, measurable, and have a clear definition of done. Would you like me to help you break down your project into manageable tasks?",
+    "ticket": "Creating tasks is a great way to organize your project. Each task should be specific, measurable, and have a clear definition of done. Would you like me to help you break down your project into manageable tasks?",
+    "research": "Research is crucial for informed decisions. I can help gather information on technologies, methodologies, or industry trends related to your project. What specific topic would you like me to research?",
+    "code": "For development work, I can help plan the architecture, suggest technologies, and even generate code snippets. What are you trying to build?",
+    "develop": "For development work, I can help plan the architecture, suggest technologies, and even generate code snippets. What are you trying to build?",
+    "*": "I've received your message. As your Fractal Intelligence Coordinator, I'm here to help with any aspect of your project. Could you provide more specific details about what you're working on, so I can offer more targeted assistance?"
+}
+
+DEFAULT_MODELS = ["llama3:8b", "llama3:8b-vision"]
+EMBEDDING_MODELS = ["nomic-embed-text"]
+# Length of the stub's embedding vectors
+STUB_EMBEDDING_DIM = 256
+
+
+class StubState:
+    """Shared configuration and counters for a stub server instance."""
+
+    def __init__(self,
+                 responses: Union[List[str], Dict[str, str], None] = None,
+                 models: Optional[List[str]] = None,
+                 latency: float = 0.0,
+                 token_delay: float = 0.0):
+        self.responses = responses if responses is not None else DEFAULT_RESPONSES
+        self.models = models or DEFAULT_MODELS + EMBEDDING_MODELS
+        self.latency = latency
+        self.token_delay = token_delay
+        self._cycle = itertools.cycle(self.responses) if isinstance(self.responses, list) else None
+        self._lock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+        # Models a chat or generate request has touched, reported by /api/ps
+        self.loaded = set()
+        # Answer every request with 503, like a host whose GPU has fallen over
+        self.unhealthy = False
+
+    def reply_for(self, messages: List[Dict[str, Any]]) -> str:
+        """Pick the canned reply for a chat request."""
+        if self._cycle is not None:
+            with self._lock:
+                return next(self._cycle)
+
+        last_message = ""
+        if messages and messages[-1].get("role") == "user":
+            last_message = messages[-1].get("content", "").lower()
+
+        for keyword, response in self.responses.items():
+            if keyword != "*" and keyword in last_message:
+                return response
+        return self.responses.get("*", "")
+
+    def embedding_for(self, text: str) -> List[float]:
+        """Hash each word of a text into a fixed-length vector of unit length."""
+        vector = [0.0] * STUB_EMBEDDING_DIM
+        for word in re.findall(r"\w+", text.lower()):
+            digest = hashlib.md5(word.encode("utf-8")).digest()
+            index = int.from_bytes(digest[:4], "little") % STUB_EMBEDDING_DIM
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+    def load(self, model: str):
+        with self._lock:
+            self.loaded.add(model)
+
+    def count(self, field: str):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Request handler implementing the subset of the Ollama API we use."""
+
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; with Nagle's algorithm the
+    # body waits on the client's delayed ACK, adding ~40ms to every request
+    disable_nagle_algorithm = True
+    state: StubState = None
+
+    def setup(self):
+        super().setup()
+        self.state.count("connections")
+
+    def log_message(self, format, *args):
+        logger.debug("ollama-stub: " + format, *args)
+
+    def do_GET(self):
+        self.state.count("requests")
+        if self.state.unhealthy:
+            self._send_json({"error": "unavailable"}, status=503)
+            return
+        if self.path == "/api/tags":
+            self._send_json({"models": [{"name": name, "model": name} for name in self.state.models]})
+        elif self.path == "/api/ps":
+            self._send_json({"models": [{"name": name, "model": name} for name in sorted(self.state.loaded)]})
+        elif self.path == "/api/version":
+            self._send_json({"version": "stub"})
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        self.state.count("requests")
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if self.state.unhealthy:
+            self._send_json({"error": "unavailable"}, status=503)
+            return
+
+        if self.path == "/api/chat":
+            self._handle_chat(body)
+        elif self.path == "/api/generate":
+            self._handle_generate(body)
+        elif self.path == "/api/embed":
+            self._handle_embed(body)
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def _handle_chat(self, body: Dict[str, Any]):
+        model = body.get("model", "")
+        if model not in self.state.models:
+            self._send_json({"error": f"model '{model}' not found"}, status=404)
+            return
+
+        self.state.load(model)
+        if self.state.latency:
+            time.sleep(self.state.latency)
+
+        content = self.state.reply_for(body.get("messages", []))
+        if body.get("stream", True):
+            self._stream_chat(model, content)
+            return
+
+        self._send_json({
+            "model": model,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "message": {"role": "assistant", "content": content},
+            "done": True
+        })
+
+    def _handle_generate(self, body: Dict[str, Any]):
+        """Answer /api/generate; an empty prompt only loads the model, as Ollama does."""
+        model = body.get("model", "")
+        if model not in self.state.models:
+            self._send_json({"error": f"model '{model}' not found"}, status=404)
+            return
+
+        self.state.load(model)
+        response = ""
+        if body.get("prompt"):
+            if self.state.latency:
+                time.sleep(self.state.latency)
+            response = self.state.reply_for([{"role": "user", "content": body["prompt"]}])
+
+        self._send_json({
+            "model": model,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "response": response,
+            "done": True,
+            "done_reason": "load" if not response else "stop"
+        })
+
+    def _handle_embed(self, body: Dict[str, Any]):
+        """Answer /api/embed for a single text or a list of them."""
+        model = body.get("model", "")
+        if model not in self.state.models:
+            self._send_json({"error": f"model '{model}' not found"}, status=404)
+            return
+
+        self.state.load(model)
+        texts = body.get("input", [])
+        if isinstance(texts, str):
+            texts = [texts]
+        self._send_json({
+            "model": model,
+            "embeddings": [self.state.embedding_for(text) for text in texts]
+        })
+
+    def _stream_chat(self, model: str, content: str):
+        """Send the reply word by word as chunked NDJSON, like Ollama does."""
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        created_at = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        words = content.split(" ")
+        for i, word in enumerate(words):
+            piece = word if i == len(words) - 1 else word + " "
+            self._write_chunk({
+                "model": model,
+                "created_at": created_at,
+                "message": {"role": "assistant", "content": piece},
+                "done": False
+            })
+            if self.state.token_delay:
+                time.sleep(self.state.token_delay)
+
+        self._write_chunk({
+            "model": model,
+            "created_at": created_at,
+            "message": {"role": "assistant", "content": ""},
+            "done": True
+        })
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, data: Dict[str, Any]):
+        line = json.dumps(data).encode("utf-8") + b"\n"
+        self.wfile.write(f"{len(line):X}\r\n".encode("ascii") + line + b"\r\n")
+        self.wfile.flush()
+
+    def _send_json(self, data: Dict[str, Any], status: int = 200):
+        payload = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def start_stub_server(port: int = 0,
+                      host: str = "127.0.0.1",
+                      responses: Union[List[str], Dict[str, str], None] = None,
+                      models: Optional[List[str]] = None,
+                      latency: float = 0.0,
+                      token_delay: float = 0.0) -> Tuple[ThreadingHTTPServer, StubState]:
+    """
+    Start a stub Ollama server on a background thread.
+
+    Args:
+        port (int): Port to bind; 0 picks a free port
+        host (str): Interface to bind
+        responses: Canned replies, as a round-robin list or a keyword map
+        models (Optional[List[str]]): Model names the stub reports as available
+        latency (float): Seconds to sleep before answering each chat request
+        token_delay (float): Seconds to sleep between streamed chunks
+
+    Returns:
+        Tuple[ThreadingHTTPServer, StubState]: The running server and its counters
+    """
+    state = StubState(responses=responses, models=models, latency=latency, token_delay=token_delay)
+    handler = type("BoundStubHandler", (StubHandler,), {"state": state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+
+    thread = threading.Thread(target=server.serve_forever, name="ollama-stub", daemon=True)
+    thread.start()
+    logger.info(f"Ollama stub listening on http://{host}:{server.server_address[1]}")
+    return server, state
+
+
+def run_benchmark(total_requests: int, concurrency: int, latency: float, model: str = "llama3:8b") -> Dict[str, Any]:
+    """
+    Drive an in-process stub server through the pooled OllamaClient.
+
+    Args:
+        total_requests (int): Number of chat requests to send
+        concurrency (int): Number of client threads
+        latency (float): Simulated generation latency on the stub
+        model (str): Model name to request
+
+    Returns:
+        Dict[str, Any]: Throughput, latency percentiles and connections opened
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from agent_system.ollama_client import OllamaClient
+
+    server, state = start_stub_server(latency=latency)
+    client = OllamaClient(model, host=f"http://127.0.0.1:{server.server_address[1]}")
+    timings = []
+
+    def one_call(i):
+        started = time.perf_counter()
+        client.generate("You are a benchmark.", [{"role": "user", "content": f"help {i}"}])
+        timings.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one_call, range(total_requests)))
+    elapsed = time.perf_counter() - started
+
+    server.shutdown()
+    client.transport.close()
+
+    timings.sort()
+    return {
+        "requests": total_requests,
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(total_requests / elapsed, 1),
+        "p50_ms": round(timings[len(timings) // 2] * 1000, 2),
+        "p95_ms": round(timings[int(len(timings) * 0.95) - 1] * 1000, 2),
+        "connections_opened": state.connections
+    }
+
+
+def run_pool_benchmark(hosts: int, total_requests: int, concurrency: int, latency: float) -> Dict[str, Any]:
+    """
+    Drive several in-process stub servers through a BackendPool.
+
+    The first stub only has the text model, so vision requests must avoid
+    it, and the last stub starts failing halfway through, so its circuit
+    opens and the remaining requests are routed around it.
+
+    Args:
+        hosts (int): Number of stub servers, at least 2
+        total_requests (int): Number of chat requests to send
+        concurrency (int): Number of client threads
+        latency (float): Simulated generation latency on each stub
+
+    Returns:
+        Dict[str, Any]: Requests served per stub and the pool's per-host stats
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from agent_system.ollama_client import BackendPool, OllamaClient
+
+    servers = []
+    for i in range(max(hosts, 2)):
+        models = ["llama3:8b"] if i == 0 else list(DEFAULT_MODELS)
+        servers.append(start_stub_server(models=models, latency=latency))
+
+    pool = BackendPool([f"http://127.0.0.1:{server.server_address[1]}" for server, _ in servers],
+                       health_interval=1, failure_threshold=2, cooldown=60)
+    pool.check_health()
+    clients = [OllamaClient(model, pool=pool) for model in DEFAULT_MODELS]
+
+    def one_call(i):
+        if i == total_requests // 2:
+            servers[-1][1].unhealthy = True
+        clients[i % len(clients)].generate("You are a benchmark.", [{"role": "user", "content": f"help {i}"}])
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one_call, range(total_requests)))
+    elapsed = time.perf_counter() - started
+
+    for server, _ in servers:
+        server.shutdown()
+
+    return {
+        "requests": total_requests,
+        "seconds": round(elapsed, 3),
+        "served_per_stub": [state.requests for _, state in servers],
+        "hosts": pool.stats()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub Ollama server")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve", help="Run the stub server in the foreground")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=11434)
+    serve_parser.add_argument("--latency", type=float, default=0.0)
+    serve_parser.add_argument("--token-delay", type=float, default=0.0)
+    serve_parser.add_argument("--models", default=",".join(DEFAULT_MODELS + EMBEDDING_MODELS))
+    serve_parser.add_argument("--replay", help="JSON file with canned responses")
+
+    bench_parser = subparsers.add_parser("bench", help="Benchmark the pooled transport against the stub")
+    bench_parser.add_argument("--requests", type=int, default=500)
+    bench_parser.add_argument("--concurrency", type=int, default=12)
+    bench_parser.add_argument("--latency", type=float, default=0.0)
+
+    pool_parser = subparsers.add_parser("pool-bench", help="Benchmark backend pool routing across several stubs")
+    pool_parser.add_argument("--hosts", type=int, default=3)
+    pool_parser.add_argument("--requests", type=int, default=300)
+    pool_parser.add_argument("--concurrency", type=int, default=12)
+    pool_parser.add_argument("--latency", type=float, default=0.01)
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "serve":
+        responses = None
+        if args.replay:
+            with open(args.replay) as f:
+                responses = json.load(f)
+        server, _ = start_stub_server(port=args.port,
+                                      host=args.host,
+                                      responses=responses,
+                                      models=args.models.split(","),
+                                      latency=args.latency,
+                                      token_delay=args.token_delay)
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            server.shutdown()
+    elif args.command == "pool-bench":
+        print(json.dumps(run_pool_benchmark(args.hosts, args.requests, args.concurrency, args.latency), indent=2))
+    else:
+        print(json.dumps(run_benchmark(args.requests, args.concurrency, args.latency), indent=2))
+
+
+if __name__ == "__main__":
+    if not __package__:
+        # Run as a script rather than with -m: make agent_system importable
+        sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    main()
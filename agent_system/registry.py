@@ -0,0 +1,147 @@
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from models import AgentRole, Agent
+from agent_system.agents import BaseAgent, CoordinatorAgent, PlannerAgent, ResearcherAgent, DeveloperAgent, TesterAgent, ReviewerAgent
+from app import db
+
+logger = logging.getLogger(__name__)
+
+# Seconds after which a worker reloads the agents table on its own, so agents
+# created through another gunicorn worker become visible without a restart
+REGISTRY_MAX_AGE = float(os.environ.get("AGENT_REGISTRY_MAX_AGE", "300"))
+
+AGENT_CLASS_MAP = {
+    AgentRole.COORDINATOR: CoordinatorAgent,
+    AgentRole.PLANNER: PlannerAgent,
+    AgentRole.RESEARCHER: ResearcherAgent,
+    AgentRole.DEVELOPER: DeveloperAgent,
+    AgentRole.TESTER: TesterAgent,
+    AgentRole.REVIEWER: ReviewerAgent
+}
+
+
+class AgentRegistry:
+    """Process-wide cache of agent instances built from the agents table."""
+
+    def __init__(self, max_age: float = REGISTRY_MAX_AGE):
+        """
+        Initialize the agent registry.
+
+        Args:
+            max_age (float): Seconds before the cached agents are reloaded
+        """
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        # (agents by id, coordinator agent); replaced as a whole on reload so
+        # readers never see a half-built snapshot
+        self._snapshot: Optional[Tuple[Dict[int, BaseAgent], Optional[BaseAgent]]] = None
+        self._loaded_at = 0.0
+
+    def snapshot(self) -> Tuple[Dict[int, BaseAgent], Optional[BaseAgent]]:
+        """
+        Get the current agents, loading them from the database if needed.
+
+        Returns:
+            Tuple[Dict[int, BaseAgent], Optional[BaseAgent]]: Agents keyed by ID and the coordinator agent
+        """
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - self._loaded_at < self.max_age:
+            return snapshot
+
+        with self._lock:
+            if self._snapshot is not snapshot and self._snapshot is not None:
+                return self._snapshot
+            return self._reload(snapshot)
+
+    def invalidate(self):
+        """Drop the cached agents so the next lookup reloads them."""
+        self._loaded_at = 0.0
+        logger.debug("Invalidated agent registry")
+
+    def _reload(self, previous: Optional[Tuple[Dict[int, BaseAgent], Optional[BaseAgent]]]) -> Tuple[Dict[int, BaseAgent], Optional[BaseAgent]]:
+        """
+        Rebuild the snapshot, reusing instances whose definition is unchanged.
+
+        Args:
+            previous: The snapshot being replaced, if any
+
+        Returns:
+            Tuple[Dict[int, BaseAgent], Optional[BaseAgent]]: The new snapshot
+        """
+        db_agents = Agent.query.all()
+        if not db_agents:
+            logger.info("No agents found in database. Creating default agents.")
+            self._create_default_agents()
+            db_agents = Agent.query.all()
+
+        previous_agents = previous[0] if previous else {}
+        agents = {}
+        coordinator_agent = None
+
+        for db_agent in db_agents:
+            agent_instance = previous_agents.get(db_agent.id)
+            if (agent_instance is None or agent_instance.name != db_agent.name
+                    or agent_instance.role != db_agent.role or agent_instance.model != db_agent.model):
+                agent_instance = self._create_agent_instance(db_agent)
+            agents[db_agent.id] = agent_instance
+
+            # Set the coordinator agent
+            if db_agent.role == AgentRole.COORDINATOR and coordinator_agent is None:
+                coordinator_agent = agent_instance
+
+        self._snapshot = (agents, coordinator_agent)
+        self._loaded_at = time.monotonic()
+        logger.debug(f"Loaded {len(agents)} agents into registry")
+        return self._snapshot
+
+    def _create_default_agents(self):
+        """Create default agents if none exist in the database."""
+        default_agents = [
+            {"name": "Alice", "role": AgentRole.COORDINATOR, "model": "llama3:8b-vision"},
+            {"name": "Bob", "role": AgentRole.PLANNER, "model": "llama3:8b-vision"},
+            {"name": "Charlie", "role": AgentRole.RESEARCHER, "model": "llama3:8b-vision"},
+            {"name": "Diana", "role": AgentRole.DEVELOPER, "model": "llama3:8b-vision"},
+            {"name": "Eve", "role": AgentRole.TESTER, "model": "llama3:8b-vision"},
+            {"name": "Frank", "role": AgentRole.REVIEWER, "model": "llama3:8b-vision"}
+        ]
+
+        for agent_data in default_agents:
+            agent = Agent(
+                name=agent_data["name"],
+                role=agent_data["role"],
+                model=agent_data["model"],
+                description=f"Default {agent_data['role'].value} agent"
+            )
+            db.session.add(agent)
+
+        db.session.commit()
+        logger.info("Created default agents")
+
+    def _create_agent_instance(self, db_agent: Agent) -> BaseAgent:
+        """
+        Create an agent instance based on the agent's role.
+
+        Args:
+            db_agent (Agent): The database agent model
+
+        Returns:
+            BaseAgent: An instance of the appropriate agent class
+        """
+        agent_class = AGENT_CLASS_MAP.get(db_agent.role)
+        if not agent_class:
+            raise ValueError(f"Unknown agent role: {db_agent.role}")
+
+        return agent_class(
+            agent_id=db_agent.id,
+            name=db_agent.name,
+            role=db_agent.role,
+            model=db_agent.model
+        )
+
+
+# Shared by every AgentCoordinator in this process
+agent_registry = AgentRegistry()
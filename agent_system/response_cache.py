@@ -0,0 +1,290 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Responses kept in memory per worker; 0 disables the cache
+OLLAMA_RESPONSE_CACHE_SIZE = int(os.environ.get("OLLAMA_RESPONSE_CACHE_SIZE", "256"))
+# Directory of the optional on-disk tier, shared by every worker on the host
+OLLAMA_RESPONSE_CACHE_DIR = os.environ.get("OLLAMA_RESPONSE_CACHE_DIR")
+# Seconds a cached response stays valid; 0 keeps it until evicted
+OLLAMA_RESPONSE_CACHE_TTL = float(os.environ.get("OLLAMA_RESPONSE_CACHE_TTL", "86400"))
+# Size cap of the on-disk tier in megabytes; the oldest entries go first once it is exceeded
+OLLAMA_RESPONSE_CACHE_DISK_MB = float(os.environ.get("OLLAMA_RESPONSE_CACHE_DISK_MB", "256"))
+# Seconds between sweeps of the on-disk tier by each worker
+OLLAMA_RESPONSE_CACHE_PRUNE_INTERVAL = float(os.environ.get("OLLAMA_RESPONSE_CACHE_PRUNE_INTERVAL", "600"))
+# A sweep over the cap deletes down to this fraction of it, so it does not run on every write
+DISK_LOW_WATERMARK = 0.9
+# Seconds after which a temp file that was never renamed into place is a leftover of a failed write
+DISK_TEMP_GRACE = 3600
+
+
+def is_deterministic(options: Optional[Dict[str, Any]]) -> bool:
+    """
+    Check whether generation options make the output repeatable.
+
+    Args:
+        options (Optional[Dict[str, Any]]): Ollama generation options
+
+    Returns:
+        bool: True for greedy decoding (temperature 0) or a fixed seed
+    """
+    if not options:
+        return False
+    return options.get("temperature") == 0 or options.get("seed") is not None
+
+
+def response_cache_key(model: str, formatted_messages: List[Dict[str, Any]],
+                       options: Optional[Dict[str, Any]]) -> str:
+    """
+    Build the cache key of a chat request.
+
+    Args:
+        model (str): The model name
+        formatted_messages (List[Dict[str, Any]]): Messages in Ollama format, system prompt first
+        options (Optional[Dict[str, Any]]): Generation options
+
+    Returns:
+        str: Hex digest identifying the request
+    """
+    system = formatted_messages[0]["content"] if formatted_messages and formatted_messages[0]["role"] == "system" else ""
+    history = formatted_messages[1:] if system else formatted_messages
+    parts = [
+        model,
+        hashlib.sha256(system.encode("utf-8")).hexdigest(),
+        hashlib.sha256(json.dumps(history, sort_keys=True).encode("utf-8")).hexdigest(),
+        json.dumps(options or {}, sort_keys=True),
+    ]
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Two-tier cache of generated responses: an in-memory LRU and an optional directory."""
+
+    def __init__(self,
+                 max_entries: int = OLLAMA_RESPONSE_CACHE_SIZE,
+                 directory: Optional[str] = OLLAMA_RESPONSE_CACHE_DIR,
+                 ttl: float = OLLAMA_RESPONSE_CACHE_TTL,
+                 max_disk_bytes: int = int(OLLAMA_RESPONSE_CACHE_DISK_MB * 1024 * 1024),
+                 prune_interval: float = OLLAMA_RESPONSE_CACHE_PRUNE_INTERVAL):
+        """
+        Initialize the cache.
+
+        Args:
+            max_entries (int): Responses kept in memory; 0 disables the cache
+            directory (Optional[str]): Directory of the on-disk tier, if any
+            ttl (float): Seconds a response stays valid; 0 for no expiry
+            max_disk_bytes (int): Size cap of the on-disk tier; 0 for no cap
+            prune_interval (float): Seconds between sweeps of the on-disk tier
+        """
+        self.max_entries = max_entries
+        self.directory = directory
+        self.ttl = ttl
+        self.max_disk_bytes = max_disk_bytes
+        self.prune_interval = prune_interval
+        self._last_prune = time.monotonic()
+        self._pruning = False
+        self._lock = threading.Lock()
+        # key -> (created, generation seconds, response)
+        self._entries: "OrderedDict[str, Tuple[float, float, str]]" = OrderedDict()
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "saved_seconds": 0.0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Look up a response, counting the hit or miss.
+
+        Args:
+            key (str): The request's cache key
+
+        Returns:
+            Optional[str]: The cached response, or None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry[0]):
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._counters["memory_hits"] += 1
+                self._counters["saved_seconds"] += entry[1]
+                return entry[2]
+
+        entry = self._read_disk(key)
+        with self._lock:
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+            self._counters["disk_hits"] += 1
+            self._counters["saved_seconds"] += entry[1]
+            self._store(key, entry)
+        return entry[2]
+
+    def put(self, key: str, response: str, seconds: float):
+        """
+        Store a response.
+
+        Args:
+            key (str): The request's cache key
+            response (str): The generated text
+            seconds (float): How long the generation took, reported as saved on each hit
+        """
+        entry = (time.time(), seconds, response)
+        with self._lock:
+            self._store(key, entry)
+        self._write_disk(key, entry)
+        self._maybe_prune()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get hit and miss counters.
+
+        Returns:
+            Dict[str, Any]: Counters, hit rate and generation seconds saved by hits
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            stats["entries"] = len(self._entries)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 3) if lookups else 0.0
+        stats["saved_seconds"] = round(stats["saved_seconds"], 2)
+        stats["disk"] = bool(self.directory)
+        return stats
+
+    def prune_disk(self) -> Dict[str, int]:
+        """
+        Delete expired entries and leftovers of failed writes from the on-disk
+        tier, then the oldest entries while it is over its size cap.
+
+        Every worker on a host sweeps the shared directory; a file another
+        worker deleted first is skipped.
+
+        Returns:
+            Dict[str, int]: Files removed and bytes remaining
+        """
+        if not self.directory:
+            return {"removed": 0, "bytes": 0}
+        now = time.time()
+        removed = 0
+        entries = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if not name.endswith(".json"):
+                    if now - stat.st_mtime > DISK_TEMP_GRACE:
+                        removed += self._remove(path)
+                    continue
+                # Entries are written once, so the file time is the creation time
+                if self._expired(stat.st_mtime):
+                    removed += self._remove(path)
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        if self.max_disk_bytes and total > self.max_disk_bytes:
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_disk_bytes * DISK_LOW_WATERMARK:
+                    break
+                removed += self._remove(path)
+                total -= size
+        if removed:
+            logger.info(f"Pruned {removed} response cache file(s), {total} bytes remain")
+        return {"removed": removed, "bytes": total}
+
+    def clear(self):
+        """Drop the in-memory tier."""
+        with self._lock:
+            self._entries.clear()
+
+    def _expired(self, created: float) -> bool:
+        return bool(self.ttl) and time.time() - created > self.ttl
+
+    def _store(self, key: str, entry: Tuple[float, float, str]):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _maybe_prune(self):
+        """Sweep the on-disk tier in the background once the prune interval has passed."""
+        if not self.directory:
+            return
+        with self._lock:
+            if self._pruning or time.monotonic() - self._last_prune < self.prune_interval:
+                return
+            self._pruning = True
+        threading.Thread(target=self._prune_in_background, name="response-cache-prune", daemon=True).start()
+
+    def _prune_in_background(self):
+        try:
+            self.prune_disk()
+        except Exception as e:
+            logger.exception(f"Error pruning the response cache: {str(e)}")
+        finally:
+            with self._lock:
+                self._pruning = False
+                self._last_prune = time.monotonic()
+
+    def _remove(self, path: str) -> int:
+        try:
+            os.remove(path)
+            return 1
+        except FileNotFoundError:
+            return 0
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _read_disk(self, key: str) -> Optional[Tuple[float, float, str]]:
+        if not self.directory:
+            return None
+        try:
+            with open(self._disk_path(key), "r", encoding="utf-8") as f:
+                data = json.load(f)
+            entry = (data["created"], data["seconds"], data["response"])
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable response cache entry {key}: {str(e)}")
+            return None
+        if self._expired(entry[0]):
+            self._remove(self._disk_path(key))
+            return None
+        return entry
+
+    def _write_disk(self, key: str, entry: Tuple[float, float, str]):
+        if not self.directory:
+            return
+        path = self._disk_path(key)
+        temp_path = None
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"created": entry[0], "seconds": entry[1], "response": entry[2]}, f)
+            # Atomic, so other workers never read a partial entry
+            os.replace(temp_path, path)
+        except Exception as e:
+            logger.warning(f"Could not write response cache entry {key}: {str(e)}")
+            if temp_path is not None:
+                self._remove(temp_path)
+
+
+# Shared by every client in this process
+response_cache = ResponseCache()
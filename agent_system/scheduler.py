@@ -0,0 +1,316 @@
+import contextvars
+import fcntl
+import itertools
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Maximum concurrent generations per model across the worker processes of a
+# host, e.g. OLLAMA_MODEL_CONCURRENCY="llama3:8b=2,llama3:8b-vision=1"
+DEFAULT_MAX_INFLIGHT = int(os.environ.get("OLLAMA_MAX_INFLIGHT", "2"))
+MODEL_CONCURRENCY = {
+    name.strip(): int(limit)
+    for name, _, limit in (item.partition("=") for item in os.environ.get("OLLAMA_MODEL_CONCURRENCY", "").split(","))
+    if name.strip() and limit
+}
+QUEUE_TIMEOUT = float(os.environ.get("OLLAMA_QUEUE_TIMEOUT", "300"))
+# Directory of the lock files that hold the limits across every worker process
+# on the host; set it empty to apply the limits to each process separately
+OLLAMA_SLOT_DIR = os.environ.get("OLLAMA_SLOT_DIR", os.path.join(tempfile.gettempdir(), "fractalyx-ollama-slots"))
+# Seconds between attempts to take a slot held by another process
+HOST_SLOT_POLL_INTERVAL = 0.05
+
+# Lower scores are served first. Interactive chat always outranks background
+# work; within each class, paying tiers and urgent tickets go first.
+INTERACTIVE_BASE = 0
+BACKGROUND_BASE = 100
+TIER_WEIGHTS = {"enterprise": 0, "professional": 10, "basic": 20}
+NO_TIER_WEIGHT = 30
+TICKET_PRIORITY_WEIGHTS = {"critical": 0, "high": 5, "medium": 10, "low": 15}
+# Points a waiting request gains per second, so background work cannot starve
+AGING_PER_SECOND = 1.0
+
+# Wait times are averaged with this smoothing factor for reporting
+WAIT_EWMA_ALPHA = 0.2
+
+
+class SchedulerTimeout(RuntimeError):
+    """Raised when a generation waits longer than the queue timeout for a slot."""
+
+
+def compute_priority(interactive: bool = True, tier: Any = None, ticket_priority: Any = None) -> float:
+    """
+    Compute the scheduling score for a generation request.
+
+    Args:
+        interactive (bool): True for user-facing chat, False for background work
+        tier: The customer's SubscriptionTier (or its value), if known
+        ticket_priority: The TicketPriority (or its value) of the work, if any
+
+    Returns:
+        float: The score; lower is served first
+    """
+    score = INTERACTIVE_BASE if interactive else BACKGROUND_BASE
+
+    tier_value = getattr(tier, "value", tier)
+    score += TIER_WEIGHTS.get(tier_value, NO_TIER_WEIGHT)
+
+    if ticket_priority is not None:
+        score += TICKET_PRIORITY_WEIGHTS.get(getattr(ticket_priority, "value", ticket_priority), 10)
+
+    return score
+
+
+_current_priority: contextvars.ContextVar = contextvars.ContextVar(
+    "generation_priority", default=compute_priority(interactive=True))
+
+
+@contextmanager
+def generation_priority(interactive: bool = True, tier: Any = None, ticket_priority: Any = None) -> Iterator[float]:
+    """
+    Set the scheduling priority for generations made in this context.
+
+    Args:
+        interactive (bool): True for user-facing chat, False for background work
+        tier: The customer's SubscriptionTier, if known
+        ticket_priority: The TicketPriority of the work, if any
+
+    Yields:
+        float: The computed score
+    """
+    token = _current_priority.set(compute_priority(interactive, tier, ticket_priority))
+    try:
+        yield _current_priority.get()
+    finally:
+        _current_priority.reset(token)
+
+
+class _Waiter:
+    __slots__ = ("score", "seq", "enqueued_at", "granted")
+
+    def __init__(self, score: float, seq: int):
+        self.score = score
+        self.seq = seq
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+
+    def effective_score(self, now: float) -> float:
+        return self.score - (now - self.enqueued_at) * AGING_PER_SECOND
+
+
+class _ModelLane:
+    """Slots and waiting requests for a single model."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        self.waiters: List[_Waiter] = []
+        self.granted_total = 0
+        self.timeouts_total = 0
+        # Requests of this process waiting for a slot held by another process
+        self.host_waiting = 0
+        self.avg_wait = 0.0
+        self.max_wait = 0.0
+
+
+class GenerationScheduler:
+    """Caps in-flight generations per model and grants slots by priority."""
+
+    def __init__(self, default_limit: int = DEFAULT_MAX_INFLIGHT,
+                 model_limits: Optional[Dict[str, int]] = None,
+                 queue_timeout: float = QUEUE_TIMEOUT,
+                 slot_dir: Optional[str] = OLLAMA_SLOT_DIR):
+        """
+        Initialize the scheduler.
+
+        Args:
+            default_limit (int): Concurrent generations allowed for models without an explicit limit
+            model_limits (Optional[Dict[str, int]]): Per-model concurrency limits
+            queue_timeout (float): Seconds a request may wait for a slot
+            slot_dir (Optional[str]): Lock file directory shared by the host's workers; None or empty
+                limits this process only
+        """
+        self.default_limit = default_limit
+        self.model_limits = dict(MODEL_CONCURRENCY if model_limits is None else model_limits)
+        self.queue_timeout = queue_timeout
+        self.slot_dir = slot_dir or None
+        self._condition = threading.Condition()
+        self._lanes: Dict[str, _ModelLane] = {}
+        self._seq = itertools.count()
+
+    @contextmanager
+    def slot(self, model: str, score: Optional[float] = None) -> Iterator[None]:
+        """
+        Hold a generation slot for a model for the duration of the block.
+
+        The request first wins one of this process's slots by priority, then
+        takes a host-wide slot shared with the other workers.
+
+        Args:
+            model (str): The Ollama model
+            score (Optional[float]): Scheduling score; defaults to the current generation_priority
+
+        Raises:
+            SchedulerTimeout: If no slot frees up within the queue timeout
+        """
+        deadline = time.monotonic() + self.queue_timeout
+        self.acquire(model, _current_priority.get() if score is None else score)
+        try:
+            host_slot = self._acquire_host_slot(model, deadline)
+        except BaseException:
+            self.release(model)
+            raise
+        try:
+            yield
+        finally:
+            if host_slot is not None:
+                # Closing the file drops its lock
+                os.close(host_slot)
+            self.release(model)
+
+    def acquire(self, model: str, score: float):
+        """
+        Wait for a free slot for a model.
+
+        Args:
+            model (str): The Ollama model
+            score (float): Scheduling score; lower is served first
+
+        Raises:
+            SchedulerTimeout: If no slot frees up within the queue timeout
+        """
+        with self._condition:
+            lane = self._lane(model)
+            if lane.in_flight < lane.limit and not lane.waiters:
+                lane.in_flight += 1
+                self._record_wait(lane, 0.0)
+                return
+
+            waiter = _Waiter(score, next(self._seq))
+            lane.waiters.append(waiter)
+            deadline = waiter.enqueued_at + self.queue_timeout
+
+            while not waiter.granted:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    lane.waiters.remove(waiter)
+                    lane.timeouts_total += 1
+                    raise SchedulerTimeout(f"Timed out after {self.queue_timeout}s waiting for a {model} slot")
+                self._condition.wait(remaining)
+
+            self._record_wait(lane, time.monotonic() - waiter.enqueued_at)
+
+    def release(self, model: str):
+        """
+        Return a slot and hand it to the best-scoring waiter, if any.
+
+        Args:
+            model (str): The Ollama model
+        """
+        with self._condition:
+            lane = self._lane(model)
+            lane.in_flight -= 1
+
+            if lane.waiters and lane.in_flight < lane.limit:
+                now = time.monotonic()
+                best = min(lane.waiters, key=lambda w: (w.effective_score(now), w.seq))
+                lane.waiters.remove(best)
+                best.granted = True
+                lane.in_flight += 1
+                self._condition.notify_all()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Get queue depth, slot usage and wait times per model.
+
+        Returns:
+            Dict[str, Dict[str, Any]]: Stats keyed by model name
+        """
+        with self._condition:
+            now = time.monotonic()
+            return {
+                model: {
+                    "limit": lane.limit,
+                    "in_flight": lane.in_flight,
+                    "queue_depth": len(lane.waiters),
+                    "oldest_wait_ms": round(max((now - w.enqueued_at for w in lane.waiters), default=0.0) * 1000, 1),
+                    "avg_wait_ms": round(lane.avg_wait * 1000, 1),
+                    "max_wait_ms": round(lane.max_wait * 1000, 1),
+                    "granted_total": lane.granted_total,
+                    "timeouts_total": lane.timeouts_total,
+                    "host_waiting": lane.host_waiting,
+                    "host_wide": self.slot_dir is not None
+                }
+                for model, lane in self._lanes.items()
+            }
+
+    def _acquire_host_slot(self, model: str, deadline: float) -> Optional[int]:
+        """
+        Take one of a model's host-wide slots: an exclusive lock on one of its lock files.
+
+        The kernel drops the lock if the process dies, so a crashed worker
+        never leaks a slot.
+
+        Args:
+            model (str): The Ollama model
+            deadline (float): Monotonic time after which waiting gives up
+
+        Returns:
+            Optional[int]: The locked file descriptor, or None when limits are per process
+
+        Raises:
+            SchedulerTimeout: If every slot stays taken until the deadline
+        """
+        if self.slot_dir is None:
+            return None
+        with self._condition:
+            lane = self._lane(model)
+        os.makedirs(self.slot_dir, exist_ok=True)
+        prefix = os.path.join(self.slot_dir, re.sub(r"[^\w.-]", "_", model))
+
+        waiting = False
+        try:
+            while True:
+                for index in range(lane.limit):
+                    fd = os.open(f"{prefix}.{index}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+                    try:
+                        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        return fd
+                    except BlockingIOError:
+                        os.close(fd)
+                if time.monotonic() >= deadline:
+                    with self._condition:
+                        lane.timeouts_total += 1
+                    raise SchedulerTimeout(f"Timed out after {self.queue_timeout}s waiting for a {model} slot")
+                if not waiting:
+                    waiting = True
+                    with self._condition:
+                        lane.host_waiting += 1
+                time.sleep(HOST_SLOT_POLL_INTERVAL)
+        finally:
+            if waiting:
+                with self._condition:
+                    lane.host_waiting -= 1
+
+    def _lane(self, model: str) -> _ModelLane:
+        lane = self._lanes.get(model)
+        if lane is None:
+            lane = _ModelLane(self.model_limits.get(model, self.default_limit))
+            self._lanes[model] = lane
+        return lane
+
+    def _record_wait(self, lane: _ModelLane, waited: float):
+        lane.granted_total += 1
+        lane.avg_wait += WAIT_EWMA_ALPHA * (waited - lane.avg_wait)
+        lane.max_wait = max(lane.max_wait, waited)
+
+
+# Shared by every OllamaClient in this process
+generation_scheduler = GenerationScheduler()
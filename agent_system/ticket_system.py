@@ -1,24 +1,51 @@
 import logging
-from typing import Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
 from datetime import datetime
 
+from sqlalchemy import insert, literal_column, select, update
+
 from models import Ticket, TicketStatus, TicketPriority, Comment, Agent
+from serializers import load_agents, serialize_ticket, serialize_tickets, serialize_comments, ticket_to_dict
+from activity import record_bulk_activity, record_ticket_activity
 from app import db
 
 logger = logging.getLogger(__name__)
 
+# Deepest subtask level loaded; also stops the recursion on a parent cycle
+TICKET_TREE_MAX_DEPTH = 50
+
+# Most tickets created or changed by one batch call
+TICKET_BATCH_LIMIT = 1000
+TICKET_TITLE_LENGTH = 200
+# A ticket may be changed once per batch, so each change knows the status it replaces
+DUPLICATE_TICKET_ERROR = "Ticket appears more than once in this batch"
+
+
+class TicketBatchError(ValueError):
+    """Raised when items of a batch are invalid; nothing in the batch is written."""
+
+    def __init__(self, errors: List[Dict[str, Any]]):
+        """
+        Args:
+            errors (List[Dict[str, Any]]): The index and error of each invalid item
+        """
+        super().__init__(f"{len(errors)} invalid item(s) in batch")
+        self.errors = errors
+
 
 class TicketManager:
     """Manages ticket operations for a project."""
     
-    def __init__(self, project_id: int):
+    def __init__(self, project_id: int, actor: Optional[str] = None):
         """
         Initialize the ticket manager.
         
         Args:
             project_id (int): The ID of the project
+            actor (Optional[str]): Name recorded in the activity log for changes made through this manager
         """
         self.project_id = project_id
+        self.actor = actor
         logger.debug(f"Initialized TicketManager for project {project_id}")
     
     def create_ticket(self, title: str, description: str, priority: str, 
@@ -52,6 +79,9 @@ class TicketManager:
             )
             
             db.session.add(ticket)
+            db.session.flush()
+            record_ticket_activity(ticket, "ticket.created", f"Ticket created: {title}",
+                                   f"Priority: {priority_enum.value}", actor=self.actor)
             db.session.commit()
             logger.info(f"Created ticket: {ticket.id} - {title}")
             return ticket.id
@@ -74,31 +104,64 @@ class TicketManager:
         ticket = Ticket.query.get(ticket_id)
         if not ticket:
             return None
+        
+        return serialize_ticket(ticket)
+    
+    def get_ticket_tree(self, ticket_id: int, max_depth: int = TICKET_TREE_MAX_DEPTH) -> Optional[Dict[str, Any]]:
+        """
+        Get a ticket with all of its subtasks, nested, loaded with one recursive query.
+        
+        Each node carries status counts rolled up over its whole subtree,
+        itself included.
+        
+        Args:
+            ticket_id (int): The ID of the root ticket
+            max_depth (int): Deepest subtask level to load
             
-        # Convert to dictionary
-        result = {
-            "id": ticket.id,
-            "title": ticket.title,
-            "description": ticket.description,
-            "status": ticket.status.value,
-            "priority": ticket.priority.value,
-            "created_at": ticket.created_at,
-            "updated_at": ticket.updated_at,
-            "due_date": ticket.due_date,
-            "project_id": ticket.project_id,
-            "assigned_to": None
-        }
-        
-        if ticket.assigned_agent_id:
-            agent = Agent.query.get(ticket.assigned_agent_id)
-            if agent:
-                result["assigned_to"] = {
-                    "id": agent.id,
-                    "name": agent.name,
-                    "role": agent.role.value
-                }
-        
-        return result
+        Returns:
+            Optional[Dict[str, Any]]: The root ticket with nested 'subtasks', or None if not found
+        """
+        tree = (select(Ticket.id, literal_column("0").label("depth"))
+                .where(Ticket.id == ticket_id, Ticket.project_id == self.project_id)
+                .cte("ticket_tree", recursive=True))
+        tree = tree.union_all(
+            select(Ticket.id, tree.c.depth + 1)
+            .join(tree, Ticket.parent_ticket_id == tree.c.id)
+            .where(tree.c.depth < max_depth)
+        )
+        # Parents come before their subtasks, so every node finds its parent already built
+        tickets = (Ticket.query
+                   .join(tree, Ticket.id == tree.c.id)
+                   .order_by(tree.c.depth, Ticket.id)
+                   .all())
+        if not tickets:
+            return None
+        
+        agents = load_agents(ticket.assigned_agent_id for ticket in tickets)
+        nodes: Dict[int, Dict[str, Any]] = {}
+        for ticket in tickets:
+            if ticket.id in nodes:
+                # Seen again through a parent cycle
+                continue
+            node = ticket_to_dict(ticket, agents)
+            node['parent_ticket_id'] = ticket.parent_ticket_id
+            node['subtasks'] = []
+            node['status_counts'] = {status.value: 0 for status in TicketStatus}
+            node['status_counts'][ticket.status.value] = 1
+            if nodes:
+                nodes[ticket.parent_ticket_id]['subtasks'].append(node)
+            nodes[ticket.id] = node
+        
+        # Deepest nodes first, so each subtree is complete before it is added to its parent
+        ordered = list(nodes.values())
+        for node in reversed(ordered[1:]):
+            parent_counts = nodes[node['parent_ticket_id']]['status_counts']
+            for status, count in node['status_counts'].items():
+                parent_counts[status] += count
+        for node in ordered:
+            node['subtask_count'] = sum(node['status_counts'].values()) - 1
+        
+        return ordered[0]
     
     def get_all_tickets(self, status: Optional[str] = None) -> List[Dict]:
         """
@@ -116,32 +179,7 @@ class TicketManager:
             status_enum = getattr(TicketStatus, status.upper())
             query = query.filter_by(status=status_enum)
         
-        tickets = query.all()
-        result = []
-        
-        for ticket in tickets:
-            ticket_data = {
-                "id": ticket.id,
-                "title": ticket.title,
-                "status": ticket.status.value,
-                "priority": ticket.priority.value,
-                "created_at": ticket.created_at,
-                "due_date": ticket.due_date,
-                "assigned_to": None
-            }
-            
-            if ticket.assigned_agent_id:
-                agent = Agent.query.get(ticket.assigned_agent_id)
-                if agent:
-                    ticket_data["assigned_to"] = {
-                        "id": agent.id,
-                        "name": agent.name,
-                        "role": agent.role.value
-                    }
-            
-            result.append(ticket_data)
-        
-        return result
+        return serialize_tickets(query.all())
     
     def update_ticket(self, ticket_id: int, **kwargs) -> bool:
         """
@@ -171,6 +209,9 @@ class TicketManager:
                     
                     setattr(ticket, key, value)
             
+            record_ticket_activity(ticket, "ticket.updated", f"Ticket updated: {ticket.title}",
+                                   f"Status: {ticket.status.value}, Priority: {ticket.priority.value}",
+                                   actor=self.actor)
             db.session.commit()
             logger.info(f"Updated ticket: {ticket_id}")
             return True
@@ -201,6 +242,8 @@ class TicketManager:
             
             ticket.assigned_agent_id = agent_id
             ticket.status = TicketStatus.IN_PROGRESS
+            record_ticket_activity(ticket, "ticket.assigned", f"Ticket assigned: {ticket.title}",
+                                   f"Assigned to {agent.name}", actor=self.actor)
             db.session.commit()
             logger.info(f"Assigned ticket {ticket_id} to agent {agent_id}")
             return True
@@ -237,6 +280,8 @@ class TicketManager:
             )
             
             db.session.add(comment)
+            record_ticket_activity(ticket, "comment.created", f"Comment on: {ticket.title}",
+                                   content, actor=self.actor if not is_user else "user")
             db.session.commit()
             logger.info(f"Added comment to ticket {ticket_id}")
             return comment.id
@@ -263,7 +308,10 @@ class TicketManager:
                 logger.error(f"Ticket {ticket_id} not found")
                 return False
             
+            previous_status = ticket.status
             ticket.status = status
+            record_ticket_activity(ticket, "ticket.status_changed", f"Ticket updated: {ticket.title}",
+                                   f"Status: {previous_status.value} -> {status.value}", actor=self.actor)
             db.session.commit()
             logger.info(f"Updated ticket {ticket_id} status to {status.value}")
             return True
@@ -273,6 +321,259 @@ class TicketManager:
             logger.exception(f"Error updating ticket {ticket_id} status: {str(e)}")
             return False
     
+    def create_tickets(self, items: List[Dict[str, Any]],
+                       before_commit: Optional[Callable[[List[int]], None]] = None) -> List[Dict[str, Any]]:
+        """
+        Create many tickets in one transaction.
+        
+        The whole batch is validated before anything is written; if any item
+        is invalid nothing is created. Tickets are inserted with one
+        multi-row statement per subtask level, so a subtask may name an
+        earlier item of the batch as its parent with parent_index.
+        
+        Args:
+            items (List[Dict[str, Any]]): Tickets with title and optionally description,
+                priority, due_date, and parent_ticket_id or parent_index
+            before_commit (Optional[Callable[[List[int]], None]]): Called with the new IDs,
+                in batch order, inside the transaction; raise to create nothing
+        
+        Returns:
+            List[Dict[str, Any]]: The index and ID of each created ticket, in batch order
+        
+        Raises:
+            TicketBatchError: If any item is invalid, with the error of each item
+        """
+        rows, depths = self._validate_new_tickets(items)
+        
+        try:
+            now = datetime.utcnow()
+            ids: List[Optional[int]] = [None] * len(rows)
+            # Parents are inserted a level before their subtasks, so their IDs are known
+            for depth in range(max(depths, default=-1) + 1):
+                level = [index for index, item_depth in enumerate(depths) if item_depth == depth]
+                values = []
+                for index in level:
+                    row = dict(rows[index], project_id=self.project_id, status=TicketStatus.OPEN,
+                               assigned_agent_id=None, created_at=now, updated_at=now)
+                    parent_index = row.pop('parent_index')
+                    if parent_index is not None:
+                        row['parent_ticket_id'] = ids[parent_index]
+                    values.append(row)
+                # Batched into multi-row inserts on Postgres; SQLite cannot order
+                # RETURNING rows, so SQLAlchemy sends them one by one there, still
+                # within the single transaction
+                inserted = db.session.execute(
+                    insert(Ticket).returning(Ticket.id, sort_by_parameter_order=True),
+                    values
+                ).scalars().all()
+                for index, ticket_id in zip(level, inserted):
+                    ids[index] = ticket_id
+            
+            record_bulk_activity("ticket.created", "ticket",
+                                 [(ids[index], f"Ticket created: {row['title']}", f"Priority: {row['priority'].value}")
+                                  for index, row in enumerate(rows)],
+                                 self.project_id, f"{len(rows)} tickets created", actor=self.actor)
+            if before_commit:
+                before_commit(ids)
+            db.session.commit()
+            logger.info(f"Created {len(rows)} tickets in project {self.project_id}")
+            return [{'index': index, 'id': ticket_id} for index, ticket_id in enumerate(ids)]
+        
+        except Exception as e:
+            db.session.rollback()
+            logger.exception(f"Error creating tickets in bulk: {str(e)}")
+            raise
+    
+    def update_ticket_statuses(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Change the status of many tickets in one transaction.
+        
+        Args:
+            items (List[Dict[str, Any]]): ticket_id and status of each change
+        
+        Returns:
+            List[Dict[str, Any]]: The index, ticket ID, previous and new status of each change
+        
+        Raises:
+            TicketBatchError: If any item is invalid or repeats a ticket; nothing is changed
+        """
+        _check_batch_size(items)
+        tickets = self._load_batch_tickets(items)
+        
+        errors: List[Optional[str]] = []
+        changes = []
+        seen = set()
+        for item in items:
+            ticket_id = item.get('ticket_id') if isinstance(item, dict) else None
+            status = _parse_enum(TicketStatus, item.get('status')) if isinstance(item, dict) else None
+            if ticket_id not in tickets:
+                errors.append("Ticket not found in this project")
+            elif ticket_id in seen:
+                errors.append(DUPLICATE_TICKET_ERROR)
+            elif status is None:
+                errors.append(f"Invalid status: {item.get('status')}")
+            else:
+                errors.append(None)
+                changes.append((ticket_id, status))
+            seen.add(ticket_id)
+        _raise_batch_errors(errors)
+        
+        try:
+            now = datetime.utcnow()
+            db.session.execute(update(Ticket), [
+                {'id': ticket_id, 'status': status, 'updated_at': now}
+                for ticket_id, status in changes
+            ])
+            record_bulk_activity("ticket.status_changed", "ticket",
+                                 [(ticket_id, f"Ticket updated: {tickets[ticket_id][0]}",
+                                   f"Status: {tickets[ticket_id][1].value} -> {status.value}")
+                                  for ticket_id, status in changes],
+                                 self.project_id, f"{len(changes)} tickets updated", actor=self.actor)
+            db.session.commit()
+            logger.info(f"Updated the status of {len(changes)} tickets in project {self.project_id}")
+            return [
+                {'index': index, 'ticket_id': ticket_id,
+                 'previous_status': tickets[ticket_id][1].value, 'status': status.value}
+                for index, (ticket_id, status) in enumerate(changes)
+            ]
+        
+        except Exception as e:
+            db.session.rollback()
+            logger.exception(f"Error updating ticket statuses in bulk: {str(e)}")
+            raise
+    
+    def assign_tickets(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Assign many tickets to agents in one transaction.
+        
+        As with assign_ticket, open tickets move to in progress.
+        
+        Args:
+            items (List[Dict[str, Any]]): ticket_id and agent_id of each assignment
+        
+        Returns:
+            List[Dict[str, Any]]: The index, ticket ID, agent ID and status of each assignment
+        
+        Raises:
+            TicketBatchError: If any item is invalid or repeats a ticket; nothing is changed
+        """
+        _check_batch_size(items)
+        tickets = self._load_batch_tickets(items)
+        agent_ids = {item.get('agent_id') for item in items if isinstance(item, dict)}
+        agents = dict(db.session.query(Agent.id, Agent.name)
+                      .filter(Agent.id.in_([agent_id for agent_id in agent_ids if isinstance(agent_id, int)]))
+                      .all())
+        
+        errors: List[Optional[str]] = []
+        assignments = []
+        seen = set()
+        for item in items:
+            ticket_id = item.get('ticket_id') if isinstance(item, dict) else None
+            agent_id = item.get('agent_id') if isinstance(item, dict) else None
+            if ticket_id not in tickets:
+                errors.append("Ticket not found in this project")
+            elif ticket_id in seen:
+                errors.append(DUPLICATE_TICKET_ERROR)
+            elif agent_id not in agents:
+                errors.append(f"Agent not found: {agent_id}")
+            else:
+                errors.append(None)
+                previous_status = tickets[ticket_id][1]
+                status = TicketStatus.IN_PROGRESS if previous_status == TicketStatus.OPEN else previous_status
+                assignments.append((ticket_id, agent_id, status))
+            seen.add(ticket_id)
+        _raise_batch_errors(errors)
+        
+        try:
+            now = datetime.utcnow()
+            db.session.execute(update(Ticket), [
+                {'id': ticket_id, 'assigned_agent_id': agent_id, 'status': status, 'updated_at': now}
+                for ticket_id, agent_id, status in assignments
+            ])
+            record_bulk_activity("ticket.assigned", "ticket",
+                                 [(ticket_id, f"Ticket assigned: {tickets[ticket_id][0]}", f"Assigned to {agents[agent_id]}")
+                                  for ticket_id, agent_id, _ in assignments],
+                                 self.project_id, f"{len(assignments)} tickets assigned", actor=self.actor)
+            db.session.commit()
+            logger.info(f"Assigned {len(assignments)} tickets in project {self.project_id}")
+            return [
+                {'index': index, 'ticket_id': ticket_id, 'agent_id': agent_id,
+                 'agent_name': agents[agent_id], 'status': status.value}
+                for index, (ticket_id, agent_id, status) in enumerate(assignments)
+            ]
+        
+        except Exception as e:
+            db.session.rollback()
+            logger.exception(f"Error assigning tickets in bulk: {str(e)}")
+            raise
+    
+    def _validate_new_tickets(self, items: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[int]]:
+        """
+        Check a batch of new tickets and convert it to insert rows.
+        
+        Returns:
+            Tuple[List[Dict[str, Any]], List[int]]: The rows, and each item's subtask depth within the batch
+        """
+        _check_batch_size(items)
+        
+        parent_ids = {item.get('parent_ticket_id') for item in items
+                      if isinstance(item, dict) and isinstance(item.get('parent_ticket_id'), int)}
+        existing = {ticket_id for (ticket_id,) in db.session.query(Ticket.id)
+                    .filter(Ticket.project_id == self.project_id, Ticket.id.in_(parent_ids))} if parent_ids else set()
+        
+        rows, depths, errors = [], [], []
+        for index, item in enumerate(items):
+            row, depth, error = None, 0, None
+            if not isinstance(item, dict):
+                error = "Each ticket must be an object"
+            elif not isinstance(item.get('title'), str) or not item['title'].strip():
+                error = "Ticket title is required"
+            elif len(item['title']) > TICKET_TITLE_LENGTH:
+                error = f"Ticket title is longer than {TICKET_TITLE_LENGTH} characters"
+            elif _parse_enum(TicketPriority, item.get('priority', 'MEDIUM')) is None:
+                error = f"Invalid priority: {item.get('priority')}"
+            elif item.get('parent_ticket_id') is not None and item.get('parent_index') is not None:
+                error = "Give either parent_ticket_id or parent_index, not both"
+            elif item.get('parent_ticket_id') is not None and item['parent_ticket_id'] not in existing:
+                error = f"Parent ticket not found in this project: {item['parent_ticket_id']}"
+            elif item.get('parent_index') is not None and not (
+                    isinstance(item['parent_index'], int) and 0 <= item['parent_index'] < index):
+                error = "parent_index must refer to an earlier ticket in the batch"
+            else:
+                try:
+                    due_date = _parse_due_date(item.get('due_date'))
+                except ValueError:
+                    error = "Invalid date format for due_date"
+                else:
+                    parent_index = item.get('parent_index')
+                    if parent_index is not None:
+                        depth = depths[parent_index] + 1
+                    row = {
+                        'title': item['title'],
+                        'description': item.get('description', ''),
+                        'priority': _parse_enum(TicketPriority, item.get('priority', 'MEDIUM')),
+                        'due_date': due_date,
+                        'parent_ticket_id': item.get('parent_ticket_id'),
+                        'parent_index': parent_index
+                    }
+            rows.append(row)
+            depths.append(depth)
+            errors.append(error)
+        
+        _raise_batch_errors(errors)
+        return rows, depths
+    
+    def _load_batch_tickets(self, items: List[Dict[str, Any]]) -> Dict[int, Tuple[str, TicketStatus]]:
+        """Title and status of the project's tickets named in a batch, in one query."""
+        ticket_ids = [item.get('ticket_id') for item in items
+                      if isinstance(item, dict) and isinstance(item.get('ticket_id'), int)]
+        if not ticket_ids:
+            return {}
+        rows = (db.session.query(Ticket.id, Ticket.title, Ticket.status)
+                .filter(Ticket.project_id == self.project_id, Ticket.id.in_(set(ticket_ids)))
+                .all())
+        return {ticket_id: (title, status) for ticket_id, title, status in rows}
+    
     def get_ticket_comments(self, ticket_id: int) -> List[Dict]:
         """
         Get all comments for a ticket.
@@ -289,26 +590,33 @@ class TicketManager:
             return []
         
         comments = Comment.query.filter_by(ticket_id=ticket_id).order_by(Comment.created_at).all()
-        result = []
-        
-        for comment in comments:
-            comment_data = {
-                "id": comment.id,
-                "content": comment.content,
-                "created_at": comment.created_at,
-                "is_user": comment.is_user,
-                "agent": None
-            }
-            
-            if comment.agent_id:
-                agent = Agent.query.get(comment.agent_id)
-                if agent:
-                    comment_data["agent"] = {
-                        "id": agent.id,
-                        "name": agent.name,
-                        "role": agent.role.value
-                    }
-            
-            result.append(comment_data)
-        
-        return result
+        return serialize_comments(comments)
+
+
+def _check_batch_size(items: Any):
+    if not isinstance(items, list) or not items:
+        raise TicketBatchError([{'index': None, 'error': "A non-empty list of items is required"}])
+    if len(items) > TICKET_BATCH_LIMIT:
+        raise TicketBatchError([{'index': None, 'error': f"At most {TICKET_BATCH_LIMIT} items per batch"}])
+
+
+def _raise_batch_errors(errors: List[Optional[str]]):
+    invalid = [{'index': index, 'error': error} for index, error in enumerate(errors) if error]
+    if invalid:
+        raise TicketBatchError(invalid)
+
+
+def _parse_enum(enum_class, value: Any):
+    """The member of a ticket enum named by a string in any case, or None."""
+    if not isinstance(value, str):
+        return None
+    return enum_class.__members__.get(value.upper())
+
+
+def _parse_due_date(value: Any) -> Optional[datetime]:
+    if not value:
+        return None
+    if not isinstance(value, str):
+        raise ValueError("due_date must be an ISO 8601 string")
+    # Replace 'Z' with '+00:00' for valid timezone format
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
@@ -1,12 +1,12 @@
 import logging
-import os
-import base64
 import re
 from typing import Optional, Dict, List, Any
 from datetime import datetime
 import random
 import string
 
+from blob_store import BlobStore, blob_store
+
 logger = logging.getLogger(__name__)
 
 
@@ -25,35 +25,24 @@ def generate_unique_id(prefix: str = "") -> str:
     return f"{prefix}{timestamp}{random_str}"
 
 
-def save_uploaded_image(image_data: str, upload_dir: str = "uploads") -> Optional[str]:
+def save_uploaded_image(image_data: str, store: Optional[BlobStore] = None) -> Optional[str]:
     """
-    Save an uploaded image and return the path.
+    Save an uploaded image in the blob store and return its reference.
+    
+    The base64 data is decoded and written a chunk at a time, and an image
+    that was uploaded before is stored only once.
     
     Args:
-        image_data (str): Base64-encoded image data
-        upload_dir (str): Directory to save the image in
+        image_data (str): Base64-encoded image data, optionally as a data URL
+        store (Optional[BlobStore]): Store to save into, the shared store by default
         
     Returns:
-        Optional[str]: Path to the saved image, or None if saving failed
+        Optional[str]: The blob reference, or None if saving failed
     """
     try:
-        # Create the upload directory if it doesn't exist
-        os.makedirs(upload_dir, exist_ok=True)
-        
-        # Extract the base64 data
-        if "base64," in image_data:
-            image_data = image_data.split("base64,")[1]
-        
-        # Generate a filename
-        filename = f"{generate_unique_id('img_')}.jpg"
-        filepath = os.path.join(upload_dir, filename)
-        
-        # Decode and save the image
-        with open(filepath, "wb") as f:
-            f.write(base64.b64decode(image_data))
-        
-        logger.info(f"Saved uploaded image to {filepath}")
-        return filepath
+        ref = (store or blob_store).put_base64(image_data)
+        logger.info(f"Saved uploaded image as {ref}")
+        return ref
         
     except Exception as e:
         logger.exception(f"Error saving uploaded image: {str(e)}")
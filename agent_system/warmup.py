@@ -0,0 +1,184 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from agent_system.ollama_client import DEFAULT_CONNECT_TIMEOUT, OLLAMA_KEEP_ALIVE, backend_pool
+from models import ActivityEvent, Agent
+from app import app, db
+
+logger = logging.getLogger(__name__)
+
+# Load every agent model when a worker starts
+OLLAMA_WARMUP = os.environ.get("OLLAMA_WARMUP", "true").lower() in ("1", "true", "yes")
+# Seconds between re-pings of models in use, shorter than the keep_alive
+OLLAMA_WARMUP_INTERVAL = float(os.environ.get("OLLAMA_WARMUP_INTERVAL", "600"))
+# Models are kept loaded while any project had activity this recently
+OLLAMA_ACTIVE_WINDOW = float(os.environ.get("OLLAMA_ACTIVE_WINDOW", "3600"))
+# Seconds allowed for loading a model from disk into GPU memory
+OLLAMA_LOAD_TIMEOUT = float(os.environ.get("OLLAMA_LOAD_TIMEOUT", "600"))
+# Seconds before retrying a model that failed to load
+OLLAMA_WARMUP_RETRY = 30
+
+
+class ModelWarmer:
+    """Loads agent models ahead of traffic and keeps models in use resident."""
+
+    def __init__(self, interval: float = OLLAMA_WARMUP_INTERVAL,
+                 keep_alive: str = OLLAMA_KEEP_ALIVE,
+                 active_window: float = OLLAMA_ACTIVE_WINDOW):
+        """
+        Initialize the warmer.
+
+        Args:
+            interval (float): Seconds between re-pings
+            keep_alive (str): How long Ollama keeps a model loaded after a request, e.g. "30m"
+            active_window (float): Seconds of inactivity after which models are no longer re-pinged
+        """
+        self.interval = interval
+        self.keep_alive = keep_alive
+        self.active_window = active_window
+        self._lock = threading.Lock()
+        self._models: Dict[str, Dict[str, Any]] = {}
+        self._started_pid: Optional[int] = None
+        self._initial_done = False
+
+    def start(self):
+        """Start the warm-up thread for this process, if not already running."""
+        pid = os.getpid()
+        if self._started_pid == pid:
+            return
+        with self._lock:
+            # Threads do not survive a fork, so gunicorn workers start their own
+            if self._started_pid == pid:
+                return
+            self._models = {}
+            self._initial_done = False
+            threading.Thread(target=self._run, name="model-warmer", daemon=True).start()
+            self._started_pid = pid
+
+    def warm(self, model: str) -> bool:
+        """
+        Load a model into memory on every host that serves it, with an empty generation.
+
+        Args:
+            model (str): The model name
+
+        Returns:
+            bool: True if the model is loaded on at least one host
+        """
+        if not self.is_ready(model):
+            self._set(model, status="loading")
+        started = time.monotonic()
+        hosts, errors = [], []
+        backends = backend_pool.backends_for(model)
+        for backend in backends:
+            try:
+                # An empty prompt makes Ollama load the model and return immediately
+                backend.transport.post_json("/generate", {
+                    "model": model,
+                    "prompt": "",
+                    "stream": False,
+                    "keep_alive": self.keep_alive
+                }, timeout=(DEFAULT_CONNECT_TIMEOUT, OLLAMA_LOAD_TIMEOUT))
+                hosts.append(backend.host)
+                backend.loaded.add(model)
+            except Exception as e:
+                logger.warning(f"Could not warm up model {model} on {backend.host}: {str(e)}")
+                errors.append(f"{backend.host}: {str(e)}")
+
+        if not hosts:
+            if backends:
+                self._set(model, status="failed", hosts=[], error="; ".join(errors))
+            else:
+                # No reachable host lists the model, so no worker can load it; it
+                # is retried, but does not hold readiness back
+                self._set(model, status="unavailable", hosts=[], error="No host serves this model")
+            return False
+
+        seconds = round(time.monotonic() - started, 2)
+        self._set(model, status="ready", hosts=hosts, error="; ".join(errors) or None,
+                  last_ping=datetime.utcnow(), load_seconds=seconds)
+        logger.info(f"Model {model} warm on {len(hosts)} host(s) ({seconds}s)")
+        return True
+
+    def is_ready(self, model: str) -> bool:
+        with self._lock:
+            return self._models.get(model, {}).get("status") == "ready"
+
+    def readiness(self) -> Dict[str, Any]:
+        """
+        Get whether this worker has finished warming up, and each model's state.
+
+        A worker is ready once every model a host serves is loaded, and at
+        least one is. Models no host serves are reported as unavailable.
+
+        Returns:
+            Dict[str, Any]: ready flag and per-model status
+        """
+        with self._lock:
+            models = {name: dict(state) for name, state in self._models.items()}
+            initial_done = self._initial_done
+        return {
+            "enabled": OLLAMA_WARMUP,
+            # A worker with warm-up disabled never holds traffic back
+            "ready": not OLLAMA_WARMUP or (initial_done and all(m["status"] in ("ready", "unavailable")
+                                                                for m in models.values())
+                                           and any(m["status"] == "ready" for m in models.values())),
+            "models": models
+        }
+
+    def _set(self, model: str, **fields):
+        with self._lock:
+            self._models.setdefault(model, {"status": "pending"}).update(fields)
+
+    def _run(self):
+        with app.app_context():
+            try:
+                # Learn which hosts have which models before loading them
+                backend_pool.check_health()
+                models = self._agent_models()
+                for model in models:
+                    self._set(model, status="pending")
+                for model in models:
+                    self.warm(model)
+            except Exception as e:
+                logger.exception(f"Error during model warm-up: {str(e)}")
+            finally:
+                db.session.remove()
+                with self._lock:
+                    self._initial_done = True
+
+            while True:
+                # Models that failed to load are retried sooner, until they come up
+                with self._lock:
+                    retry = [name for name, state in self._models.items() if state["status"] != "ready"]
+                time.sleep(min(self.interval, OLLAMA_WARMUP_RETRY) if retry else self.interval)
+                try:
+                    for model in sorted(set(self._active_models()) | set(retry)):
+                        self.warm(model)
+                except Exception as e:
+                    logger.exception(f"Error re-pinging models: {str(e)}")
+                finally:
+                    db.session.remove()
+
+    def _agent_models(self) -> List[str]:
+        """Every distinct model configured on an agent."""
+        rows = db.session.query(Agent.model).filter(Agent.model.isnot(None)).distinct().all()
+        return sorted(row[0] for row in rows)
+
+    def _active_models(self) -> List[str]:
+        """The agent models worth keeping loaded: all of them while any project is active."""
+        since = datetime.utcnow() - timedelta(seconds=self.active_window)
+        active = (db.session.query(ActivityEvent.id)
+                  .filter(ActivityEvent.created_at >= since, ActivityEvent.project_id.isnot(None))
+                  .first())
+        # Every project's coordinator uses every registered agent, so any
+        # active project needs all agent models
+        return self._agent_models() if active else []
+
+
+# Shared by the whole process
+model_warmer = ModelWarmer()
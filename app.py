@@ -6,6 +6,8 @@ from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
 
+from migrations import AUTO_MIGRATE, run_migrations
+
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -43,6 +45,10 @@ with app.app_context():
     # Create tables with proper dependency order
     db.create_all()
     logger.info("Database tables created successfully")
+    
+    # create_all only adds missing tables; migrations bring existing ones up to date
+    if AUTO_MIGRATE:
+        run_migrations(db.engine, db.metadata)
 
 # Import and register routes
 from routes.main_routes import main_bp
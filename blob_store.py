@@ -0,0 +1,198 @@
+import base64
+import hashlib
+import logging
+import os
+import re
+import tempfile
+from typing import BinaryIO, Iterable, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# Root directory of the content-addressed store
+BLOB_STORE_DIR = os.environ.get("BLOB_STORE_DIR", os.path.join("uploads", "blobs"))
+
+# Bytes read, hashed and written per step, so uploads never sit whole in memory
+BLOB_CHUNK_SIZE = 64 * 1024
+
+# Prefix marking a stored reference such as Message.image_path as a blob digest
+BLOB_REF_PREFIX = "sha256:"
+
+_DIGEST_RE = re.compile(r"^[0-9a-f]{64}$")
+
+# Leading bytes of the image formats accepted for chat uploads
+_IMAGE_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+
+
+class BlobStore:
+    """Stores files once per distinct content, named by their SHA-256 digest."""
+
+    def __init__(self, root: str = BLOB_STORE_DIR):
+        """
+        Initialize the store.
+
+        Args:
+            root (str): Directory holding the blobs
+        """
+        self.root = root
+
+    def put_stream(self, stream: BinaryIO, chunk_size: int = BLOB_CHUNK_SIZE) -> str:
+        """
+        Store the content of a binary stream.
+
+        Args:
+            stream (BinaryIO): The stream to read until EOF
+            chunk_size (int): Bytes read per step
+
+        Returns:
+            str: The blob reference, "sha256:<hex digest>"
+        """
+        return self.put_chunks(iter(lambda: stream.read(chunk_size), b""))
+
+    def put_base64(self, data: str) -> str:
+        """
+        Store base64-encoded content, optionally given as a data URL.
+
+        Args:
+            data (str): The base64 text
+
+        Returns:
+            str: The blob reference
+        """
+        if "base64," in data:
+            data = data[data.index("base64,") + len("base64,"):]
+        return self.put_chunks(_decode_base64_chunks(data))
+
+    def put_chunks(self, chunks: Iterable[bytes]) -> str:
+        """
+        Store content given as a sequence of byte chunks.
+
+        The content is hashed while it is written to a temporary file, which
+        is then moved into place. If a blob with the same digest already
+        exists the temporary file is discarded, so each content is kept once.
+
+        Args:
+            chunks (Iterable[bytes]): The content
+
+        Returns:
+            str: The blob reference
+        """
+        staging = os.path.join(self.root, "tmp")
+        os.makedirs(staging, exist_ok=True)
+
+        digest = hashlib.sha256()
+        fd, temp_path = tempfile.mkstemp(dir=staging)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    digest.update(chunk)
+                    f.write(chunk)
+
+            hex_digest = digest.hexdigest()
+            path = self.path(hex_digest)
+            if os.path.exists(path):
+                os.remove(temp_path)
+                logger.info(f"Blob {hex_digest} already stored")
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                # Atomic, so readers never see a partly written blob
+                os.replace(temp_path, path)
+                logger.info(f"Stored blob {hex_digest}")
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        return BLOB_REF_PREFIX + hex_digest
+
+    def path(self, digest: str) -> str:
+        """
+        Get the file path of a blob, sharded two levels deep by digest prefix.
+
+        Args:
+            digest (str): The hex digest
+
+        Returns:
+            str: The path, whether or not the blob exists
+        """
+        if not _DIGEST_RE.match(digest):
+            raise ValueError(f"Invalid blob digest: {digest}")
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def exists(self, digest: str) -> bool:
+        return os.path.exists(self.path(digest))
+
+
+# Shared by the whole process
+blob_store = BlobStore()
+
+
+def blob_digest(ref: Optional[str]) -> Optional[str]:
+    """
+    Get the digest from a blob reference.
+
+    Args:
+        ref (Optional[str]): A stored reference, e.g. Message.image_path
+
+    Returns:
+        Optional[str]: The hex digest, or None if the reference is not a blob
+    """
+    if ref and ref.startswith(BLOB_REF_PREFIX):
+        return ref[len(BLOB_REF_PREFIX):]
+    return None
+
+
+def resolve_path(ref: str) -> str:
+    """
+    Get the file path for a stored reference.
+
+    References saved before the blob store existed are plain file paths
+    and are returned unchanged.
+
+    Args:
+        ref (str): A blob reference or a file path
+
+    Returns:
+        str: The file path
+    """
+    digest = blob_digest(ref)
+    return blob_store.path(digest) if digest else ref
+
+
+def sniff_image_type(path: str) -> str:
+    """
+    Guess an image's MIME type from its first bytes.
+
+    Args:
+        path (str): The file path
+
+    Returns:
+        str: The MIME type, or application/octet-stream if unrecognised
+    """
+    with open(path, "rb") as f:
+        head = f.read(16)
+    for signature, mimetype in _IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return mimetype
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return "application/octet-stream"
+
+
+def _decode_base64_chunks(data: str, chunk_size: int = BLOB_CHUNK_SIZE) -> Iterator[bytes]:
+    """Decode base64 text a slice at a time, ignoring embedded whitespace."""
+    carry = ""
+    for start in range(0, len(data), chunk_size):
+        text = carry + "".join(data[start:start + chunk_size].split())
+        # Only whole 4-character groups can be decoded independently
+        usable = len(text) - len(text) % 4
+        carry = text[usable:]
+        if usable:
+            yield base64.b64decode(text[:usable], validate=True)
+    if carry:
+        # Tolerate missing padding at the very end
+        yield base64.b64decode(carry + "=" * (-len(carry) % 4), validate=True)
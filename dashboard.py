@@ -0,0 +1,160 @@
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import case, event, func, select
+from sqlalchemy.orm import Session
+
+from models import Project, Ticket, ActivityEvent, TicketStatus
+from activity import get_activity
+from app import db
+
+logger = logging.getLogger(__name__)
+
+# Seconds a user's dashboard is served from memory; writes in this process
+# invalidate it sooner, writes in other workers are picked up on expiry
+DASHBOARD_CACHE_TTL = float(os.environ.get("DASHBOARD_CACHE_TTL", "30"))
+DASHBOARD_CACHE_SIZE = 1024
+
+# Number of entries shown in the recent activity feed
+ACTIVITY_LIMIT = 7
+DESCRIPTION_LENGTH = 100
+
+# Writes to these models change what the dashboard shows; every change that
+# appears in the activity feed writes an ActivityEvent in the same commit
+_DASHBOARD_MODELS = (Project, Ticket, ActivityEvent)
+
+
+class DashboardCache:
+    """Short-lived per-user cache of computed dashboard data."""
+
+    def __init__(self, ttl: float = DASHBOARD_CACHE_TTL, max_entries: int = DASHBOARD_CACHE_SIZE):
+        """
+        Initialize the cache.
+
+        Args:
+            ttl (float): Seconds an entry stays valid
+            max_entries (int): Number of users kept before the cache is reset
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: Dict[int, Tuple[float, Dict[str, Any]]] = {}
+
+    def get(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Get a user's cached dashboard data, if still fresh.
+
+        Args:
+            user_id (int): The customer ID
+
+        Returns:
+            Optional[Dict[str, Any]]: The cached data, or None
+        """
+        with self._lock:
+            entry = self._entries.get(user_id)
+        if entry is None or time.monotonic() - entry[0] > self.ttl:
+            return None
+        return entry[1]
+
+    def set(self, user_id: int, data: Dict[str, Any]):
+        """
+        Store a user's dashboard data.
+
+        Args:
+            user_id (int): The customer ID
+            data (Dict[str, Any]): The computed dashboard data
+        """
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._entries.clear()
+            self._entries[user_id] = (time.monotonic(), data)
+
+    def invalidate(self):
+        """Drop every cached dashboard."""
+        with self._lock:
+            self._entries.clear()
+
+
+# Shared by every request in this process
+dashboard_cache = DashboardCache()
+
+
+def get_dashboard_data(user_id: int) -> Dict[str, Any]:
+    """
+    Get the ticket statistics and recent activity shown on a user's dashboard.
+
+    Args:
+        user_id (int): The customer ID
+
+    Returns:
+        Dict[str, Any]: Counts, completion percentage and recent activities
+    """
+    data = dashboard_cache.get(user_id)
+    if data is None:
+        data = _ticket_stats()
+        data['recent_activities'] = _recent_activities()
+        dashboard_cache.set(user_id, data)
+    return data
+
+
+def _ticket_stats() -> Dict[str, Any]:
+    """Count projects and tickets by status in a single query."""
+    project_count = select(func.count(Project.id)).scalar_subquery()
+    row = db.session.query(
+        project_count,
+        func.count(case((Ticket.status == TicketStatus.OPEN, 1))),
+        func.count(case((Ticket.status == TicketStatus.IN_PROGRESS, 1))),
+        func.count(case((Ticket.status == TicketStatus.COMPLETED, 1)))
+    ).select_from(Ticket).one()
+
+    projects, open_tickets, in_progress_tickets, completed_tickets = row
+    total_tickets = open_tickets + in_progress_tickets + completed_tickets
+
+    return {
+        'project_count': projects,
+        'open_ticket_count': open_tickets,
+        'in_progress_ticket_count': in_progress_tickets,
+        'completed_ticket_count': completed_tickets,
+        'completed_percentage': int(completed_tickets / total_tickets * 100) if total_tickets else 0
+    }
+
+
+def _recent_activities(limit: int = ACTIVITY_LIMIT) -> List[Dict[str, str]]:
+    """Get the newest entries of the activity log, a single indexed range scan."""
+    return [_format_activity(item) for item in get_activity(limit=limit)]
+
+
+def _format_activity(item: ActivityEvent) -> Dict[str, str]:
+    """Turn an activity event into the dict the dashboard template renders."""
+    return {
+        'type': item.subject_type,
+        'title': item.summary,
+        'description': _truncate(item.detail) if item.detail else '',
+        'time': item.created_at.strftime('%Y-%m-%d %H:%M')
+    }
+
+
+def _truncate(text: str) -> str:
+    return text[:DESCRIPTION_LENGTH] + '...' if len(text) > DESCRIPTION_LENGTH else text
+
+
+@event.listens_for(Session, "after_flush")
+def _note_dashboard_writes(session, flush_context):
+    """Remember whether a flush touched anything the dashboard shows."""
+    if any(isinstance(obj, _DASHBOARD_MODELS) for obj in (*session.new, *session.dirty, *session.deleted)):
+        session.info['dashboard_dirty'] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_dashboard_on_commit(session):
+    """Drop cached dashboards once a relevant write is committed."""
+    if session.info.pop('dashboard_dirty', False):
+        dashboard_cache.invalidate()
+
+
+@event.listens_for(Session, "after_rollback")
+def _reset_dashboard_writes(session):
+    session.info.pop('dashboard_dirty', None)
@@ -0,0 +1,202 @@
+import json
+import logging
+import os
+import queue
+import threading
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+try:
+    import redis
+except ImportError:  # Only needed when EVENT_BROKER_URL is set
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+# Redis URL used to fan events out to every worker, e.g. redis://localhost:6379/0.
+# Without it events only reach subscribers connected to the same process.
+EVENT_BROKER_URL = os.environ.get("EVENT_BROKER_URL")
+EVENT_BROKER_CHANNEL = os.environ.get("EVENT_BROKER_CHANNEL", "fractalyx:events")
+
+# Events buffered per subscriber; a client that falls this far behind is told to resync
+SUBSCRIBER_QUEUE_SIZE = 256
+
+# Channel every event is published to, in addition to its project and conversation
+ALL_CHANNEL = "all"
+
+
+def project_channel(project_id: int) -> str:
+    return f"project:{project_id}"
+
+
+def conversation_channel(conversation_id: int) -> str:
+    return f"conversation:{conversation_id}"
+
+
+class Subscription:
+    """A subscriber's buffered view of the channels it listens to."""
+
+    def __init__(self, channels: Set[str], max_size: int = SUBSCRIBER_QUEUE_SIZE):
+        self.channels = channels
+        self.overflowed = False
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=max_size)
+
+    def get(self, timeout: float) -> Optional[Dict[str, Any]]:
+        """
+        Wait for the next event.
+
+        Args:
+            timeout (float): Seconds to wait
+
+        Returns:
+            Optional[Dict[str, Any]]: The event, or None on timeout
+        """
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def _offer(self, event: Dict[str, Any]):
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            # Never block the publisher on a slow client
+            self.overflowed = True
+
+
+class EventBus:
+    """In-process publish/subscribe hub, optionally bridged across workers by a broker."""
+
+    def __init__(self, broker_url: Optional[str] = EVENT_BROKER_URL):
+        """
+        Initialize the event bus.
+
+        Args:
+            broker_url (Optional[str]): Redis URL for cross-process delivery, if any
+        """
+        self._lock = threading.Lock()
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        self._broker = RedisBroker(broker_url, self._deliver) if broker_url else None
+
+    def subscribe(self, channels: Iterable[str]) -> Subscription:
+        """
+        Start receiving events published to any of the given channels.
+
+        Args:
+            channels (Iterable[str]): Channel names
+
+        Returns:
+            Subscription: The subscription; pass it to unsubscribe when done
+        """
+        subscription = Subscription(set(channels))
+        with self._lock:
+            for channel in subscription.channels:
+                self._subscribers.setdefault(channel, set()).add(subscription)
+        if self._broker:
+            self._broker.start()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        """
+        Stop a subscription.
+
+        Args:
+            subscription (Subscription): The subscription
+        """
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscribers.get(channel)
+                if subscribers:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[channel]
+
+    def publish(self, channels: Iterable[str], event: Dict[str, Any]):
+        """
+        Deliver an event to subscribers of any of the channels.
+
+        Args:
+            channels (Iterable[str]): Channel names
+            event (Dict[str, Any]): JSON-serializable event
+        """
+        channels = list(channels)
+        self._deliver(channels, event)
+        if self._broker:
+            self._broker.publish(channels, event)
+
+    def subscriber_count(self) -> int:
+        """Number of distinct local subscriptions."""
+        with self._lock:
+            return len({sub for subs in self._subscribers.values() for sub in subs})
+
+    def _deliver(self, channels: List[str], event: Dict[str, Any]):
+        """Hand an event to each matching local subscriber once."""
+        with self._lock:
+            targets = set()
+            for channel in channels:
+                targets.update(self._subscribers.get(channel, ()))
+        for subscription in targets:
+            subscription._offer(event)
+
+
+class RedisBroker:
+    """Relays events between processes through a Redis pub/sub channel."""
+
+    def __init__(self, url: str, deliver, channel: str = EVENT_BROKER_CHANNEL):
+        """
+        Initialize the broker adapter.
+
+        Args:
+            url (str): Redis URL
+            deliver: Callback taking (channels, event) for events from other processes
+            channel (str): Redis channel shared by all workers
+        """
+        if redis is None:
+            raise RuntimeError("EVENT_BROKER_URL is set but the redis package is not installed")
+        self.url = url
+        self.channel = channel
+        self.deliver = deliver
+        self.client = None
+        # Lets the listener skip events this process already delivered locally
+        self.origin = None
+        self._lock = threading.Lock()
+        self._started_pid: Optional[int] = None
+
+    def publish(self, channels: List[str], event: Dict[str, Any]):
+        self.start()
+        try:
+            self.client.publish(self.channel, json.dumps(
+                {"origin": self.origin, "channels": channels, "event": event}, default=str))
+        except Exception as e:
+            logger.exception(f"Error publishing event to broker: {str(e)}")
+
+    def start(self):
+        """Connect and start the listener thread for this process, if not already done."""
+        pid = os.getpid()
+        if self._started_pid == pid:
+            return
+        with self._lock:
+            if self._started_pid == pid:
+                return
+            # Gunicorn forks workers after import; each needs its own connection and origin
+            self.client = redis.Redis.from_url(self.url)
+            self.origin = uuid.uuid4().hex
+            threading.Thread(target=self._listen, name="event-broker", daemon=True).start()
+            self._started_pid = pid
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                for message in pubsub.listen():
+                    data = json.loads(message["data"])
+                    if data.get("origin") != self.origin:
+                        self.deliver(data["channels"], data["event"])
+            except Exception as e:
+                logger.exception(f"Event broker connection lost, reconnecting: {str(e)}")
+                threading.Event().wait(1)
+
+
+# Shared by the whole process
+event_bus = EventBus()
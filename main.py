@@ -22,6 +22,25 @@ try:
         # Initialize agents on startup
         create_default_agents()
         logger.info("Agent initialization complete")
+        
+        # Start the background job workers for this process
+        from agent_system.jobs import job_queue
+        from agent_system.executor import ticket_queue
+        from agent_system.coordinator import analysis_queue
+        from agent_system.maintenance import schedule_activity_prune
+        job_queue.start()
+        ticket_queue.start()
+        analysis_queue.start()
+        schedule_activity_prune()
+        
+        # Load the agent models in the background so the first user does not wait for them
+        from agent_system.warmup import OLLAMA_WARMUP, model_warmer
+        if OLLAMA_WARMUP:
+            model_warmer.start()
+        
+        # Keep this host's embedding index up to date for agent retrieval
+        from agent_system.embeddings import embedding_index
+        embedding_index.start()
 except Exception as e:
     logger.error(f"Error initializing: {str(e)}")
 
@@ -0,0 +1,242 @@
+import logging
+import os
+from datetime import datetime
+from typing import Callable, List, Tuple
+
+from sqlalchemy import MetaData, insert, inspect, select, text, update
+from sqlalchemy.engine import Connection, Engine
+
+logger = logging.getLogger(__name__)
+
+# Run pending migrations when the app starts. Disable to run them as a
+# separate deploy step with `python migrations.py`.
+AUTO_MIGRATE = os.environ.get("AUTO_MIGRATE", "true").lower() in ("1", "true", "yes")
+
+# Key for the Postgres advisory lock that lets only one worker migrate at a time
+MIGRATION_LOCK_ID = 7270412
+
+MigrationFn = Callable[[Connection, MetaData], None]
+
+MIGRATIONS: List[Tuple[str, MigrationFn]] = []
+
+
+def migration(version: str) -> Callable[[MigrationFn], MigrationFn]:
+    """
+    Register a migration. Migrations run once each, in registration order.
+
+    Args:
+        version (str): Unique, never reused version name
+
+    Returns:
+        Callable: A decorator registering the migration
+    """
+    def decorator(func: MigrationFn) -> MigrationFn:
+        MIGRATIONS.append((version, func))
+        return func
+    return decorator
+
+
+def create_indexes(connection: Connection, metadata: MetaData, *names: str):
+    """
+    Create indexes declared on the models if they do not exist yet.
+
+    On Postgres the indexes are built CONCURRENTLY, so writes to the table
+    are not blocked while an index builds on a live deployment.
+
+    Args:
+        connection (Connection): An autocommit connection
+        metadata (MetaData): The models' metadata holding the index definitions
+        *names (str): Names of the indexes to create
+    """
+    indexes = {index.name: index for table in metadata.tables.values() for index in table.indexes}
+    quote = connection.dialect.identifier_preparer.quote
+    postgres = connection.dialect.name == "postgresql"
+
+    for name in names:
+        index = indexes[name]
+        columns = ", ".join(quote(column.name) for column in index.columns)
+        unique = "UNIQUE " if index.unique else ""
+        where = index.dialect_options[connection.dialect.name].get("where")
+        where = f" WHERE {where}" if where is not None else ""
+
+        if postgres:
+            # A concurrent build that was interrupted leaves an invalid index
+            # behind, which IF NOT EXISTS would otherwise skip forever
+            invalid = connection.execute(text(
+                "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                "WHERE c.relname = :name AND NOT i.indisvalid"
+            ), {"name": name}).first()
+            if invalid:
+                logger.warning(f"Rebuilding invalid index {name}")
+                connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {quote(name)}"))
+
+        concurrently = "CONCURRENTLY " if postgres else ""
+        connection.execute(text(
+            f"CREATE {unique}INDEX {concurrently}IF NOT EXISTS {quote(name)} "
+            f"ON {quote(index.table.name)} ({columns}){where}"
+        ))
+        logger.info(f"Ensured index {name}")
+
+
+def run_migrations(engine: Engine, metadata: MetaData):
+    """
+    Apply every migration not yet recorded in schema_migrations.
+
+    Args:
+        engine (Engine): The database engine
+        metadata (MetaData): The models' metadata
+    """
+    with engine.connect() as connection:
+        connection.execution_options(isolation_level="AUTOCOMMIT")
+        postgres = connection.dialect.name == "postgresql"
+
+        if postgres:
+            # Every gunicorn worker runs this at startup; the others wait here
+            connection.execute(text("SELECT pg_advisory_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+        try:
+            connection.execute(text(
+                "CREATE TABLE IF NOT EXISTS schema_migrations ("
+                "version VARCHAR(100) PRIMARY KEY, "
+                "applied_at TIMESTAMP NOT NULL)"
+            ))
+            applied = {row[0] for row in connection.execute(text("SELECT version FROM schema_migrations"))}
+
+            for version, func in MIGRATIONS:
+                if version in applied:
+                    continue
+                logger.info(f"Applying migration {version}")
+                func(connection, metadata)
+                connection.execute(
+                    text("INSERT INTO schema_migrations (version, applied_at) VALUES (:version, :applied_at)"),
+                    {"version": version, "applied_at": datetime.utcnow()}
+                )
+        finally:
+            if postgres:
+                connection.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": MIGRATION_LOCK_ID})
+
+
+@migration("0001_hot_path_indexes")
+def add_hot_path_indexes(connection: Connection, metadata: MetaData):
+    """Index the columns the API, dashboard and job workers filter and sort on."""
+    create_indexes(
+        connection, metadata,
+        "ix_projects_updated_at_id",
+        "ix_tickets_project_id_status",
+        "ix_tickets_project_id_updated_at",
+        "ix_tickets_status",
+        "ix_tickets_updated_at",
+        "ix_tickets_assigned_agent_id",
+        "ix_tickets_parent_ticket_id",
+        "ix_checkpoints_project_id",
+        "ix_checkpoint_ticket_ticket_id",
+        "ix_messages_conversation_id_id",
+        "ix_messages_conversation_id_timestamp",
+        "ix_messages_timestamp",
+        "ix_conversations_project_id_updated_at",
+        "ix_conversations_updated_at",
+        "ix_comments_ticket_id_created_at",
+        "ix_jobs_status_run_after",
+        "ix_jobs_project_id",
+        "ix_subscriptions_customer_id_active",
+    )
+
+
+@migration("0002_seed_activity_events")
+def seed_activity_events(connection: Connection, metadata: MetaData):
+    """Seed the new activity log from recent rows so feeds are not empty after upgrading."""
+    events = metadata.tables["activity_events"]
+    projects = metadata.tables["projects"]
+    tickets = metadata.tables["tickets"]
+    messages = metadata.tables["messages"]
+    conversations = metadata.tables["conversations"]
+    seed = 50
+
+    if connection.execute(select(events.c.id).limit(1)).first():
+        return
+
+    rows = []
+    for project in connection.execute(select(projects).order_by(projects.c.created_at.desc()).limit(seed)):
+        rows.append({
+            "created_at": project.created_at, "kind": "project.created",
+            "project_id": project.id, "subject_type": "project", "subject_id": project.id,
+            "summary": f"Project created: {project.name}"[:200],
+            "detail": (project.description or "No description")[:255]
+        })
+    for ticket in connection.execute(select(tickets).order_by(tickets.c.updated_at.desc()).limit(seed)):
+        rows.append({
+            "created_at": ticket.updated_at, "kind": "ticket.updated",
+            "project_id": ticket.project_id, "subject_type": "ticket", "subject_id": ticket.id,
+            "summary": f"Ticket updated: {ticket.title}"[:200],
+            "detail": f"Status: {ticket.status.value}, Priority: {ticket.priority.value}"
+        })
+    replies = (select(messages.c.timestamp, messages.c.content, conversations.c.id, conversations.c.title,
+                      conversations.c.project_id)
+               .join(conversations, conversations.c.id == messages.c.conversation_id)
+               .where(messages.c.is_user.is_(False))
+               .order_by(messages.c.timestamp.desc())
+               .limit(seed))
+    for reply in connection.execute(replies):
+        rows.append({
+            "created_at": reply.timestamp, "kind": "message.created",
+            "project_id": reply.project_id, "subject_type": "conversation", "subject_id": reply.id,
+            "summary": f"New message in '{reply.title or 'Untitled'}'"[:200],
+            "detail": reply.content[:255]
+        })
+
+    rows = [row for row in rows if row["created_at"] is not None]
+    if rows:
+        # Insert oldest first so ids follow time, as they do for live events
+        rows.sort(key=lambda row: row["created_at"])
+        connection.execute(insert(events), rows)
+        logger.info(f"Seeded {len(rows)} activity events")
+
+
+@migration("0003_move_uploads_to_blob_store")
+def move_uploads_to_blob_store(connection: Connection, metadata: MetaData):
+    """Copy images saved by file name into the blob store and point messages at their digests."""
+    from blob_store import BLOB_REF_PREFIX, blob_store
+
+    messages = metadata.tables["messages"]
+    rows = connection.execute(
+        select(messages.c.id, messages.c.image_path)
+        .where(messages.c.image_path.is_not(None), ~messages.c.image_path.startswith(BLOB_REF_PREFIX))
+    ).all()
+
+    moved = 0
+    for message_id, image_path in rows:
+        if not os.path.isfile(image_path):
+            logger.warning(f"Image {image_path} of message {message_id} is missing, leaving it as is")
+            continue
+        with open(image_path, "rb") as f:
+            ref = blob_store.put_stream(f)
+        connection.execute(update(messages).where(messages.c.id == message_id).values(image_path=ref))
+        moved += 1
+
+    # The original files are left in place; remove them once the upgrade is verified
+    if moved:
+        logger.info(f"Moved {moved} uploaded images into the blob store")
+
+
+
+@migration("0004_full_text_search")
+def add_full_text_search(connection: Connection, metadata: MetaData):
+    """Index ticket, comment and message text for /api/search, filling it from existing rows."""
+    from search import create_search_index
+
+    create_search_index(connection)
+
+
+@migration("0005_job_dedup_key")
+def add_job_dedup_key(connection: Connection, metadata: MetaData):
+    """Let a job kind keep at most one queued job, such as the activity prune chain."""
+    if "dedup_key" not in {column["name"] for column in inspect(connection).get_columns("jobs")}:
+        connection.execute(text("ALTER TABLE jobs ADD COLUMN dedup_key VARCHAR(100)"))
+    create_indexes(connection, metadata, "ix_jobs_dedup_key_queued")
+
+
+if __name__ == "__main__":
+    from app import app, db
+
+    with app.app_context():
+        run_migrations(db.engine, db.metadata)
+        logger.info("Migrations complete")
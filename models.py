@@ -28,6 +28,13 @@ class TicketPriority(Enum):
     CRITICAL = "critical"
 
 
+class JobStatus(Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
 class SubscriptionTier(Enum):
     BASIC = "basic"
     PROFESSIONAL = "professional"
@@ -36,6 +43,9 @@ class SubscriptionTier(Enum):
 
 class Project(db.Model):
     __tablename__ = 'projects'
+    __table_args__ = (
+        db.Index('ix_projects_updated_at_id', 'updated_at', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -91,6 +101,14 @@ class Agent(db.Model):
 
 class Ticket(db.Model):
     __tablename__ = 'tickets'
+    __table_args__ = (
+        db.Index('ix_tickets_project_id_status', 'project_id', 'status'),
+        db.Index('ix_tickets_project_id_updated_at', 'project_id', 'updated_at'),
+        db.Index('ix_tickets_status', 'status'),
+        db.Index('ix_tickets_updated_at', 'updated_at'),
+        db.Index('ix_tickets_assigned_agent_id', 'assigned_agent_id'),
+        db.Index('ix_tickets_parent_ticket_id', 'parent_ticket_id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
@@ -154,6 +172,9 @@ class Ticket(db.Model):
 
 class Checkpoint(db.Model):
     __tablename__ = 'checkpoints'
+    __table_args__ = (
+        db.Index('ix_checkpoints_project_id', 'project_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(200), nullable=False)
@@ -186,11 +207,19 @@ checkpoint_ticket = db.Table(
     db.Column('ticket_id',
               db.Integer,
               db.ForeignKey('tickets.id'),
-              primary_key=True))
+              primary_key=True),
+    # The primary key leads with checkpoint_id; this covers lookups by ticket
+    db.Index('ix_checkpoint_ticket_ticket_id', 'ticket_id'))
 
 
 class Message(db.Model):
     __tablename__ = 'messages'
+    __table_args__ = (
+        # Keyset pagination and context rehydration walk messages by id
+        db.Index('ix_messages_conversation_id_id', 'conversation_id', 'id'),
+        db.Index('ix_messages_conversation_id_timestamp', 'conversation_id', 'timestamp'),
+        db.Index('ix_messages_timestamp', 'timestamp'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text, nullable=False)
@@ -211,6 +240,10 @@ class Message(db.Model):
 
 class Conversation(db.Model):
     __tablename__ = 'conversations'
+    __table_args__ = (
+        db.Index('ix_conversations_project_id_updated_at', 'project_id', 'updated_at'),
+        db.Index('ix_conversations_updated_at', 'updated_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200))
@@ -234,8 +267,28 @@ class Conversation(db.Model):
         return f"<Conversation {self.id}: {self.title}>"
 
 
+class ConversationSummary(db.Model):
+    __tablename__ = 'conversation_summaries'
+
+    conversation_id = db.Column(db.Integer,
+                                db.ForeignKey('conversations.id'),
+                                primary_key=True)
+    summary = db.Column(db.Text, nullable=False, default="")
+    # Newest message ID folded into the summary; later messages are replayed
+    summarized_through_id = db.Column(db.Integer, nullable=True)
+    updated_at = db.Column(db.DateTime,
+                           default=datetime.utcnow,
+                           onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<ConversationSummary {self.conversation_id} through {self.summarized_through_id}>"
+
+
 class Comment(db.Model):
     __tablename__ = 'comments'
+    __table_args__ = (
+        db.Index('ix_comments_ticket_id_created_at', 'ticket_id', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text, nullable=False)
@@ -252,6 +305,77 @@ class Comment(db.Model):
         return f"<Comment {self.id} on Ticket {self.ticket_id}>"
 
 
+class Job(db.Model):
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        # Workers claim by status and due time
+        db.Index('ix_jobs_status_run_after', 'status', 'run_after'),
+        db.Index('ix_jobs_project_id', 'project_id'),
+        # At most one queued job per dedup key
+        db.Index('ix_jobs_dedup_key_queued', 'dedup_key', unique=True,
+                 postgresql_where=db.text("status = 'QUEUED'"),
+                 sqlite_where=db.text("status = 'QUEUED'")),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default="{}")
+    status = db.Column(db.Enum(JobStatus),
+                       default=JobStatus.QUEUED,
+                       nullable=False)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    max_attempts = db.Column(db.Integer, default=3, nullable=False)
+    result = db.Column(db.Text, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    run_after = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    locked_at = db.Column(db.DateTime, nullable=True)
+    locked_by = db.Column(db.String(100), nullable=True)
+    dedup_key = db.Column(db.String(100), nullable=True)
+    created_at = db.Column(db.DateTime,
+                           default=datetime.utcnow,
+                           nullable=False)
+    updated_at = db.Column(db.DateTime,
+                           default=datetime.utcnow,
+                           onupdate=datetime.utcnow,
+                           nullable=False)
+
+    # Foreign keys
+    project_id = db.Column(db.Integer,
+                           db.ForeignKey('projects.id'),
+                           nullable=True)
+
+    def __repr__(self):
+        return f"<Job {self.id}: {self.kind} ({self.status.value})>"
+
+
+class ActivityEvent(db.Model):
+    """Append-only log of changes, newest last; rows are never updated."""
+    __tablename__ = 'activity_events'
+    __table_args__ = (
+        # Feeds page backwards by id, which is also insertion order
+        db.Index('ix_activity_events_project_id_id', 'project_id', 'id'),
+        db.Index('ix_activity_events_subject', 'subject_type', 'subject_id', 'id'),
+        db.Index('ix_activity_events_created_at', 'created_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    created_at = db.Column(db.DateTime,
+                           default=datetime.utcnow,
+                           nullable=False)
+    # Dotted event name, e.g. "ticket.created" or "message.created"
+    kind = db.Column(db.String(40), nullable=False)
+    # Plain columns rather than foreign keys, so the log outlives what it describes
+    project_id = db.Column(db.Integer, nullable=True)
+    subject_type = db.Column(db.String(20), nullable=False)
+    subject_id = db.Column(db.Integer, nullable=True)
+    actor = db.Column(db.String(100), nullable=True)
+    summary = db.Column(db.String(200), nullable=False)
+    detail = db.Column(db.String(255), nullable=True)
+
+    def __repr__(self):
+        return f"<ActivityEvent {self.id}: {self.kind} {self.subject_type} {self.subject_id}>"
+
+
 class Customer(db.Model):
     __tablename__ = 'customers'
     
@@ -280,6 +404,9 @@ class Customer(db.Model):
 
 class Subscription(db.Model):
     __tablename__ = 'subscriptions'
+    __table_args__ = (
+        db.Index('ix_subscriptions_customer_id_active', 'customer_id', 'active'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     stripe_subscription_id = db.Column(db.String(100),
@@ -1,13 +1,25 @@
-import os
+import base64
 import logging
 from datetime import datetime
-from flask import Blueprint, request, jsonify
-import requests
-from werkzeug.utils import secure_filename
+from flask import Blueprint, Response, request, jsonify, json, session, stream_with_context, send_file
+from sqlalchemy import and_, or_, func
 
 from app import db
-from models import Project, Agent, Ticket, Checkpoint, Conversation, Message, Comment, AgentRole, TicketStatus, TicketPriority
-from agent_system.coordinator import AgentCoordinator
+from models import Project, Agent, Ticket, Checkpoint, Conversation, Message, Comment, Job, Subscription, AgentRole, TicketStatus, TicketPriority, JobStatus
+from serializers import serialize_ticket, serialize_tickets, serialize_comments, serialize_messages
+from activity import record_activity, record_ticket_activity, get_activity, activity_to_dict
+from blob_store import blob_store, sniff_image_type
+from search import SearchUnavailable, search
+from event_bus import ALL_CHANNEL, conversation_channel, event_bus, project_channel
+from agent_system.coordinator import FAN_OUT_TIMEOUT, AgentCoordinator
+from agent_system.executor import TicketExecutor
+from agent_system.ollama_client import backend_pool
+from agent_system.registry import agent_registry
+from agent_system.scheduler import generation_priority, generation_scheduler
+from agent_system.ticket_system import TicketBatchError, TicketManager
+from agent_system.images import vision_image_cache
+from agent_system.response_cache import response_cache
+from agent_system.warmup import model_warmer
 
 # Set up logging
 logger = logging.getLogger(__name__)
@@ -15,21 +27,66 @@ logger = logging.getLogger(__name__)
 # Create Blueprint
 api_bp = Blueprint('api_bp', __name__)
 
-# Ensure upload directory exists
-UPLOAD_FOLDER = 'uploads'
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+def _actor():
+    """Name recorded in the activity log for changes made through the API"""
+    return session.get('username') or 'user'
+
+def _encode_project_cursor(project):
+    """Encode the keyset position after a project as an opaque cursor"""
+    raw = f"{project.updated_at.isoformat()}|{project.id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def _decode_project_cursor(cursor):
+    """Decode a cursor into (updated_at, id); raises ValueError if malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        updated_at, project_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(updated_at), int(project_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+def _ticket_status_counts(project_ids):
+    """Count tickets per status for several projects in one grouped query"""
+    counts = {project_id: {status.value: 0 for status in TicketStatus} for project_id in project_ids}
+    if not project_ids:
+        return counts
+    
+    rows = (db.session.query(Ticket.project_id, Ticket.status, func.count(Ticket.id))
+            .filter(Ticket.project_id.in_(project_ids))
+            .group_by(Ticket.project_id, Ticket.status)
+            .all())
+    for project_id, status, count in rows:
+        counts[project_id][status.value] = count
+    return counts
 
 @api_bp.route('/projects', methods=['GET'])
 def get_projects():
-    """Get all projects"""
+    """Get a page of projects, most recently updated first"""
     try:
-        projects = Project.query.order_by(Project.updated_at.desc()).all()
+        limit = max(1, min(request.args.get('limit', 50, type=int), 200))
+        
+        query = Project.query
+        cursor = request.args.get('cursor')
+        if cursor:
+            try:
+                cursor_updated_at, cursor_id = _decode_project_cursor(cursor)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            query = query.filter(or_(
+                Project.updated_at < cursor_updated_at,
+                and_(Project.updated_at == cursor_updated_at, Project.id < cursor_id)
+            ))
+        
+        # Fetch one extra row to know whether there is a next page
+        projects = query.order_by(Project.updated_at.desc(), Project.id.desc()).limit(limit + 1).all()
+        has_more = len(projects) > limit
+        projects = projects[:limit]
+        
+        status_counts = _ticket_status_counts([project.id for project in projects])
         
         result = []
         for project in projects:
-            ticket_count = Ticket.query.filter_by(project_id=project.id).count()
-            open_ticket_count = Ticket.query.filter_by(project_id=project.id, status=TicketStatus.OPEN).count()
-            completed_ticket_count = Ticket.query.filter_by(project_id=project.id, status=TicketStatus.COMPLETED).count()
+            counts = status_counts[project.id]
             
             result.append({
                 'id': project.id,
@@ -37,12 +94,16 @@ def get_projects():
                 'description': project.description,
                 'created_at': project.created_at,
                 'updated_at': project.updated_at,
-                'ticket_count': ticket_count,
-                'open_ticket_count': open_ticket_count,
-                'completed_ticket_count': completed_ticket_count
+                'ticket_count': sum(counts.values()),
+                'open_ticket_count': counts[TicketStatus.OPEN.value],
+                'completed_ticket_count': counts[TicketStatus.COMPLETED.value],
+                'status_counts': counts
             })
             
-        return jsonify({'projects': result})
+        return jsonify({
+            'projects': result,
+            'next_cursor': _encode_project_cursor(projects[-1]) if has_more else None
+        })
     except Exception as e:
         logger.exception(f"Error getting projects: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -62,6 +123,9 @@ def create_project():
         )
         
         db.session.add(project)
+        db.session.flush()
+        record_activity('project.created', f"Project created: {project.name}", 'project', project.id,
+                        project.id, project.description or 'No description', actor=_actor())
         db.session.commit()
         
         logger.info(f"Created new project: {project.name} (ID: {project.id})")
@@ -109,32 +173,8 @@ def get_project_tickets(project_id):
             query = query.filter_by(status=status_enum)
         
         tickets = query.all()
-        
-        result = []
-        for ticket in tickets:
-            agent_info = None
-            if ticket.assigned_agent_id:
-                agent = Agent.query.get(ticket.assigned_agent_id)
-                if agent:
-                    agent_info = {
-                        'id': agent.id,
-                        'name': agent.name,
-                        'role': agent.role.value
-                    }
             
-            result.append({
-                'id': ticket.id,
-                'title': ticket.title,
-                'description': ticket.description,
-                'status': ticket.status.value,
-                'priority': ticket.priority.value,
-                'created_at': ticket.created_at,
-                'updated_at': ticket.updated_at,
-                'due_date': ticket.due_date,
-                'assigned_to': agent_info
-            })
-            
-        return jsonify({'tickets': result})
+        return jsonify({'tickets': serialize_tickets(tickets)})
     except Exception as e:
         logger.exception(f"Error getting tickets for project {project_id}: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -180,6 +220,9 @@ def create_project_ticket(project_id):
         )
 
         db.session.add(ticket)
+        db.session.flush()
+        record_ticket_activity(ticket, 'ticket.created', f"Ticket created: {ticket.title}",
+                               f"Priority: {ticket.priority.value}", actor=_actor())
         db.session.commit()
 
         logger.info(f"Created new ticket: {ticket.title} (ID: {ticket.id}) for project {project_id}")
@@ -199,6 +242,57 @@ def create_project_ticket(project_id):
         logger.exception(f"Error creating ticket for project {project_id}: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@api_bp.route('/projects/<int:project_id>/tickets:bulk', methods=['POST'])
+def create_project_tickets_bulk(project_id):
+    """Create many tickets for a project in one transaction"""
+    try:
+        Project.query.get_or_404(project_id)
+        
+        data = request.json or {}
+        results = TicketManager(project_id, actor=_actor()).create_tickets(data.get('tickets'))
+        
+        return jsonify({'created': len(results), 'results': results})
+    except TicketBatchError as e:
+        return jsonify({'error': str(e), 'results': e.errors}), 400
+    except Exception as e:
+        db.session.rollback()
+        logger.exception(f"Error creating tickets in bulk for project {project_id}: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/projects/<int:project_id>/tickets:bulk-status', methods=['POST'])
+def update_project_ticket_statuses(project_id):
+    """Change the status of many tickets of a project in one transaction"""
+    try:
+        Project.query.get_or_404(project_id)
+        
+        data = request.json or {}
+        results = TicketManager(project_id, actor=_actor()).update_ticket_statuses(data.get('updates'))
+        
+        return jsonify({'updated': len(results), 'results': results})
+    except TicketBatchError as e:
+        return jsonify({'error': str(e), 'results': e.errors}), 400
+    except Exception as e:
+        db.session.rollback()
+        logger.exception(f"Error updating ticket statuses in bulk for project {project_id}: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/projects/<int:project_id>/tickets:bulk-assign', methods=['POST'])
+def assign_project_tickets(project_id):
+    """Assign many tickets of a project to agents in one transaction"""
+    try:
+        Project.query.get_or_404(project_id)
+        
+        data = request.json or {}
+        results = TicketManager(project_id, actor=_actor()).assign_tickets(data.get('assignments'))
+        
+        return jsonify({'assigned': len(results), 'results': results})
+    except TicketBatchError as e:
+        return jsonify({'error': str(e), 'results': e.errors}), 400
+    except Exception as e:
+        db.session.rollback()
+        logger.exception(f"Error assigning tickets in bulk for project {project_id}: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @api_bp.route('/projects/<int:project_id>/checkpoints', methods=['GET'])
 def get_project_checkpoints(project_id):
     """Get all checkpoints for a project"""
@@ -266,6 +360,9 @@ def create_project_checkpoint(project_id):
                 checkpoint.related_tickets.append(ticket)
         
         db.session.add(checkpoint)
+        db.session.flush()
+        record_activity('checkpoint.created', f"Checkpoint created: {checkpoint.name}", 'checkpoint', checkpoint.id,
+                        project_id, checkpoint.description, actor=_actor())
         db.session.commit()
         
         logger.info(f"Created new checkpoint: {checkpoint.name} (ID: {checkpoint.id}) for project {project_id}")
@@ -289,34 +386,23 @@ def get_ticket(ticket_id):
     try:
         ticket = Ticket.query.get_or_404(ticket_id)
         
-        agent_info = None
-        if ticket.assigned_agent_id:
-            agent = Agent.query.get(ticket.assigned_agent_id)
-            if agent:
-                agent_info = {
-                    'id': agent.id,
-                    'name': agent.name,
-                    'role': agent.role.value
-                }
-        
-        result = {
-            'id': ticket.id,
-            'title': ticket.title,
-            'description': ticket.description,
-            'status': ticket.status.value,
-            'priority': ticket.priority.value,
-            'created_at': ticket.created_at,
-            'updated_at': ticket.updated_at,
-            'due_date': ticket.due_date,
-            'project_id': ticket.project_id,
-            'assigned_to': agent_info
-        }
-        
-        return jsonify({'ticket': result})
+        return jsonify({'ticket': serialize_ticket(ticket)})
     except Exception as e:
         logger.exception(f"Error getting ticket {ticket_id}: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@api_bp.route('/tickets/<int:ticket_id>/tree', methods=['GET'])
+def get_ticket_tree(ticket_id):
+    """Get a ticket with all of its subtasks nested, and status counts rolled up per node"""
+    try:
+        ticket = Ticket.query.get_or_404(ticket_id)
+        
+        tree = TicketManager(ticket.project_id).get_ticket_tree(ticket_id)
+        return jsonify({'ticket': tree})
+    except Exception as e:
+        logger.exception(f"Error getting ticket tree {ticket_id}: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @api_bp.route('/tickets/<int:ticket_id>/comments', methods=['GET'])
 def get_ticket_comments(ticket_id):
     """Get all comments for a ticket"""
@@ -324,28 +410,8 @@ def get_ticket_comments(ticket_id):
         ticket = Ticket.query.get_or_404(ticket_id)
         
         comments = Comment.query.filter_by(ticket_id=ticket_id).order_by(Comment.created_at).all()
-        
-        result = []
-        for comment in comments:
-            agent_info = None
-            if comment.agent_id:
-                agent = Agent.query.get(comment.agent_id)
-                if agent:
-                    agent_info = {
-                        'id': agent.id,
-                        'name': agent.name,
-                        'role': agent.role.value
-                    }
-            
-            result.append({
-                'id': comment.id,
-                'content': comment.content,
-                'created_at': comment.created_at,
-                'is_user': comment.is_user,
-                'agent': agent_info
-            })
             
-        return jsonify({'comments': result})
+        return jsonify({'comments': serialize_comments(comments)})
     except Exception as e:
         logger.exception(f"Error getting comments for ticket {ticket_id}: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -369,6 +435,8 @@ def add_ticket_comment(ticket_id):
         )
         
         db.session.add(comment)
+        record_ticket_activity(ticket, 'comment.created', f"Comment on: {ticket.title}", comment.content,
+                               actor=_actor())
         db.session.commit()
         
         logger.info(f"Added comment to ticket {ticket_id}")
@@ -403,6 +471,8 @@ def assign_ticket(ticket_id):
         if ticket.status == TicketStatus.OPEN:
             ticket.status = TicketStatus.IN_PROGRESS
         
+        record_ticket_activity(ticket, 'ticket.assigned', f"Ticket assigned: {ticket.title}",
+                               f"Assigned to {agent.name}", actor=_actor())
         db.session.commit()
         
         logger.info(f"Assigned ticket {ticket_id} to agent {agent.id} ({agent.name})")
@@ -435,7 +505,10 @@ def update_ticket_status(ticket_id):
         if not hasattr(TicketStatus, status):
             return jsonify({'error': f'Invalid status: {status}'}), 400
         
+        previous_status = ticket.status
         ticket.status = getattr(TicketStatus, status)
+        record_ticket_activity(ticket, 'ticket.status_changed', f"Ticket updated: {ticket.title}",
+                               f"Status: {previous_status.value} -> {ticket.status.value}", actor=_actor())
         db.session.commit()
         
         logger.info(f"Updated ticket {ticket_id} status to {status}")
@@ -514,6 +587,9 @@ def create_conversation():
         )
         
         db.session.add(conversation)
+        db.session.flush()
+        record_activity('conversation.created', f"Conversation started: {conversation.title}", 'conversation',
+                        conversation.id, project_id, actor=_actor())
         db.session.commit()
         
         logger.info(f"Created new conversation: {conversation.id}")
@@ -532,39 +608,121 @@ def create_conversation():
 
 @api_bp.route('/conversations/<int:conversation_id>/messages', methods=['GET'])
 def get_conversation_messages(conversation_id):
-    """Get all messages for a conversation"""
+    """
+    Get a page of messages for a conversation, oldest first.
+    
+    Without a cursor the latest `limit` messages are returned. `before_id`
+    pages back through older messages; `after_id` returns only messages
+    newer than the last one the client has seen.
+    """
     try:
         conversation = Conversation.query.get_or_404(conversation_id)
         
-        messages = Message.query.filter_by(conversation_id=conversation_id).order_by(Message.timestamp).all()
+        limit = max(1, min(request.args.get('limit', 50, type=int), 200))
+        before_id = request.args.get('before_id', type=int)
+        after_id = request.args.get('after_id', type=int)
         
-        result = []
-        for message in messages:
-            agent_info = None
-            if message.agent_id:
-                agent = Agent.query.get(message.agent_id)
-                if agent:
-                    agent_info = {
-                        'id': agent.id,
-                        'name': agent.name,
-                        'role': agent.role.value
-                    }
-            
-            result.append({
-                'id': message.id,
-                'content': message.content,
-                'timestamp': message.timestamp,
-                'is_user': message.is_user,
-                'agent_name': agent_info['name'] if agent_info else None,
-                'has_image': message.has_image,
-                'image_path': message.image_path
-            })
-            
-        return jsonify({'messages': result})
+        if before_id is not None and after_id is not None:
+            return jsonify({'error': 'Use either before_id or after_id, not both'}), 400
+        
+        query = Message.query.filter(Message.conversation_id == conversation_id)
+        
+        # Fetch one extra row to know whether the page is the last one
+        if after_id is not None:
+            messages = query.filter(Message.id > after_id).order_by(Message.id).limit(limit + 1).all()
+            has_more = len(messages) > limit
+            messages = messages[:limit]
+        else:
+            if before_id is not None:
+                query = query.filter(Message.id < before_id)
+            messages = query.order_by(Message.id.desc()).limit(limit + 1).all()
+            has_more = len(messages) > limit
+            messages = list(reversed(messages[:limit]))
+        
+        return jsonify({
+            'messages': serialize_messages(messages),
+            'has_more': has_more,
+            'first_id': messages[0].id if messages else None,
+            'last_id': messages[-1].id if messages else after_id
+        })
     except Exception as e:
         logger.exception(f"Error getting messages for conversation {conversation_id}: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+def _read_message_input():
+    """Read the message text and optional image upload from the current request"""
+    # Check if this is a form submission with an image
+    image_path = None
+    if request.files and 'image' in request.files:
+        image_file = request.files['image']
+        if image_file.filename:
+            # Stored by content, so re-uploads share one file and names never collide
+            image_path = blob_store.put_stream(image_file.stream)
+            logger.info(f"Saved image {image_file.filename} as {image_path}")
+    
+    # Get message content
+    message_content = ''
+    if request.form and 'message' in request.form:
+        message_content = request.form['message']
+        logger.info(f"Got message from form: {message_content[:50]}...")
+    elif request.is_json and request.json and 'message' in request.json:
+        message_content = request.json['message']
+        logger.info(f"Got message from JSON: {message_content[:50]}...")
+    
+    return message_content, image_path
+
+def _get_conversation_coordinator(conversation):
+    """Get the agent coordinator for a conversation, attaching it to a project if needed"""
+    if conversation.project_id:
+        logger.info(f"Using existing project_id: {conversation.project_id}")
+        return AgentCoordinator(conversation.project_id)
+    
+    # Use first project or create one if none exists
+    project = Project.query.first()
+    if not project:
+        logger.info("No project found, creating a new one")
+        project = Project(name="General", description="General conversations")
+        db.session.add(project)
+        db.session.commit()
+        logger.info(f"Created new project with ID {project.id}")
+    else:
+        logger.info(f"Using first project with ID {project.id}")
+    
+    agent_coordinator = AgentCoordinator(project.id)
+    
+    # Update conversation with project ID
+    conversation.project_id = project.id
+    db.session.commit()
+    logger.info(f"Updated conversation {conversation.id} to have project_id {project.id}")
+    return agent_coordinator
+
+def _touch_conversation(conversation, message_content):
+    """Bump the conversation timestamp and derive a title from the first message"""
+    conversation.updated_at = datetime.utcnow()
+    if not conversation.title or conversation.title.startswith("Conversation"):
+        # Use the first 30 chars of the message as the title
+        new_title = message_content[:30]
+        if len(message_content) > 30:
+            new_title += "..."
+        conversation.title = new_title
+        logger.info(f"Updated conversation title to: {new_title}")
+
+def _current_subscription_tier():
+    """Get the subscription tier of the logged-in customer, if any"""
+    user_id = session.get('user_id')
+    if not user_id:
+        return None
+    
+    subscription = (Subscription.query
+                    .filter_by(customer_id=user_id, active=True)
+                    .order_by(Subscription.start_date.desc())
+                    .first())
+    return subscription.tier if subscription and subscription.is_active else None
+
+def _sse_event(event, data):
+    """Format a Server-Sent Events frame with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 @api_bp.route('/conversations/<int:conversation_id>/messages', methods=['POST'])
 def add_conversation_message(conversation_id):
     """Add a message to a conversation"""
@@ -573,58 +731,18 @@ def add_conversation_message(conversation_id):
         conversation = Conversation.query.get_or_404(conversation_id)
         logger.info(f"Found conversation: {conversation.id}, title: {conversation.title}, project_id: {conversation.project_id}")
         
-        # Check if this is a form submission with an image
-        image_path = None
-        if request.files and 'image' in request.files:
-            image_file = request.files['image']
-            if image_file.filename:
-                filename = secure_filename(image_file.filename)
-                filepath = os.path.join(UPLOAD_FOLDER, filename)
-                image_file.save(filepath)
-                image_path = filepath
-                logger.info(f"Saved image to {filepath}")
-        
-        # Get message content
-        message_content = ''
-        if request.form and 'message' in request.form:
-            message_content = request.form['message']
-            logger.info(f"Got message from form: {message_content[:50]}...")
-        elif request.json and 'message' in request.json:
-            message_content = request.json['message']
-            logger.info(f"Got message from JSON: {message_content[:50]}...")
+        message_content, image_path = _read_message_input()
         
         if not message_content and not image_path:
             logger.warning("No message or image provided")
             return jsonify({'error': 'Message content or image is required'}), 400
         
         # Initialize or get agent coordinator
-        project_id = conversation.project_id
-        project = None
-        
-        if project_id:
-            logger.info(f"Using existing project_id: {project_id}")
-            agent_coordinator = AgentCoordinator(project_id)
-        else:
-            # Use first project or create one if none exists
-            project = Project.query.first()
-            if not project:
-                logger.info("No project found, creating a new one")
-                project = Project(name="General", description="General conversations")
-                db.session.add(project)
-                db.session.commit()
-                logger.info(f"Created new project with ID {project.id}")
-            else:
-                logger.info(f"Using first project with ID {project.id}")
-            
-            agent_coordinator = AgentCoordinator(project.id)
-            
-            # Update conversation with project ID
-            conversation.project_id = project.id
-            db.session.commit()
-            logger.info(f"Updated conversation {conversation_id} to have project_id {project.id}")
+        agent_coordinator = _get_conversation_coordinator(conversation)
         
         # Process message with agent coordinator - this will handle creating both the user message and agent response
-        response = agent_coordinator.process_user_message(message_content, conversation_id, image_path)
+        with generation_priority(interactive=True, tier=_current_subscription_tier()):
+            response = agent_coordinator.process_user_message(message_content, conversation_id, image_path)
         logger.info(f"Got response from agent: {response[:50]}...")
         
         # Find the agent information
@@ -652,22 +770,8 @@ def add_conversation_message(conversation_id):
         else:
             logger.warning("No agent message found for this conversation")
         
-        # Double-check that conversation has a project_id
-        if conversation.project_id is None and project:
-            conversation.project_id = project.id
-            db.session.commit()
-            logger.info(f"Updated conversation {conversation_id} to have project_id {project.id}")
-        
         # Update conversation timestamp and title if needed
-        conversation.updated_at = datetime.utcnow()
-        if not conversation.title or conversation.title.startswith("Conversation"):
-            # Use the first 30 chars of the message as the title
-            new_title = message_content[:30]
-            if len(message_content) > 30:
-                new_title += "..."
-            conversation.title = new_title
-            logger.info(f"Updated conversation title to: {new_title}")
-        
+        _touch_conversation(conversation, message_content)
         db.session.commit()
         
         logger.info("Successfully processed message and created response")
@@ -675,13 +779,153 @@ def add_conversation_message(conversation_id):
             'success': True,
             'response': response,
             'agent_name': agent_name,
-            'conversation_updated': True
+            'conversation_updated': True,
+            'jobs': agent_coordinator.pending_jobs
         })
     except Exception as e:
         db.session.rollback()
         logger.exception(f"Error adding message to conversation {conversation_id}: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@api_bp.route('/conversations/<int:conversation_id>/messages/stream', methods=['POST'])
+def stream_conversation_message(conversation_id):
+    """Add a message to a conversation and stream the reply as Server-Sent Events"""
+    try:
+        conversation = Conversation.query.get_or_404(conversation_id)
+        
+        message_content, image_path = _read_message_input()
+        
+        if not message_content and not image_path:
+            logger.warning("No message or image provided")
+            return jsonify({'error': 'Message content or image is required'}), 400
+        
+        agent_coordinator = _get_conversation_coordinator(conversation)
+        coordinator_agent = agent_coordinator.coordinator_agent
+        agent_name = coordinator_agent.name if coordinator_agent else "Coordinator"
+        tier = _current_subscription_tier()
+    except Exception as e:
+        db.session.rollback()
+        logger.exception(f"Error adding message to conversation {conversation_id}: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+    
+    def generate():
+        yield _sse_event('start', {'agent_name': agent_name})
+        
+        stream = agent_coordinator.stream_user_message(message_content, conversation_id, image_path)
+        try:
+            while True:
+                try:
+                    # Set per step, since the priority must not leak into the
+                    # server code that runs between yields
+                    with generation_priority(interactive=True, tier=tier):
+                        chunk = next(stream)
+                except StopIteration as finished:
+                    user_message, response_message = finished.value
+                    break
+                yield _sse_event('token', {'content': chunk})
+            
+            _touch_conversation(conversation, message_content)
+            db.session.commit()
+            
+            yield _sse_event('done', {
+                'user_message_id': user_message.id,
+                'message_id': response_message.id,
+                'response': response_message.content,
+                'agent_name': agent_name,
+                'conversation_updated': True,
+                'jobs': agent_coordinator.pending_jobs
+            })
+        except Exception as e:
+            db.session.rollback()
+            logger.exception(f"Error streaming message for conversation {conversation_id}: {str(e)}")
+            yield _sse_event('error', {'error': str(e)})
+        finally:
+            stream.close()
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+# Longest per-agent timeout a fan-out request may ask for
+FAN_OUT_MAX_TIMEOUT = 300
+
+@api_bp.route('/projects/<int:project_id>/fan-out', methods=['POST'])
+def fan_out_project_request(project_id):
+    """Ask several role agents about a request at once and merge their answers"""
+    try:
+        Project.query.get_or_404(project_id)
+        
+        data = request.json or {}
+        message = data.get('message')
+        if not message:
+            return jsonify({'error': 'Message is required'}), 400
+        
+        try:
+            roles = [AgentRole(role) for role in data['roles']] if data.get('roles') else None
+        except ValueError as ve:
+            return jsonify({'error': f"Invalid role: {str(ve)}"}), 400
+        
+        timeout = data.get('timeout', FAN_OUT_TIMEOUT)
+        if not isinstance(timeout, (int, float)) or not 0 < timeout <= FAN_OUT_MAX_TIMEOUT:
+            return jsonify({'error': f"Timeout must be between 0 and {FAN_OUT_MAX_TIMEOUT} seconds"}), 400
+        
+        agent_coordinator = AgentCoordinator(project_id)
+        with generation_priority(interactive=True, tier=_current_subscription_tier()):
+            result = agent_coordinator.fan_out(message, roles=roles, timeout=timeout,
+                                               merge=data.get('merge', True))
+        
+        logger.info(f"Fan-out for project {project_id} answered by {len(result['responses'])} agent(s) "
+                    f"in {result['seconds']}s")
+        return jsonify(result)
+    except Exception as e:
+        logger.exception(f"Error fanning out request for project {project_id}: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/projects/<int:project_id>/execution', methods=['GET'])
+def get_project_execution(project_id):
+    """Get which of a project's tickets can run now and which are waiting"""
+    try:
+        Project.query.get_or_404(project_id)
+        return jsonify(TicketExecutor(project_id).plan())
+    except Exception as e:
+        logger.exception(f"Error getting execution plan for project {project_id}: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/projects/<int:project_id>/execute', methods=['POST'])
+def execute_project(project_id):
+    """Dispatch every ready ticket of a project to its agent"""
+    try:
+        Project.query.get_or_404(project_id)
+        
+        executor = TicketExecutor(project_id)
+        dispatched = executor.dispatch()
+        logger.info(f"Started execution of project {project_id}: {len(dispatched)} ticket(s) dispatched")
+        
+        result = executor.plan()
+        result['dispatched'] = dispatched
+        return jsonify(result)
+    except Exception as e:
+        db.session.rollback()
+        logger.exception(f"Error executing project {project_id}: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/blobs/<digest>', methods=['GET'])
+def get_blob(digest):
+    """Serve a stored upload by its digest"""
+    try:
+        if not blob_store.exists(digest):
+            return jsonify({'error': 'Blob not found'}), 404
+    except ValueError:
+        return jsonify({'error': 'Invalid digest'}), 400
+    
+    path = blob_store.path(digest)
+    # The content of a digest never changes, so clients may cache it forever
+    response = send_file(path, mimetype=sniff_image_type(path), max_age=31536000, etag=digest)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
 @api_bp.route('/agents', methods=['GET'])
 def get_agents():
     """Get all agents"""
@@ -725,7 +969,11 @@ def create_agent():
         )
         
         db.session.add(agent)
+        db.session.flush()
+        record_activity('agent.created', f"Agent created: {agent.name}", 'agent', agent.id,
+                        detail=f"Role: {agent.role.value}, Model: {agent.model}", actor=_actor())
         db.session.commit()
+        agent_registry.invalidate()
         
         logger.info(f"Created new agent: {agent.name} ({agent.role.value})")
         
@@ -783,6 +1031,9 @@ def update_checkpoint_status(checkpoint_id):
             return jsonify({'error': 'Completed status is required'}), 400
         
         checkpoint.completed = data.get('completed')
+        record_activity('checkpoint.completed' if checkpoint.completed else 'checkpoint.reopened',
+                        f"Checkpoint {'completed' if checkpoint.completed else 'reopened'}: {checkpoint.name}",
+                        'checkpoint', checkpoint.id, checkpoint.project_id, actor=_actor())
         db.session.commit()
         
         logger.info(f"Updated checkpoint {checkpoint_id} completed status to {checkpoint.completed}")
@@ -797,23 +1048,226 @@ def update_checkpoint_status(checkpoint_id):
         logger.exception(f"Error updating checkpoint {checkpoint_id} status: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@api_bp.route('/activity', methods=['GET'])
+def get_activity_feed():
+    """Get activity events newest first, optionally scoped to a project or a subject"""
+    try:
+        limit = max(1, min(request.args.get('limit', 50, type=int), 200))
+        events = get_activity(
+            project_id=request.args.get('project_id', type=int),
+            subject_type=request.args.get('subject_type'),
+            subject_id=request.args.get('subject_id', type=int),
+            before_id=request.args.get('before_id', type=int),
+            limit=limit
+        )
+        
+        return jsonify({
+            'events': [activity_to_dict(event) for event in events],
+            'next_before_id': events[-1].id if len(events) == limit else None
+        })
+    except Exception as e:
+        logger.exception(f"Error getting activity: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/search', methods=['GET'])
+def search_content():
+    """Search tickets, comments and messages, best matches first, optionally within a project"""
+    try:
+        query = request.args.get('q', '').strip()
+        if not query:
+            return jsonify({'error': 'Search query is required'}), 400
+        
+        types = request.args.get('types')
+        result = search(
+            query,
+            project_id=request.args.get('project_id', type=int),
+            types=types.split(',') if types else None,
+            limit=request.args.get('limit', 20, type=int),
+            offset=request.args.get('offset', 0, type=int)
+        )
+        return jsonify(result)
+    except SearchUnavailable as e:
+        return jsonify({'error': str(e)}), 503
+    except Exception as e:
+        logger.exception(f"Error searching: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+# Seconds between keepalive comments on an idle event stream, below common proxy timeouts
+EVENT_STREAM_HEARTBEAT = 15
+# Events replayed to a reconnecting client before it is told to resync instead
+EVENT_REPLAY_LIMIT = 200
+
+def _replay_activity(project_id, conversation_id, after_id):
+    """Get the events a reconnecting subscriber missed, oldest first"""
+    if project_id is None and conversation_id is None:
+        return get_activity(after_id=after_id, limit=EVENT_REPLAY_LIMIT + 1)
+    
+    events = {}
+    if project_id is not None:
+        for item in get_activity(project_id=project_id, after_id=after_id, limit=EVENT_REPLAY_LIMIT + 1):
+            events[item.id] = item
+    if conversation_id is not None:
+        for item in get_activity(subject_type='conversation', subject_id=conversation_id,
+                                 after_id=after_id, limit=EVENT_REPLAY_LIMIT + 1):
+            events[item.id] = item
+    return [events[event_id] for event_id in sorted(events)]
+
+@api_bp.route('/events', methods=['GET'])
+def stream_events():
+    """
+    Stream activity events for a project or conversation as Server-Sent Events.
+    
+    Each frame carries the activity event and the current state of its ticket
+    or conversation. Reconnecting clients send Last-Event-ID and get the
+    events they missed; a 'resync' frame means they must refetch instead.
+    Without project_id or conversation_id every event is streamed.
+    """
+    project_id = request.args.get('project_id', type=int)
+    conversation_id = request.args.get('conversation_id', type=int)
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    if last_event_id is None:
+        last_event_id = request.args.get('after_id', type=int)
+    
+    channels = []
+    if project_id is not None:
+        channels.append(project_channel(project_id))
+    if conversation_id is not None:
+        channels.append(conversation_channel(conversation_id))
+    
+    # Subscribe before replaying so nothing committed in between is lost
+    subscription = event_bus.subscribe(channels or [ALL_CHANNEL])
+    try:
+        missed = []
+        if last_event_id is not None:
+            missed = [activity_to_dict(item) for item in _replay_activity(project_id, conversation_id, last_event_id)]
+    except Exception as e:
+        event_bus.unsubscribe(subscription)
+        logger.exception(f"Error replaying activity: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+    finally:
+        # Do not hold a pooled connection for the life of the stream
+        db.session.remove()
+    
+    def frame(event, data, event_id=None):
+        return (f"id: {event_id}\n" if event_id is not None else "") + _sse_event(event, data)
+    
+    def generate():
+        last_id = last_event_id or 0
+        try:
+            if len(missed) > EVENT_REPLAY_LIMIT:
+                yield frame('resync', {'reason': 'too many missed events'})
+            else:
+                for payload in missed:
+                    last_id = payload['id']
+                    yield frame('activity', payload, payload['id'])
+            yield frame('ready', {'last_event_id': last_id})
+            
+            while True:
+                payload = subscription.get(timeout=EVENT_STREAM_HEARTBEAT)
+                if subscription.overflowed:
+                    subscription.overflowed = False
+                    yield frame('resync', {'reason': 'client fell behind'})
+                if payload is None:
+                    yield ": keepalive\n\n"
+                elif payload['id'] > last_id:
+                    last_id = payload['id']
+                    yield frame('activity', payload, payload['id'])
+        finally:
+            event_bus.unsubscribe(subscription)
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def _job_to_dict(job):
+    """Serialize a job for the API"""
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status.value,
+        'attempts': job.attempts,
+        'max_attempts': job.max_attempts,
+        'result': json.loads(job.result) if job.result else None,
+        'error': job.error,
+        'project_id': job.project_id,
+        'run_after': job.run_after,
+        'created_at': job.created_at,
+        'updated_at': job.updated_at
+    }
+
+@api_bp.route('/jobs', methods=['GET'])
+def get_jobs():
+    """Get recent background jobs, optionally filtered by status or project"""
+    try:
+        query = Job.query
+        
+        status_filter = request.args.get('status')
+        if status_filter:
+            if not hasattr(JobStatus, status_filter.upper()):
+                return jsonify({'error': f'Invalid status: {status_filter}'}), 400
+            query = query.filter_by(status=getattr(JobStatus, status_filter.upper()))
+        
+        project_id = request.args.get('project_id', type=int)
+        if project_id:
+            query = query.filter_by(project_id=project_id)
+        
+        limit = min(request.args.get('limit', 50, type=int), 200)
+        jobs = query.order_by(Job.id.desc()).limit(limit).all()
+        
+        return jsonify({'jobs': [_job_to_dict(job) for job in jobs]})
+    except Exception as e:
+        logger.exception(f"Error getting jobs: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/jobs/<int:job_id>', methods=['GET'])
+def get_job(job_id):
+    """Get the status of a background job"""
+    try:
+        job = Job.query.get_or_404(job_id)
+        return jsonify({'job': _job_to_dict(job)})
+    except Exception as e:
+        logger.exception(f"Error getting job {job_id}: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/ollama/scheduler', methods=['GET'])
+def get_scheduler_stats():
+    """Get in-flight generations, queue depth and wait times per model"""
+    return jsonify({
+        'default_limit': generation_scheduler.default_limit,
+        'models': generation_scheduler.stats(),
+        'image_cache': vision_image_cache.stats(),
+        'response_cache': response_cache.stats()
+    })
+
 @api_bp.route('/ollama/status', methods=['GET'])
 def check_ollama_status():
-    """Check if Ollama is running"""
+    """
+    Check if the Ollama hosts are running and this worker's models are warm.
+    
+    Responds 503 until warm-up has loaded every agent model that a host
+    serves, so a load balancer health check on this URL holds traffic until
+    models are hot. Models no host serves are listed as unavailable.
+    """
+    readiness = model_warmer.readiness()
+    status_code = 200 if readiness['ready'] else 503
     try:
-        response = requests.get('http://localhost:11434/api/tags', timeout=2)
+        backend_pool.start()
+        hosts = backend_pool.stats()
+        if all(host['last_checked_ago'] is None for host in hosts):
+            # No health check has finished in this worker yet
+            backend_pool.check_health()
+            hosts = backend_pool.stats()
         
-        if response.status_code == 200:
-            # Check if llama3:8b-vision is available
-            models = response.json().get('models', [])
-            has_vision_model = any(model.get('name') == 'llama3:8b-vision' for model in models)
-            
-            return jsonify({
-                'running': True,
-                'has_vision_model': has_vision_model
-            })
-        else:
-            return jsonify({'running': False})
+        return jsonify({
+            'running': backend_pool.healthy(),
+            # Check if llama3:8b-vision is available on any host
+            'has_vision_model': any('llama3:8b-vision' in (host['models'] or []) for host in hosts),
+            'ready': readiness['ready'],
+            'warmup': readiness,
+            'hosts': hosts
+        }), status_code
     except Exception as e:
         logger.exception(f"Error checking Ollama status: {str(e)}")
-        return jsonify({'running': False, 'error': str(e)})
+        return jsonify({'running': False, 'ready': readiness['ready'], 'warmup': readiness, 'error': str(e)}), status_code
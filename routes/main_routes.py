@@ -7,6 +7,7 @@ from app import db
 from models import Project, Agent, Ticket, Checkpoint, Conversation, Message, Customer, Subscription, TicketStatus
 from agent_system.coordinator import AgentCoordinator
 from routes.auth_routes import login_required
+from dashboard import get_dashboard_data
 
 # Set up logging
 logger = logging.getLogger(__name__)
@@ -14,6 +15,9 @@ logger = logging.getLogger(__name__)
 # Create Blueprint
 main_bp = Blueprint('main_bp', __name__)
 
+# Messages rendered with the chat page; chat.js pages in older ones on demand
+CHAT_PAGE_SIZE = 50
+
 @main_bp.route('/')
 def index():
     """Home page route"""
@@ -31,74 +35,17 @@ def dashboard():
         # Get user data
         customer = Customer.query.get_or_404(user_id)
         
-        # Get user's projects
-        projects = Project.query.order_by(Project.updated_at.desc()).all()
-        project_count = len(projects)
-        
         # Get subscription data
         subscription = Subscription.query.filter_by(customer_id=user_id, active=True).first()
         
-        # Get ticket counts
-        open_ticket_count = Ticket.query.filter_by(status=TicketStatus.OPEN).count()
-        in_progress_ticket_count = Ticket.query.filter_by(status=TicketStatus.IN_PROGRESS).count()
-        completed_ticket_count = Ticket.query.filter_by(status=TicketStatus.COMPLETED).count()
-        total_tickets = open_ticket_count + in_progress_ticket_count + completed_ticket_count
-        
-        # Calculate completion percentage
-        completed_percentage = 0
-        if total_tickets > 0:
-            completed_percentage = int((completed_ticket_count / total_tickets) * 100)
-        
-        # Get recent activities
-        recent_activities = [
-            # Placeholder for recent activities
-        ]
-        
-        # For demo purposes, create some example activities
-        if not recent_activities:
-            # Get messages, projects and tickets and format them as activities
-            messages = Message.query.filter_by(is_user=False).order_by(Message.timestamp.desc()).limit(3).all()
-            recent_projects = Project.query.order_by(Project.created_at.desc()).limit(2).all()
-            recent_tickets = Ticket.query.order_by(Ticket.updated_at.desc()).limit(2).all()
-            
-            for msg in messages:
-                conversation = Conversation.query.get(msg.conversation_id)
-                recent_activities.append({
-                    'type': 'conversation',
-                    'title': f"New message in '{conversation.title if conversation.title else 'Untitled'}'",
-                    'description': msg.content[:100] + '...' if len(msg.content) > 100 else msg.content,
-                    'time': msg.timestamp.strftime('%Y-%m-%d %H:%M')
-                })
-            
-            for proj in recent_projects:
-                recent_activities.append({
-                    'type': 'project',
-                    'title': f"Project created: {proj.name}",
-                    'description': proj.description[:100] + '...' if proj.description and len(proj.description) > 100 else (proj.description or 'No description'),
-                    'time': proj.created_at.strftime('%Y-%m-%d %H:%M')
-                })
-            
-            for ticket in recent_tickets:
-                recent_activities.append({
-                    'type': 'ticket',
-                    'title': f"Ticket updated: {ticket.title}",
-                    'description': f"Status: {ticket.status.value}, Priority: {ticket.priority.value}",
-                    'time': ticket.updated_at.strftime('%Y-%m-%d %H:%M')
-                })
-            
-            # Sort by time
-            recent_activities.sort(key=lambda x: datetime.strptime(x['time'], '%Y-%m-%d %H:%M'), reverse=True)
+        # Ticket statistics and recent activities, cached briefly per user
+        dashboard_data = get_dashboard_data(user_id)
         
         return render_template(
             'dashboard.html',
             customer=customer,
             subscription=subscription,
-            project_count=project_count,
-            open_ticket_count=open_ticket_count,
-            in_progress_ticket_count=in_progress_ticket_count,
-            completed_ticket_count=completed_ticket_count,
-            completed_percentage=completed_percentage,
-            recent_activities=recent_activities
+            **dashboard_data
         )
     except Exception as e:
         logger.exception(f"Error in dashboard route: {str(e)}")
@@ -124,15 +71,22 @@ def chat(project_id):
             current_conversation_id = conversations[0].id
             session['current_conversation_id'] = current_conversation_id
             
-        # Get messages for current conversation
+        # Get the latest messages for current conversation; older ones are paged in by chat.js
         messages = []
+        has_more_messages = False
         if current_conversation_id:
-            messages = Message.query.filter_by(conversation_id=current_conversation_id).order_by(Message.timestamp).all()
+            messages = (Message.query.filter_by(conversation_id=current_conversation_id)
+                        .order_by(Message.id.desc())
+                        .limit(CHAT_PAGE_SIZE + 1)
+                        .all())
+            has_more_messages = len(messages) > CHAT_PAGE_SIZE
+            messages = list(reversed(messages[:CHAT_PAGE_SIZE]))
         
         return render_template(
             'chat.html', 
             conversations=conversations, 
             messages=messages, 
+            has_more_messages=has_more_messages,
             current_conversation_id=current_conversation_id,
             project_id=project_id
         )
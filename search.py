@@ -0,0 +1,283 @@
+import html
+import logging
+import re
+from typing import Any, Dict, List, Optional, Sequence
+
+from sqlalchemy import DateTime, text
+from sqlalchemy.engine import Connection
+
+from app import db
+
+logger = logging.getLogger(__name__)
+
+# Text search configuration of the Postgres index; changing it means rebuilding the index
+SEARCH_CONFIG = "english"
+
+SEARCH_TYPES = ("ticket", "comment", "message")
+SEARCH_MAX_LIMIT = 100
+
+# Control characters mark matches in snippets, so the text can be escaped
+# before they are turned into <mark> tags
+_MARK_START = "\x02"
+_MARK_END = "\x03"
+SNIPPET_WORDS = 16
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+class SearchUnavailable(RuntimeError):
+    """Raised when the database has no full-text index to search."""
+
+
+# Each FTS5 table mirrors its content table by rowid. The triggers keep it
+# current for every write, including bulk inserts that bypass the ORM.
+_SQLITE_INDEXES = (
+    ("tickets_fts", "tickets", ("title", "description")),
+    ("comments_fts", "comments", ("content",)),
+    ("messages_fts", "messages", ("content",)),
+)
+
+# Postgres keeps a generated tsvector column on each table, maintained on write
+_POSTGRES_VECTORS = (
+    ("tickets", f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(title, '')), 'A') || "
+                f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(description, '')), 'B')"),
+    ("comments", f"to_tsvector('{SEARCH_CONFIG}', coalesce(content, ''))"),
+    ("messages", f"to_tsvector('{SEARCH_CONFIG}', coalesce(content, ''))"),
+)
+
+
+def create_search_index(connection: Connection):
+    """
+    Create the full-text index for the connection's database and fill it from existing rows.
+
+    SQLite gets FTS5 tables kept in sync by triggers; Postgres gets a
+    generated tsvector column with a GIN index on each searched table.
+    Other databases, and SQLite builds without FTS5, are left without search.
+
+    Args:
+        connection (Connection): An autocommit connection
+    """
+    dialect = connection.dialect.name
+    if dialect == "sqlite":
+        _create_sqlite_index(connection)
+    elif dialect == "postgresql":
+        _create_postgres_index(connection)
+    else:
+        logger.warning(f"Full-text search is not supported on {dialect}")
+
+
+def _create_sqlite_index(connection: Connection):
+    for fts_table, table, columns in _SQLITE_INDEXES:
+        column_list = ", ".join(columns)
+        new_values = ", ".join(f"new.{column}" for column in columns)
+        old_values = ", ".join(f"old.{column}" for column in columns)
+        try:
+            connection.execute(text(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table} USING fts5("
+                f"{column_list}, content='{table}', content_rowid='id', tokenize='porter unicode61')"
+            ))
+        except Exception as e:
+            logger.warning(f"SQLite has no FTS5 support, search is disabled: {str(e)}")
+            return
+
+        connection.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS {fts_table}_insert AFTER INSERT ON {table} BEGIN "
+            f"INSERT INTO {fts_table}(rowid, {column_list}) VALUES (new.id, {new_values}); END"
+        ))
+        connection.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS {fts_table}_delete AFTER DELETE ON {table} BEGIN "
+            f"INSERT INTO {fts_table}({fts_table}, rowid, {column_list}) VALUES ('delete', old.id, {old_values}); END"
+        ))
+        connection.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS {fts_table}_update AFTER UPDATE OF {column_list} ON {table} BEGIN "
+            f"INSERT INTO {fts_table}({fts_table}, rowid, {column_list}) VALUES ('delete', old.id, {old_values}); "
+            f"INSERT INTO {fts_table}(rowid, {column_list}) VALUES (new.id, {new_values}); END"
+        ))
+        connection.execute(text(f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')"))
+        logger.info(f"Built search index {fts_table}")
+
+
+def _create_postgres_index(connection: Connection):
+    for table, vector in _POSTGRES_VECTORS:
+        # Adding a stored generated column fills it for every existing row
+        connection.execute(text(
+            f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector "
+            f"GENERATED ALWAYS AS ({vector}) STORED"
+        ))
+        connection.execute(text(
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_{table}_search_vector ON {table} USING GIN (search_vector)"
+        ))
+        logger.info(f"Built search index on {table}")
+
+
+def search(query: str, project_id: Optional[int] = None,
+           types: Optional[Sequence[str]] = None,
+           limit: int = 20, offset: int = 0) -> Dict[str, Any]:
+    """
+    Search tickets, ticket comments and chat messages, best matches first.
+
+    Args:
+        query (str): The words to search for
+        project_id (Optional[int]): Only return results from this project
+        types (Optional[Sequence[str]]): Kinds of result to include, from SEARCH_TYPES; all by default
+        limit (int): Results per page
+        offset (int): Results to skip
+
+    Returns:
+        Dict[str, Any]: The page of results and the offset of the next page, or None after the last
+
+    Raises:
+        SearchUnavailable: If the database has no full-text index
+    """
+    types = [kind for kind in (types or SEARCH_TYPES) if kind in SEARCH_TYPES]
+    limit = max(1, min(limit, SEARCH_MAX_LIMIT))
+    offset = max(0, offset)
+
+    dialect = db.engine.dialect.name
+    if dialect == "sqlite":
+        match = _sqlite_match(query)
+        if not match or not types:
+            return {'results': [], 'next_offset': None}
+        if not _sqlite_index_exists():
+            raise SearchUnavailable("The search index has not been built")
+        sql = _sqlite_search_sql(types, project_id is not None)
+        params = {'query': match}
+    elif dialect == "postgresql":
+        if not _TOKEN_RE.search(query or "") or not types:
+            return {'results': [], 'next_offset': None}
+        sql = _postgres_search_sql(types, project_id is not None)
+        params = {
+            'query': query,
+            'headline_options': f"StartSel={_MARK_START}, StopSel={_MARK_END}, "
+                                f"MaxWords={SNIPPET_WORDS * 2}, MinWords={SNIPPET_WORDS // 2}"
+        }
+    else:
+        raise SearchUnavailable(f"Full-text search is not supported on {dialect}")
+
+    # Fetch one extra row to know whether there is a next page
+    params.update({'project_id': project_id, 'limit': limit + 1, 'offset': offset})
+    rows = db.session.execute(text(sql).columns(updated_at=DateTime), params).mappings().all()
+    has_more = len(rows) > limit
+
+    return {
+        'results': [_result_to_dict(row) for row in rows[:limit]],
+        'next_offset': offset + limit if has_more else None
+    }
+
+
+def _sqlite_match(query: str) -> str:
+    """
+    Turn free text into an FTS5 query that cannot fail to parse.
+
+    Every word must appear; the last word also matches as a prefix, so
+    results show up while the user is still typing.
+    """
+    tokens = _TOKEN_RE.findall(query or "")
+    if not tokens:
+        return ""
+    terms = [f'"{token}"' for token in tokens]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+_sqlite_index_ready = False
+
+
+def _sqlite_index_exists() -> bool:
+    global _sqlite_index_ready
+    if not _sqlite_index_ready:
+        _sqlite_index_ready = db.session.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'tickets_fts'"
+        )).first() is not None
+    return _sqlite_index_ready
+
+
+def _sqlite_search_sql(types: Sequence[str], scoped: bool) -> str:
+    snippet = f"char(2), char(3), '…', {SNIPPET_WORDS}"
+    branches = {
+        'ticket': (
+            "SELECT 'ticket' AS kind, t.id AS id, t.project_id AS project_id, NULL AS parent_id, "
+            f"t.title AS title, snippet(tickets_fts, -1, {snippet}) AS snippet, "
+            "-bm25(tickets_fts, 2.0, 1.0) AS rank, t.updated_at AS updated_at "
+            "FROM tickets_fts JOIN tickets t ON t.id = tickets_fts.rowid "
+            "WHERE tickets_fts MATCH :query"
+            + (" AND t.project_id = :project_id" if scoped else "")
+        ),
+        'comment': (
+            "SELECT 'comment' AS kind, c.id AS id, t.project_id AS project_id, c.ticket_id AS parent_id, "
+            f"t.title AS title, snippet(comments_fts, 0, {snippet}) AS snippet, "
+            "-bm25(comments_fts) AS rank, c.created_at AS updated_at "
+            "FROM comments_fts JOIN comments c ON c.id = comments_fts.rowid "
+            "JOIN tickets t ON t.id = c.ticket_id "
+            "WHERE comments_fts MATCH :query"
+            + (" AND t.project_id = :project_id" if scoped else "")
+        ),
+        'message': (
+            "SELECT 'message' AS kind, m.id AS id, v.project_id AS project_id, m.conversation_id AS parent_id, "
+            f"v.title AS title, snippet(messages_fts, 0, {snippet}) AS snippet, "
+            "-bm25(messages_fts) AS rank, m.timestamp AS updated_at "
+            "FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid "
+            "JOIN conversations v ON v.id = m.conversation_id "
+            "WHERE messages_fts MATCH :query"
+            + (" AND v.project_id = :project_id" if scoped else "")
+        ),
+    }
+    return (" UNION ALL ".join(branches[kind] for kind in types)
+            + " ORDER BY rank DESC, updated_at DESC LIMIT :limit OFFSET :offset")
+
+
+def _postgres_search_sql(types: Sequence[str], scoped: bool) -> str:
+    branches = {
+        'ticket': (
+            "SELECT 'ticket' AS kind, t.id AS id, t.project_id AS project_id, NULL::integer AS parent_id, "
+            "t.title AS title, concat_ws(' ', t.title, t.description) AS document, "
+            "ts_rank(t.search_vector, q.query) AS rank, t.updated_at AS updated_at "
+            "FROM tickets t, q WHERE t.search_vector @@ q.query"
+            + (" AND t.project_id = :project_id" if scoped else "")
+        ),
+        'comment': (
+            "SELECT 'comment' AS kind, c.id AS id, t.project_id AS project_id, c.ticket_id AS parent_id, "
+            "t.title AS title, c.content AS document, "
+            "ts_rank(c.search_vector, q.query) AS rank, c.created_at AS updated_at "
+            "FROM comments c JOIN tickets t ON t.id = c.ticket_id, q WHERE c.search_vector @@ q.query"
+            + (" AND t.project_id = :project_id" if scoped else "")
+        ),
+        'message': (
+            "SELECT 'message' AS kind, m.id AS id, v.project_id AS project_id, m.conversation_id AS parent_id, "
+            "v.title AS title, m.content AS document, "
+            "ts_rank(m.search_vector, q.query) AS rank, m.timestamp AS updated_at "
+            "FROM messages m JOIN conversations v ON v.id = m.conversation_id, q WHERE m.search_vector @@ q.query"
+            + (" AND v.project_id = :project_id" if scoped else "")
+        ),
+    }
+    # Headlines are costly, so they are made only for the rows of the page
+    return (
+        f"WITH q AS (SELECT websearch_to_tsquery('{SEARCH_CONFIG}', :query) AS query) "
+        "SELECT page.kind, page.id, page.project_id, page.parent_id, page.title, page.rank, page.updated_at, "
+        f"ts_headline('{SEARCH_CONFIG}', page.document, q.query, :headline_options) AS snippet "
+        "FROM (" + " UNION ALL ".join(branches[kind] for kind in types)
+        + " ORDER BY rank DESC, updated_at DESC LIMIT :limit OFFSET :offset) page, q "
+        "ORDER BY page.rank DESC, page.updated_at DESC"
+    )
+
+
+def _result_to_dict(row) -> Dict[str, Any]:
+    """Serialize a search hit; the snippet is HTML with matches wrapped in <mark>."""
+    result = {
+        'type': row['kind'],
+        'id': row['id'],
+        'project_id': row['project_id'],
+        'title': row['title'],
+        'snippet': _highlight(row['snippet'] or ''),
+        'rank': round(float(row['rank']), 4),
+        'updated_at': row['updated_at']
+    }
+    if row['kind'] == 'comment':
+        result['ticket_id'] = row['parent_id']
+    elif row['kind'] == 'message':
+        result['conversation_id'] = row['parent_id']
+    return result
+
+
+def _highlight(snippet: str) -> str:
+    return html.escape(snippet).replace(_MARK_START, "<mark>").replace(_MARK_END, "</mark>")
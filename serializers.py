@@ -0,0 +1,137 @@
+from typing import Any, Dict, Iterable, List, Optional
+
+from models import Agent, Ticket, Comment, Message
+from blob_store import blob_digest
+
+
+def load_agents(agent_ids: Iterable[Optional[int]]) -> Dict[int, Agent]:
+    """
+    Load the agents referenced by a batch of rows with a single query.
+
+    Args:
+        agent_ids (Iterable[Optional[int]]): Agent IDs, possibly with None and duplicates
+
+    Returns:
+        Dict[int, Agent]: The agents keyed by ID
+    """
+    ids = {agent_id for agent_id in agent_ids if agent_id}
+    if not ids:
+        return {}
+    return {agent.id: agent for agent in Agent.query.filter(Agent.id.in_(ids)).all()}
+
+
+def agent_to_dict(agent: Optional[Agent]) -> Optional[Dict[str, Any]]:
+    """
+    Serialize the agent summary embedded in tickets, comments and messages.
+
+    Args:
+        agent (Optional[Agent]): The agent, if any
+
+    Returns:
+        Optional[Dict[str, Any]]: The agent's id, name and role, or None
+    """
+    if agent is None:
+        return None
+    return {
+        'id': agent.id,
+        'name': agent.name,
+        'role': agent.role.value
+    }
+
+
+def ticket_to_dict(ticket: Ticket, agents: Dict[int, Agent]) -> Dict[str, Any]:
+    """
+    Serialize a ticket.
+
+    Args:
+        ticket (Ticket): The ticket
+        agents (Dict[int, Agent]): Preloaded agents keyed by ID
+
+    Returns:
+        Dict[str, Any]: The ticket data
+    """
+    return {
+        'id': ticket.id,
+        'title': ticket.title,
+        'description': ticket.description,
+        'status': ticket.status.value,
+        'priority': ticket.priority.value,
+        'created_at': ticket.created_at,
+        'updated_at': ticket.updated_at,
+        'due_date': ticket.due_date,
+        'project_id': ticket.project_id,
+        'assigned_to': agent_to_dict(agents.get(ticket.assigned_agent_id))
+    }
+
+
+def comment_to_dict(comment: Comment, agents: Dict[int, Agent]) -> Dict[str, Any]:
+    """
+    Serialize a ticket comment.
+
+    Args:
+        comment (Comment): The comment
+        agents (Dict[int, Agent]): Preloaded agents keyed by ID
+
+    Returns:
+        Dict[str, Any]: The comment data
+    """
+    return {
+        'id': comment.id,
+        'content': comment.content,
+        'created_at': comment.created_at,
+        'is_user': comment.is_user,
+        'agent': agent_to_dict(agents.get(comment.agent_id))
+    }
+
+
+def message_to_dict(message: Message, agents: Dict[int, Agent]) -> Dict[str, Any]:
+    """
+    Serialize a conversation message.
+
+    Args:
+        message (Message): The message
+        agents (Dict[int, Agent]): Preloaded agents keyed by ID
+
+    Returns:
+        Dict[str, Any]: The message data
+    """
+    agent = agents.get(message.agent_id)
+    return {
+        'id': message.id,
+        'content': message.content,
+        'timestamp': message.timestamp,
+        'is_user': message.is_user,
+        'agent_name': agent.name if agent else None,
+        'has_image': message.has_image,
+        'image_path': message.image_path,
+        'image_url': _image_url(message.image_path)
+    }
+
+
+def serialize_ticket(ticket: Ticket) -> Dict[str, Any]:
+    """Serialize a single ticket, loading its assigned agent."""
+    return ticket_to_dict(ticket, load_agents([ticket.assigned_agent_id]))
+
+
+def serialize_tickets(tickets: List[Ticket]) -> List[Dict[str, Any]]:
+    """Serialize tickets, resolving every assigned agent in one query."""
+    agents = load_agents(ticket.assigned_agent_id for ticket in tickets)
+    return [ticket_to_dict(ticket, agents) for ticket in tickets]
+
+
+def serialize_comments(comments: List[Comment]) -> List[Dict[str, Any]]:
+    """Serialize comments, resolving every authoring agent in one query."""
+    agents = load_agents(comment.agent_id for comment in comments)
+    return [comment_to_dict(comment, agents) for comment in comments]
+
+
+def serialize_messages(messages: List[Message]) -> List[Dict[str, Any]]:
+    """Serialize messages, resolving every authoring agent in one query."""
+    agents = load_agents(message.agent_id for message in messages)
+    return [message_to_dict(message, agents) for message in messages]
+
+
+def _image_url(image_path: Optional[str]) -> Optional[str]:
+    """URL an uploaded image is served from, or the legacy path as stored."""
+    digest = blob_digest(image_path)
+    return f"/api/blobs/{digest}" if digest else image_path
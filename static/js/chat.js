@@ -72,7 +72,14 @@ document.addEventListener('DOMContentLoaded', function() {
             const conversationId = parseInt(activeItem.getAttribute('data-id'));
             console.log('Found active conversation:', conversationId);
             activeConversationId = conversationId;
-            loadConversation(conversationId);
+            
+            // Reuse the messages rendered with the page instead of fetching them again
+            const renderedWrapper = document.querySelector('#chatMessages .messages-wrapper[data-conversation-id]');
+            if (renderedWrapper && parseInt(renderedWrapper.getAttribute('data-conversation-id')) === conversationId) {
+                adoptRenderedMessages(renderedWrapper);
+            } else {
+                loadConversation(conversationId);
+            }
         } else {
             // No active conversation, but we have conversations, load the first one
             const firstId = parseInt(conversationItems[0].getAttribute('data-id'));
@@ -111,6 +118,24 @@ document.addEventListener('DOMContentLoaded', function() {
     } else {
         console.error('New conversation button not found!');
     }
+    
+    // Pick up messages written elsewhere (another tab, a background job) when the tab regains focus
+    document.addEventListener('visibilitychange', function() {
+        if (document.visibilityState === 'visible') {
+            fetchNewMessages();
+        }
+    });
+    
+    // Apply messages and conversation changes made elsewhere as they happen
+    const conversationsList = document.getElementById('conversationsList');
+    subscribeToEvents(
+        { project_id: conversationsList ? conversationsList.getAttribute('data-project-id') : null },
+        handleActivityEvent,
+        function() {
+            updateConversationsList();
+            fetchNewMessages();
+        }
+    );
 });
 
 function loadConversation(conversationId) {
@@ -185,10 +210,10 @@ function appendMessageToChat(message) {
         </div>
     `;
     
-    if (message.has_image && message.image_path) {
+    if (message.has_image && message.image_url) {
         messageContent += `
             <div class="message-image mt-2">
-                <img src="${message.image_path}" class="img-fluid rounded" alt="Uploaded image">
+                <img src="${message.image_url}" class="img-fluid rounded" alt="Uploaded image">
             </div>
         `;
     }
@@ -203,6 +228,20 @@ function appendMessageToChat(message) {
 // Store the active conversation ID
 let activeConversationId = null;
 
+// Oldest and newest message IDs shown for the active conversation;
+// lastMessageId is null until the conversation has loaded and 0 if it is empty
+let firstMessageId = null;
+let lastMessageId = null;
+
+// Number of messages fetched per page
+const MESSAGE_PAGE_SIZE = 50;
+// State of the incremental message fetch, see fetchNewMessages
+let fetchingNewMessages = false;
+let refetchNewMessages = false;
+const skippedMessageIds = new Set();
+// True while a reply streams in; it is fetched once the stream is done
+let sendingMessage = false;
+
 /**
  * Create a new conversation
  */
@@ -234,6 +273,8 @@ function createConversation() {
     .then(data => {
         console.log('Conversation created:', data);
         activeConversationId = data.id;
+        firstMessageId = null;
+        lastMessageId = 0;
         
         // Clear chat messages
         const chatContainer = document.getElementById('chatMessages');
@@ -321,44 +362,41 @@ function sendMessage() {
     }
     
     console.log('Sending API request to server');
-    fetch(`/api/conversations/${activeConversationId}/messages`, {
+    sendingMessage = true;
+    fetch(`/api/conversations/${activeConversationId}/messages/stream`, {
         method: 'POST',
         body: formData
     })
     .then(response => {
         console.log('Received response with status:', response.status);
-        if (!response.ok) {
+        if (!response.ok || !response.body) {
             throw new Error(`Server responded with status ${response.status}`);
         }
-        return response.json();
-    })
-    .then(data => {
-        console.log('Parsed response data:', data);
         
-        // Hide typing indicator
-        hideTypingIndicator();
+        let messageText = null;
+        let replyText = '';
         
-        if (data.success) {
-            console.log('Message sent successfully, displaying agent response');
-            // Display agent response
-            displayMessage(data.response, false, data.agent_name);
-            
-            // Update conversations list if needed
-            if (data.conversation_updated) {
-                updateConversationsList();
-            }
-            
-            // Ensure we scroll to the bottom after new content is added
-            if (chatContainer) {
-                console.log('Scrolling chat to bottom');
-                setTimeout(() => {
+        return readEventStream(response, (event, data) => {
+            if (event === 'start') {
+                // Replace the typing indicator with an empty agent bubble
+                hideTypingIndicator();
+                messageText = startAgentMessage(data.agent_name);
+            } else if (event === 'token') {
+                replyText += data.content;
+                if (messageText) {
+                    messageText.innerHTML = formatText(replyText);
                     chatContainer.scrollTop = chatContainer.scrollHeight;
-                }, 100);
+                }
+            } else if (event === 'done') {
+                console.log('Message streamed successfully');
+                sendingMessage = false;
+                // Both messages are already on screen; fetch anything else that arrived meanwhile
+                // The sidebar entry is updated by the activity event for the reply
+                fetchNewMessages([data.user_message_id, data.message_id]);
+            } else if (event === 'error') {
+                throw new Error(data.error || 'Unknown error');
             }
-        } else {
-            console.error('API reported error:', data.error);
-            throw new Error(data.error || 'Unknown error');
-        }
+        });
     })
     .catch(error => {
         console.error('Error sending message:', error);
@@ -366,6 +404,8 @@ function sendMessage() {
         displayAlert('Failed to send message. Please try again.', 'danger');
     })
     .finally(() => {
+        sendingMessage = false;
+        
         // Re-enable submit button
         if (submitButton) {
             submitButton.disabled = false;
@@ -374,10 +414,94 @@ function sendMessage() {
     });
 }
 
+/**
+ * Read a Server-Sent Events response body, calling onEvent(event, data) per frame
+ */
+function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    
+    function dispatch(frame) {
+        let event = 'message';
+        let data = '';
+        frame.split('\n').forEach(line => {
+            if (line.startsWith('event: ')) {
+                event = line.slice(7);
+            } else if (line.startsWith('data: ')) {
+                data += line.slice(6);
+            }
+        });
+        if (data) {
+            onEvent(event, JSON.parse(data));
+        }
+    }
+    
+    function pump() {
+        return reader.read().then(({ done, value }) => {
+            if (done) {
+                if (buffer.trim()) {
+                    dispatch(buffer);
+                }
+                return;
+            }
+            buffer += decoder.decode(value, { stream: true });
+            
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                dispatch(buffer.slice(0, boundary));
+                buffer = buffer.slice(boundary + 2);
+            }
+            return pump();
+        });
+    }
+    
+    return pump();
+}
+
+/**
+ * Add an empty agent message bubble and return its text element for streaming into
+ */
+function startAgentMessage(agentName) {
+    const chatContainer = document.getElementById('chatMessages');
+    
+    let messagesWrapper = chatContainer.querySelector('.messages-wrapper');
+    if (!messagesWrapper) {
+        messagesWrapper = document.createElement('div');
+        messagesWrapper.className = 'messages-wrapper w-100';
+        messagesWrapper.style.display = 'flex';
+        messagesWrapper.style.flexDirection = 'column';
+        chatContainer.appendChild(messagesWrapper);
+    }
+    
+    const messageRow = document.createElement('div');
+    messageRow.className = 'message-row d-flex justify-content-start';
+    messageRow.style.width = '100%';
+    messageRow.style.marginBottom = '10px';
+    
+    const messageBubble = document.createElement('div');
+    messageBubble.className = 'message-bubble agent-message';
+    messageBubble.style.maxWidth = '80%';
+    messageBubble.style.wordBreak = 'break-word';
+    messageBubble.innerHTML = `
+        <div class="message-content agent">
+            <div class="message-header">
+                <span class="agent-name">${agentName || 'Fractal Node'}</span>
+            </div>
+            <div class="message-text"></div>
+        </div>
+    `;
+    
+    messageRow.appendChild(messageBubble);
+    messagesWrapper.appendChild(messageRow);
+    
+    return messageBubble.querySelector('.message-text');
+}
+
 /**
  * Display a message in the chat container
  */
-function displayMessage(message, isUser, agentName = null) {
+function displayMessage(message, isUser, agentName = null, prepend = false) {
     console.log(`Displaying ${isUser ? 'user' : 'agent'} message:`, { message, agentName });
     
     const chatContainer = document.getElementById('chatMessages');
@@ -453,6 +577,11 @@ function displayMessage(message, isUser, agentName = null) {
     
     // Build the DOM structure
     messageRow.appendChild(messageBubble);
+    if (prepend) {
+        // Older messages go above the current ones and must not move the scroll position
+        messagesWrapper.insertBefore(messageRow, messagesWrapper.firstChild);
+        return;
+    }
     messagesWrapper.appendChild(messageRow);
     
     // Log DOM state for debugging
@@ -606,6 +735,57 @@ function updateConversationsList() {
         });
 }
 
+/**
+ * Apply a live activity event to the chat page
+ */
+function handleActivityEvent(event) {
+    if (event.subject_type !== 'conversation') return;
+    
+    if (event.subject_id === activeConversationId && !sendingMessage) {
+        fetchNewMessages();
+    }
+    if (event.conversation) {
+        updateConversationItem(event.conversation);
+    }
+}
+
+/**
+ * Update or insert a conversation in the sidebar and move it to the top
+ */
+function updateConversationItem(conv) {
+    const conversationsList = document.getElementById('conversationsList');
+    if (!conversationsList) return;
+    
+    let item = conversationsList.querySelector(`.conversation-item[data-id="${conv.id}"]`);
+    if (!item) {
+        // Drop the "No conversations yet" placeholder
+        conversationsList.querySelectorAll('li:not(.conversation-item)').forEach(el => el.remove());
+        
+        item = document.createElement('li');
+        item.className = 'conversation-item list-group-item';
+        item.setAttribute('data-id', conv.id);
+        item.innerHTML = `
+            <div class="d-flex w-100 justify-content-between">
+                <h6 class="mb-1"></h6>
+                <small></small>
+            </div>
+        `;
+        item.addEventListener('click', function() {
+            loadConversation(conv.id);
+        });
+    }
+    
+    item.classList.toggle('active', conv.id === activeConversationId);
+    if ('title' in conv) {
+        item.querySelector('h6').textContent = conv.title || 'Untitled Conversation';
+    }
+    if (conv.updated_at) {
+        const date = new Date(conv.updated_at);
+        item.querySelector('small').textContent = date.toLocaleString([], { month: 'short', day: 'numeric', hour: '2-digit', minute: '2-digit' });
+    }
+    conversationsList.insertBefore(item, conversationsList.firstChild);
+}
+
 /**
  * Load a specific conversation
  */
@@ -614,6 +794,8 @@ function loadConversation(conversationId) {
     
     // Mark as active
     activeConversationId = conversationId;
+    firstMessageId = null;
+    lastMessageId = null;
     
     // Update active state in list
     document.querySelectorAll('.conversation-item').forEach(item => {
@@ -650,9 +832,9 @@ function loadConversation(conversationId) {
     loadingElement.innerHTML = '<div class="spinner-border text-primary" role="status"><span class="visually-hidden">Loading...</span></div>';
     chatContainer.appendChild(loadingElement);
     
-    // Load messages
+    // Load the latest page of messages
     console.log(`Fetching messages for conversation ${conversationId}`);
-    fetch(`/api/conversations/${conversationId}/messages`)
+    fetch(`/api/conversations/${conversationId}/messages?limit=${MESSAGE_PAGE_SIZE}`)
         .then(response => {
             console.log('Message fetch response status:', response.status);
             return response.json();
@@ -666,12 +848,15 @@ function loadConversation(conversationId) {
                 loadingElement.remove();
             }
             
+            // Ignore the response if another conversation was opened meanwhile
+            if (conversationId !== activeConversationId) return;
+            
+            firstMessageId = data.first_id;
+            lastMessageId = data.last_id || 0;
+            
             if (data.messages && data.messages.length > 0) {
                 console.log(`Found ${data.messages.length} messages to display`);
                 
-                // Sort messages by timestamp if needed
-                data.messages.sort((a, b) => new Date(a.timestamp) - new Date(b.timestamp));
-                
                 // Clear any previous messages to be safe
                 while (chatContainer.firstChild) {
                     chatContainer.removeChild(chatContainer.firstChild);
@@ -690,6 +875,8 @@ function loadConversation(conversationId) {
                 // Log final count to verify all messages were added
                 console.log(`Chat container now has ${chatContainer.childElementCount} child elements`);
                 
+                setLoadEarlierVisible(data.has_more);
+                
                 // Force scroll to bottom
                 setTimeout(() => {
                     chatContainer.scrollTop = chatContainer.scrollHeight;
@@ -718,6 +905,133 @@ function loadConversation(conversationId) {
         });
 }
 
+/**
+ * Take over the messages rendered with the page for the active conversation
+ */
+function adoptRenderedMessages(messagesWrapper) {
+    const rows = messagesWrapper.querySelectorAll('.message-row[data-message-id]');
+    lastMessageId = 0;
+    if (rows.length > 0) {
+        firstMessageId = parseInt(rows[0].getAttribute('data-message-id'));
+        lastMessageId = parseInt(rows[rows.length - 1].getAttribute('data-message-id'));
+    }
+    setLoadEarlierVisible(messagesWrapper.getAttribute('data-has-more') === 'true');
+    
+    const chatContainer = document.getElementById('chatMessages');
+    chatContainer.scrollTop = chatContainer.scrollHeight;
+}
+
+/**
+ * Fetch and append messages newer than the last one shown
+ */
+function fetchNewMessages(skipIds = []) {
+    // Messages already on screen from the streamed reply are never appended twice
+    skipIds.forEach(id => skippedMessageIds.add(id));
+    
+    const conversationId = activeConversationId;
+    if (!conversationId || lastMessageId === null) return;
+    
+    // Live events, focus changes and replies can all ask at once; run one fetch at a time
+    if (fetchingNewMessages) {
+        refetchNewMessages = true;
+        return;
+    }
+    fetchingNewMessages = true;
+    
+    fetch(`/api/conversations/${conversationId}/messages?after_id=${lastMessageId}&limit=${MESSAGE_PAGE_SIZE}`)
+        .then(response => {
+            if (!response.ok) {
+                throw new Error(`Server responded with status ${response.status}`);
+            }
+            return response.json();
+        })
+        .then(data => {
+            if (conversationId !== activeConversationId) return;
+            
+            data.messages.forEach(msg => {
+                if (!skippedMessageIds.has(msg.id)) {
+                    displayMessage(msg.content, msg.is_user, msg.agent_name);
+                }
+            });
+            lastMessageId = Math.max(lastMessageId, data.last_id || lastMessageId);
+            
+            if (data.has_more) {
+                refetchNewMessages = true;
+            }
+        })
+        .catch(error => {
+            console.error('Error fetching new messages:', error);
+        })
+        .finally(() => {
+            fetchingNewMessages = false;
+            if (refetchNewMessages) {
+                refetchNewMessages = false;
+                fetchNewMessages();
+            }
+        });
+}
+
+/**
+ * Fetch the page of messages before the oldest one shown and prepend it
+ */
+function loadEarlierMessages() {
+    const conversationId = activeConversationId;
+    if (!conversationId || firstMessageId === null) return;
+    
+    const chatContainer = document.getElementById('chatMessages');
+    
+    fetch(`/api/conversations/${conversationId}/messages?before_id=${firstMessageId}&limit=${MESSAGE_PAGE_SIZE}`)
+        .then(response => {
+            if (!response.ok) {
+                throw new Error(`Server responded with status ${response.status}`);
+            }
+            return response.json();
+        })
+        .then(data => {
+            if (conversationId !== activeConversationId) return;
+            
+            // Keep the visible messages in place while older ones are inserted above
+            const previousHeight = chatContainer.scrollHeight;
+            data.messages.slice().reverse().forEach(msg => {
+                displayMessage(msg.content, msg.is_user, msg.agent_name, true);
+            });
+            chatContainer.scrollTop += chatContainer.scrollHeight - previousHeight;
+            
+            if (data.first_id !== null) {
+                firstMessageId = data.first_id;
+            }
+            setLoadEarlierVisible(data.has_more);
+        })
+        .catch(error => {
+            console.error('Error loading earlier messages:', error);
+            displayAlert('Failed to load earlier messages. Please try again.', 'danger');
+        });
+}
+
+/**
+ * Show or hide the button that pages in older messages
+ */
+function setLoadEarlierVisible(visible) {
+    const chatContainer = document.getElementById('chatMessages');
+    if (!chatContainer) return;
+    
+    let button = document.getElementById('loadEarlierMessages');
+    if (!visible) {
+        if (button) button.remove();
+        return;
+    }
+    
+    if (!button) {
+        button = document.createElement('button');
+        button.id = 'loadEarlierMessages';
+        button.type = 'button';
+        button.className = 'btn btn-sm btn-outline-secondary align-self-center my-2';
+        button.textContent = 'Load earlier messages';
+        button.addEventListener('click', loadEarlierMessages);
+    }
+    chatContainer.insertBefore(button, chatContainer.firstChild);
+}
+
 /**
  * Display an alert message
  */
@@ -0,0 +1,42 @@
+/**
+ * Live activity events for Fractalyx pages
+ */
+
+/**
+ * Subscribe to activity events over one long-lived Server-Sent Events connection.
+ *
+ * params may hold project_id and/or conversation_id; without either every
+ * event is received. onEvent(event) is called for each activity event and
+ * onResync() when events were missed and the page should refetch its lists.
+ * The browser reconnects by itself and resumes from the last event received.
+ */
+function subscribeToEvents(params, onEvent, onResync = null) {
+    const query = new URLSearchParams();
+    Object.keys(params || {}).forEach(key => {
+        if (params[key] !== null && params[key] !== undefined && params[key] !== '') {
+            query.set(key, params[key]);
+        }
+    });
+
+    const source = new EventSource(`/api/events?${query.toString()}`);
+
+    source.addEventListener('activity', function(e) {
+        try {
+            onEvent(JSON.parse(e.data));
+        } catch (error) {
+            console.error('Error handling activity event:', error);
+        }
+    });
+
+    source.addEventListener('resync', function() {
+        if (onResync) {
+            onResync();
+        }
+    });
+
+    source.addEventListener('error', function() {
+        console.log('Event stream interrupted, reconnecting...');
+    });
+
+    return source;
+}
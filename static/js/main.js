@@ -143,7 +143,9 @@ function checkOllamaStatus() {
     fetch('/api/ollama/status')
         .then(response => response.json())
         .then(data => {
-            if (data.running) {
+            if (data.running && data.ready === false) {
+                statusElement.innerHTML = '<span class="badge bg-info">Ollama Warming Up</span>';
+            } else if (data.running) {
                 statusElement.innerHTML = '<span class="badge bg-success">Ollama Running</span>';
             } else {
                 statusElement.innerHTML = '<span class="badge bg-danger">Ollama Not Running</span>';
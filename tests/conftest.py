@@ -0,0 +1,24 @@
+import os
+import sys
+
+import pytest
+
+# Configure the app before it is imported: an in-memory database, and no
+# background work that would reach for Ollama
+os.environ["DATABASE_URL"] = "sqlite://"
+os.environ.setdefault("OLLAMA_WARMUP", "false")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app as flask_app, db  # noqa: E402
+
+
+@pytest.fixture
+def app():
+    """The app inside an app context, with every table emptied afterwards."""
+    with flask_app.app_context():
+        yield flask_app
+        db.session.rollback()
+        for table in reversed(db.metadata.sorted_tables):
+            db.session.execute(table.delete())
+        db.session.commit()
+        db.session.remove()
@@ -0,0 +1,111 @@
+import threading
+import time
+
+from app import db
+from models import AgentRole, Message, Project
+from agent_system.agents import CoordinatorAgent
+from agent_system.conversation_store import ConversationContextStore, conversation_context_store
+from agent_system.coordinator import AgentCoordinator
+from agent_system.ollama_client import OllamaClient
+from agent_system.registry import agent_registry
+
+
+def run_turns(app, store, agent, conversation_ids, hold=0.02):
+    """Run one turn per conversation ID at once and return the peak number inside a turn together."""
+    lock = threading.Lock()
+    state = {"active": 0, "peak": 0}
+
+    def take_turn(conversation_id):
+        with app.app_context():
+            with store.turn(conversation_id, agent) as window:
+                with lock:
+                    state["active"] += 1
+                    state["peak"] = max(state["peak"], state["active"])
+                window.add("user", "question")
+                time.sleep(hold)
+                window.add("assistant", "answer")
+                with lock:
+                    state["active"] -= 1
+
+    threads = [threading.Thread(target=take_turn, args=(conversation_id,))
+               for conversation_id in conversation_ids]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return state["peak"]
+
+
+def test_turns_on_one_conversation_run_one_at_a_time(app):
+    store = ConversationContextStore()
+    agent = CoordinatorAgent(1, "Coordinator", AgentRole.COORDINATOR)
+
+    assert run_turns(app, store, agent, [1] * 4) == 1
+    # Every turn landed in the one shared window, none lost or repeated
+    assert len(store.get(1, agent)) == 8
+    assert store._turn_locks == {}
+
+
+def test_turns_on_different_conversations_overlap(app):
+    store = ConversationContextStore()
+    agent = CoordinatorAgent(1, "Coordinator", AgentRole.COORDINATOR)
+
+    assert run_turns(app, store, agent, [1, 2, 3]) > 1
+
+
+def test_evicting_a_window_mid_turn_keeps_turns_serialized(app):
+    # Room for one window, so interleaved conversations evict each other
+    store = ConversationContextStore(max_conversations=1)
+    agent = CoordinatorAgent(1, "Coordinator", AgentRole.COORDINATOR)
+
+    lock = threading.Lock()
+    state = {"active": 0, "peak": 0}
+    entered = threading.Event()
+    release = threading.Event()
+
+    def take_turn():
+        with app.app_context():
+            with store.turn(1, agent):
+                with lock:
+                    state["active"] += 1
+                    state["peak"] = max(state["peak"], state["active"])
+                entered.set()
+                release.wait(1)
+                with lock:
+                    state["active"] -= 1
+
+    first = threading.Thread(target=take_turn)
+    first.start()
+    entered.wait(1)
+    store.get(2, agent)
+    second = threading.Thread(target=take_turn)
+    second.start()
+    time.sleep(0.05)
+    release.set()
+    first.join()
+    second.join()
+
+    assert state["peak"] == 1
+
+
+def test_dropped_stream_leaves_the_window_matching_the_stored_messages(app, monkeypatch):
+    agent_registry.invalidate()
+    project = Project(name="Streams")
+    db.session.add(project)
+    db.session.commit()
+    coordinator = AgentCoordinator(project.id)
+    conversation_id = coordinator.create_conversation("Chat")
+    conversation_context_store.invalidate(conversation_id)
+    monkeypatch.setattr(OllamaClient, "generate_stream", lambda self, *args, **kwargs: iter(["Hel", "lo"]))
+
+    list(coordinator.stream_user_message("first", conversation_id))
+    stream = coordinator.stream_user_message("second", conversation_id)
+    next(stream)
+    # The client goes away mid-reply
+    stream.close()
+
+    window = conversation_context_store.get(conversation_id, coordinator.coordinator_agent)
+    stored = Message.query.filter_by(conversation_id=conversation_id).order_by(Message.id).all()
+    assert [turn[2] for turn in window._turns] == [message.id for message in stored]
+    assert window.messages()[-1]["content"] == "Hel"
+    agent_registry.invalidate()
@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from models import Conversation, Message, Project
+from agent_system import embeddings
+from agent_system.embeddings import EMBEDDING_SYNC_LAG, EmbeddingIndex
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A monotonic clock the test moves by hand."""
+    now = [1000.0]
+    monkeypatch.setattr(embeddings.time, "monotonic", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def conversation(app):
+    project = Project(name="Embeddings")
+    db.session.add(project)
+    db.session.flush()
+    conversation = Conversation(title="Chat", project_id=project.id)
+    db.session.add(conversation)
+    db.session.commit()
+    return conversation
+
+
+def add_message(conversation, content, timestamp=None):
+    message = Message(content=content, is_user=True, conversation_id=conversation.id,
+                      timestamp=timestamp or datetime.utcnow())
+    db.session.add(message)
+    db.session.commit()
+    return message.id
+
+
+def test_messages_wait_for_the_lag_by_id(conversation, clock):
+    index = EmbeddingIndex(directory=None)
+    first = add_message(conversation, "settled")
+
+    assert index._pending("message", None) == ([], None)
+
+    clock[0] += EMBEDDING_SYNC_LAG
+    second = add_message(conversation, "written after the first look")
+    items, watermark = index._pending("message", None)
+    assert [item[0] for item in items] == [first]
+    assert watermark == first
+
+    clock[0] += EMBEDDING_SYNC_LAG
+    items, watermark = index._pending("message", watermark)
+    assert [item[0] for item in items] == [second]
+
+
+def test_old_timestamp_does_not_skip_lower_ids(conversation, clock):
+    index = EmbeddingIndex(directory=None)
+    recent = add_message(conversation, "just written")
+    # A streamed reply's user message is stored with the time it was received
+    streamed = add_message(conversation, "received minutes ago", datetime.utcnow() - timedelta(minutes=5))
+
+    index._pending("message", None)
+    clock[0] += EMBEDDING_SYNC_LAG
+    items, watermark = index._pending("message", None)
+
+    assert [item[0] for item in items] == [recent, streamed]
+    assert watermark == streamed
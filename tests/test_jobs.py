@@ -0,0 +1,85 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import update
+
+from app import db
+from models import Job, JobStatus, Project, Ticket
+from agent_system.agents import BaseAgent
+from agent_system.coordinator import ANALYSIS_VISIBILITY_TIMEOUT
+from agent_system.jobs import JobQueue
+from agent_system.registry import agent_registry
+
+PLAN = json.dumps([
+    {"title": "Build the API", "priority": "HIGH", "subtasks": [{"title": "Add the routes"}]},
+    {"title": "Write the docs"},
+])
+
+
+@pytest.fixture
+def analysis(app):
+    """A queue without worker threads, and a queued planner follow-up for a new project."""
+    agent_registry.invalidate()
+    project = Project(name="Jobs")
+    db.session.add(project)
+    db.session.commit()
+
+    queue = JobQueue(workers=0, visibility_timeout=ANALYSIS_VISIBILITY_TIMEOUT, kinds=["analyze_project"])
+    job = queue.enqueue("analyze_project", {"project_id": project.id,
+                                            "user_message": "new task: build an API",
+                                            "agent_response": "On it"},
+                        project_id=project.id)
+    yield queue, job.id
+    agent_registry.invalidate()
+
+
+def take_over(job_id):
+    """Hand a running job to another worker, as a claim after its visibility timeout would."""
+    db.session.execute(update(Job).where(Job.id == job_id).values(locked_by="other-worker"))
+    db.session.commit()
+
+
+def test_repeated_run_creates_no_more_tickets(analysis, monkeypatch):
+    queue, job_id = analysis
+    monkeypatch.setattr(BaseAgent, "process_message", lambda self, *args, **kwargs: PLAN)
+
+    queue._run(queue._claim("worker-1"))
+    job = db.session.get(Job, job_id)
+    assert job.status == JobStatus.SUCCEEDED
+    assert Ticket.query.count() == 3
+
+    # The job is run again, as if it had been lost after creating its tickets
+    job.status = JobStatus.RUNNING
+    job.locked_at = datetime.utcnow() - timedelta(seconds=ANALYSIS_VISIBILITY_TIMEOUT + 1)
+    db.session.commit()
+    monkeypatch.setattr(BaseAgent, "process_message", lambda self, *args, **kwargs: pytest.fail("planner ran again"))
+
+    queue._run(queue._claim("worker-2"))
+    assert db.session.get(Job, job_id).status == JobStatus.SUCCEEDED
+    assert Ticket.query.count() == 3
+
+
+def test_run_taken_over_mid_generation_creates_nothing(analysis, monkeypatch):
+    queue, job_id = analysis
+
+    def slow_planner(self, *args, **kwargs):
+        take_over(job_id)
+        return PLAN
+    monkeypatch.setattr(BaseAgent, "process_message", slow_planner)
+
+    queue._run(queue._claim("worker-1"))
+
+    job = db.session.get(Job, job_id)
+    assert Ticket.query.count() == 0
+    # The outcome is left to the worker that took the job over
+    assert job.status == JobStatus.RUNNING
+    assert job.locked_by == "other-worker"
+    assert job.result is None
+
+
+def test_visibility_timeout_outlasts_a_generation():
+    from agent_system.ollama_client import DEFAULT_READ_TIMEOUT
+    from agent_system.scheduler import QUEUE_TIMEOUT
+
+    assert ANALYSIS_VISIBILITY_TIMEOUT > QUEUE_TIMEOUT + DEFAULT_READ_TIMEOUT
@@ -0,0 +1,33 @@
+import pytest
+
+from app import db
+from models import Job, JobStatus
+from agent_system.jobs import job_queue
+from agent_system.maintenance import schedule_activity_prune
+
+
+@pytest.fixture(autouse=True)
+def no_workers(app, monkeypatch):
+    """Jobs are run by hand, not by background worker threads."""
+    monkeypatch.setattr(job_queue, "start", lambda: None)
+
+
+def queued_prunes():
+    return Job.query.filter_by(kind="prune_activity", status=JobStatus.QUEUED).count()
+
+
+def test_workers_starting_together_queue_one_prune():
+    assert schedule_activity_prune() is not None
+    assert schedule_activity_prune() is None
+    assert queued_prunes() == 1
+
+
+def test_worker_starting_during_a_prune_leaves_one_chain():
+    schedule_activity_prune()
+    job = job_queue._claim("worker-1")
+    # A worker starts while the prune runs, then the prune queues its successor
+    assert schedule_activity_prune() is not None
+    job_queue._run(job)
+
+    assert db.session.get(Job, job.id).status == JobStatus.SUCCEEDED
+    assert queued_prunes() == 1
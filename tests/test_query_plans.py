@@ -0,0 +1,77 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import and_, create_engine, or_, select, text
+
+from app import db
+from migrations import run_migrations
+from models import Message, Project, Ticket, TicketStatus
+from agent_system.executor import ticket_queue
+from agent_system.jobs import job_queue
+
+
+@pytest.fixture
+def engine():
+    """
+    A SQLite database whose tables predate the indexes, brought up to date by
+    the migrations the way an existing deployment is.
+    """
+    engine = create_engine("sqlite://")
+    db.metadata.create_all(engine)
+    with engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                connection.execute(text(f"DROP INDEX {index.name}"))
+    run_migrations(engine, db.metadata)
+    yield engine
+    engine.dispose()
+
+
+def query_plan(engine, statement):
+    """The EXPLAIN QUERY PLAN details of a statement, as one string."""
+    sql = statement.compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True})
+    with engine.connect() as connection:
+        rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}").all()
+    return "\n".join(row[-1] for row in rows)
+
+
+def uses_index(plan, name):
+    return f"USING INDEX {name}" in plan or f"USING COVERING INDEX {name}" in plan
+
+
+def test_message_paging_uses_conversation_id_index(engine):
+    statement = (select(Message)
+                 .where(Message.conversation_id == 1, Message.id < 500)
+                 .order_by(Message.id.desc())
+                 .limit(50))
+
+    assert uses_index(query_plan(engine, statement), "ix_messages_conversation_id_id")
+
+
+def test_project_tickets_by_status_use_project_status_index(engine):
+    statement = select(Ticket).where(Ticket.project_id == 1, Ticket.status == TicketStatus.OPEN)
+
+    assert uses_index(query_plan(engine, statement), "ix_tickets_project_id_status")
+
+
+def test_project_listing_keyset_uses_updated_at_index(engine):
+    cursor = datetime(2024, 1, 1)
+    statement = (select(Project)
+                 .where(or_(Project.updated_at < cursor,
+                            and_(Project.updated_at == cursor, Project.id < 100)))
+                 .order_by(Project.updated_at.desc(), Project.id.desc())
+                 .limit(21))
+
+    plan = query_plan(engine, statement)
+    assert uses_index(plan, "ix_projects_updated_at_id")
+    # The index supplies the order, so no sort step is needed
+    assert "USE TEMP B-TREE FOR ORDER BY" not in plan
+
+
+@pytest.mark.parametrize("queue", [job_queue, ticket_queue], ids=["general", "ticket"])
+def test_claiming_queued_jobs_uses_status_run_after_index(app, engine, queue):
+    plan = query_plan(engine, queue._runnable(datetime(2024, 1, 1)).statement)
+
+    # Queued-and-due and stale-running jobs are each found through the index
+    assert plan.count("ix_jobs_status_run_after") == 2
+    assert "SCAN jobs" not in plan
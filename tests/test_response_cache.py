@@ -0,0 +1,56 @@
+import os
+import time
+
+from agent_system.response_cache import ResponseCache
+
+
+def cache_files(directory):
+    return sorted(name for _, _, names in os.walk(directory) for name in names)
+
+
+def test_expired_disk_entry_is_deleted_when_read(tmp_path):
+    cache = ResponseCache(directory=str(tmp_path), ttl=60)
+    key = "ab" + "0" * 62
+    cache._write_disk(key, (time.time() - 120, 1.0, "reply"))
+
+    assert cache.get(key) is None
+    assert cache_files(tmp_path) == []
+
+
+def test_prune_removes_expired_and_leftover_files_and_enforces_cap(tmp_path):
+    cache = ResponseCache(directory=str(tmp_path), ttl=3600, max_disk_bytes=0, prune_interval=3600)
+    keys = [f"{i:02x}" + "0" * 62 for i in range(10)]
+    for i, key in enumerate(keys):
+        cache.put(key, "x" * 1000, 1.0)
+        created = time.time() - 100 + i
+        os.utime(cache._disk_path(key), (created, created))
+
+    expired = cache._disk_path(keys[0])
+    os.utime(expired, (time.time() - 7200, time.time() - 7200))
+    leftover = os.path.join(os.path.dirname(cache._disk_path(keys[1])), "tmpabc.tmp")
+    with open(leftover, "w") as f:
+        f.write("partial")
+    os.utime(leftover, (time.time() - 7200, time.time() - 7200))
+
+    entry_size = os.path.getsize(cache._disk_path(keys[1]))
+    cache.max_disk_bytes = entry_size * 5
+    result = cache.prune_disk()
+
+    remaining = cache_files(tmp_path)
+    assert not os.path.exists(expired)
+    assert not os.path.exists(leftover)
+    # Down to the low watermark, newest entries kept
+    assert remaining == sorted(f"{key}.json" for key in keys[-4:])
+    assert result["bytes"] <= cache.max_disk_bytes
+
+
+def test_failed_write_leaves_no_temp_file(tmp_path, monkeypatch):
+    cache = ResponseCache(directory=str(tmp_path))
+
+    def fail(*args, **kwargs):
+        raise ValueError("not serializable")
+
+    monkeypatch.setattr("agent_system.response_cache.json.dump", fail)
+    cache.put("cd" + "0" * 62, "reply", 1.0)
+
+    assert cache_files(tmp_path) == []
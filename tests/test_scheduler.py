@@ -0,0 +1,56 @@
+import threading
+import time
+
+import pytest
+
+from agent_system.scheduler import GenerationScheduler, SchedulerTimeout
+
+
+def run_concurrently(schedulers, requests_per_scheduler, hold=0.02):
+    """Hold slots from several schedulers at once and return the peak number held together."""
+    lock = threading.Lock()
+    state = {"active": 0, "peak": 0}
+
+    def generate(scheduler):
+        with scheduler.slot("llama3:8b", score=0):
+            with lock:
+                state["active"] += 1
+                state["peak"] = max(state["peak"], state["active"])
+            time.sleep(hold)
+            with lock:
+                state["active"] -= 1
+
+    threads = [threading.Thread(target=generate, args=(scheduler,))
+               for scheduler in schedulers for _ in range(requests_per_scheduler)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return state["peak"]
+
+
+def test_limit_holds_across_schedulers_sharing_a_slot_dir(tmp_path):
+    # Each scheduler stands in for one gunicorn worker
+    workers = [GenerationScheduler(default_limit=2, slot_dir=str(tmp_path)) for _ in range(3)]
+
+    assert run_concurrently(workers, requests_per_scheduler=4) == 2
+
+
+def test_limit_is_per_process_without_a_slot_dir():
+    workers = [GenerationScheduler(default_limit=2, slot_dir=None) for _ in range(3)]
+
+    assert run_concurrently(workers, requests_per_scheduler=4) == 6
+
+
+def test_waiting_for_a_host_slot_times_out_and_frees_the_local_slot(tmp_path):
+    holder = GenerationScheduler(default_limit=1, slot_dir=str(tmp_path))
+    waiter = GenerationScheduler(default_limit=1, slot_dir=str(tmp_path), queue_timeout=0.1)
+
+    with holder.slot("llama3:8b", score=0):
+        with pytest.raises(SchedulerTimeout):
+            with waiter.slot("llama3:8b", score=0):
+                pass
+        assert waiter.stats()["llama3:8b"]["in_flight"] == 0
+
+    with waiter.slot("llama3:8b", score=0):
+        assert waiter.stats()["llama3:8b"]["in_flight"] == 1
@@ -0,0 +1,86 @@
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+from app import db
+from models import Agent, AgentRole, Comment, Conversation, Message, Project, Ticket
+from serializers import serialize_comments, serialize_messages, serialize_tickets
+
+
+@contextmanager
+def count_queries():
+    """Count the statements sent to the database inside the block."""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, "before_cursor_execute", before_cursor_execute)
+
+
+def create_rows(count):
+    """Create a project with `count` tickets, comments and messages, each by its own agent."""
+    project = Project(name=f"Project {count}")
+    db.session.add(project)
+    db.session.flush()
+    conversation = Conversation(title="Chat", project_id=project.id)
+    db.session.add(conversation)
+
+    agents = [Agent(name=f"Agent {count}-{i}", role=AgentRole.DEVELOPER) for i in range(count)]
+    db.session.add_all(agents)
+    db.session.flush()
+
+    tickets = [Ticket(title=f"Ticket {i}", project_id=project.id, assigned_agent_id=agent.id)
+               for i, agent in enumerate(agents)]
+    db.session.add_all(tickets)
+    db.session.flush()
+
+    db.session.add_all([Comment(content=f"Comment {i}", ticket_id=tickets[0].id, agent_id=agent.id)
+                        for i, agent in enumerate(agents)])
+    db.session.add_all([Message(content=f"Message {i}", conversation_id=conversation.id, agent_id=agent.id)
+                        for i, agent in enumerate(agents)])
+    db.session.commit()
+    return project.id, tickets[0].id, conversation.id
+
+
+def serialize_all(project_id, ticket_id, conversation_id):
+    """Serialize freshly loaded rows, counting the queries serialization itself issues."""
+    db.session.expire_all()
+    tickets = Ticket.query.filter_by(project_id=project_id).all()
+    comments = Comment.query.filter_by(ticket_id=ticket_id).all()
+    messages = Message.query.filter_by(conversation_id=conversation_id).all()
+
+    counts = {}
+    for name, serialize, rows in (("tickets", serialize_tickets, tickets),
+                                  ("comments", serialize_comments, comments),
+                                  ("messages", serialize_messages, messages)):
+        with count_queries() as statements:
+            data = serialize(rows)
+        assert len(data) == len(rows)
+        counts[name] = len(statements)
+    return counts
+
+
+@pytest.mark.parametrize("serializer", ["tickets", "comments", "messages"])
+def test_query_count_does_not_grow_with_rows(app, serializer):
+    one = serialize_all(*create_rows(1))
+    many = serialize_all(*create_rows(50))
+
+    assert many[serializer] == one[serializer]
+    # One query resolves every agent
+    assert many[serializer] <= 1
+
+
+def test_serialized_agents_match_rows(app):
+    project_id, ticket_id, conversation_id = create_rows(3)
+
+    tickets = serialize_tickets(Ticket.query.filter_by(project_id=project_id).order_by(Ticket.id).all())
+    messages = serialize_messages(Message.query.filter_by(conversation_id=conversation_id).order_by(Message.id).all())
+
+    assert [ticket['assigned_to']['name'] for ticket in tickets] == ["Agent 3-0", "Agent 3-1", "Agent 3-2"]
+    assert [message['agent_name'] for message in messages] == ["Agent 3-0", "Agent 3-1", "Agent 3-2"]
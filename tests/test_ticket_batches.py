@@ -0,0 +1,39 @@
+import pytest
+
+from app import db
+from models import ActivityEvent, Agent, AgentRole, Project, Ticket, TicketStatus
+from agent_system.ticket_system import DUPLICATE_TICKET_ERROR, TicketBatchError, TicketManager
+
+
+@pytest.fixture
+def manager(app):
+    project = Project(name="Batches")
+    db.session.add(project)
+    db.session.commit()
+    return TicketManager(project.id)
+
+
+def test_status_batch_rejects_a_repeated_ticket(manager):
+    ticket_id = manager.create_tickets([{"title": "Once"}])[0]["id"]
+    events = ActivityEvent.query.count()
+
+    with pytest.raises(TicketBatchError) as error:
+        manager.update_ticket_statuses([{"ticket_id": ticket_id, "status": "in_progress"},
+                                        {"ticket_id": ticket_id, "status": "completed"}])
+
+    assert error.value.errors == [{"index": 1, "error": DUPLICATE_TICKET_ERROR}]
+    assert db.session.get(Ticket, ticket_id).status == TicketStatus.OPEN
+    assert ActivityEvent.query.count() == events
+
+
+def test_assignment_batch_rejects_a_repeated_ticket(manager):
+    ticket_id = manager.create_tickets([{"title": "Once"}])[0]["id"]
+    agent = Agent(name="Dev", role=AgentRole.DEVELOPER, model="llama3:8b")
+    db.session.add(agent)
+    db.session.commit()
+
+    with pytest.raises(TicketBatchError) as error:
+        manager.assign_tickets([{"ticket_id": ticket_id, "agent_id": agent.id},
+                                {"ticket_id": ticket_id, "agent_id": agent.id}])
+
+    assert error.value.errors == [{"index": 1, "error": DUPLICATE_TICKET_ERROR}]
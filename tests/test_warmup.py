@@ -0,0 +1,46 @@
+import pytest
+import requests
+
+from agent_system import warmup
+from agent_system.ollama_client import backend_pool
+from agent_system.warmup import ModelWarmer
+
+
+@pytest.fixture
+def warmer(monkeypatch):
+    """A warmer past its initial round, against hosts that list only llama3:8b."""
+    monkeypatch.setattr(warmup, "OLLAMA_WARMUP", True)
+    for backend in backend_pool.backends:
+        monkeypatch.setattr(backend, "models", {"llama3:8b"})
+        monkeypatch.setattr(backend.transport, "post_json", lambda path, payload, timeout=None: {})
+    warmer = ModelWarmer()
+    warmer._initial_done = True
+    return warmer
+
+
+def test_model_no_host_serves_does_not_hold_readiness(warmer):
+    assert warmer.warm("llama3:8b")
+    assert not warmer.warm("llama3:8b-vision")
+
+    readiness = warmer.readiness()
+    assert readiness["ready"]
+    assert readiness["models"]["llama3:8b-vision"]["status"] == "unavailable"
+
+
+def test_model_that_fails_to_load_holds_readiness(warmer, monkeypatch):
+    def post_json(path, payload, timeout=None):
+        raise requests.ConnectionError("model failed to load")
+    for backend in backend_pool.backends:
+        monkeypatch.setattr(backend.transport, "post_json", post_json)
+
+    assert not warmer.warm("llama3:8b")
+
+    readiness = warmer.readiness()
+    assert not readiness["ready"]
+    assert readiness["models"]["llama3:8b"]["status"] == "failed"
+
+
+def test_worker_with_no_model_loaded_is_not_ready(warmer):
+    warmer.warm("llama3:8b-vision")
+
+    assert not warmer.readiness()["ready"]